@@ -205,6 +205,20 @@ LOCALE_PATHS = (REPO_ROOT + '/conf/locale',)  # mitx/conf/locale/
 # Tracking
 TRACK_MAX_EVENT = 10000
 
+# Tracking events can be written in batches by a background thread, so that
+# requests don't wait on the tracking log (see track.pipeline).  When the
+# queue is full, 'drop' drops new events, and 'block' waits up to
+# block_timeout seconds for room first.  Off by default: turn it on per
+# environment, with a queue big enough that events aren't dropped.
+TRACKING_PIPELINE = {
+    'enabled': False,
+    'max_queue_size': 10000,
+    'batch_size': 100,
+    'flush_interval': 1.0,
+    'overflow': 'block',
+    'block_timeout': 0.1,
+}
+
 # Messages
 MESSAGE_STORAGE = 'django.contrib.messages.storage.session.SessionStorage'
 
@@ -90,6 +90,9 @@ DATABASES = {
 LMS_BASE = "localhost:8000"
 MITX_FEATURES['PREVIEW_LMS_BASE'] = "preview"
 
+# Write tracking events right away, so tests can look for them
+TRACKING_PIPELINE = dict(TRACKING_PIPELINE, enabled=False)
+
 CACHES = {
     # This is the cache used for most things. Askbot will not work without a
     # functioning cache -- it relies on caching to load its settings in places.
@@ -1,3 +1,5 @@
+import re
+
 from django.http import HttpResponse, HttpResponseNotModified
 
 from xmodule.contentstore.django import contentstore
@@ -6,6 +8,72 @@ from xmodule.modulestore import InvalidLocationError
 from cache_toolbox.core import get_cached_content, set_cached_content
 from xmodule.exceptions import NotFoundError
 
+# Content up to this size (in bytes) is cached along with its data.  Only the
+# metadata of larger content is cached, and its data is streamed from the
+# contentstore on every request.
+MAX_CACHED_CONTENT_SIZE = 512 * 1024
+
+BYTE_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class UnsatisfiableRange(Exception):
+    """
+    Raised when a Range header asks for bytes past the end of the content
+    """
+    pass
+
+
+def parse_range_header(header_value, content_length):
+    """
+    Returns the (first_byte, last_byte) range, inclusive, that the value of
+    a Range header asks for, or None if it isn't a single byte range (in
+    which case the whole content should be sent).
+
+    Raises UnsatisfiableRange if no part of the range is in the content.
+    """
+    match = BYTE_RANGE_RE.match(header_value.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+
+    if not first:
+        # a suffix range: the last `last` bytes
+        if not last:
+            return None
+        suffix_length = int(last)
+        if suffix_length == 0 or content_length == 0:
+            raise UnsatisfiableRange()
+        return max(content_length - suffix_length, 0), content_length - 1
+
+    first_byte = int(first)
+    last_byte = int(last) if last else content_length - 1
+    if last_byte < first_byte:
+        # syntactically invalid, so the header is ignored
+        return None
+    if first_byte >= content_length:
+        raise UnsatisfiableRange()
+    return first_byte, min(last_byte, content_length - 1)
+
+
+def content_length_of(content):
+    """
+    Returns the size of the data of content.  Content cached before sizes
+    were recorded only has its data to go by.
+    """
+    length = getattr(content, 'length', None)
+    if length is None and content.data is not None:
+        length = len(content.data)
+    return length
+
+
+def etag_of(content):
+    """
+    Returns the ETag of content, made from the md5 of its data, or None if
+    the contentstore didn't record one
+    """
+    digest = getattr(content, 'content_digest', None)
+    return '"{0}"'.format(digest) if digest else None
+
 
 class StaticContentServer(object):
     def process_request(self, request):
@@ -24,14 +92,22 @@ class StaticContentServer(object):
             if content is None:
                 # nope, not in cache, let's fetch from DB
                 try:
-                    content = contentstore().find(loc)
+                    content = contentstore().find(loc, as_stream=True)
                 except NotFoundError:
                     response = HttpResponse()
                     response.status_code = 404
                     return response
 
-                # since we fetched it from DB, let's cache it going forward
-                set_cached_content(content)
+                # since we fetched it from DB, let's cache it going forward.  Large
+                # content would blow past the cache's item size, so only keep what
+                # it takes to answer conditional requests for it.
+                if hasattr(content, 'copy_to_in_mem') and content.length <= MAX_CACHED_CONTENT_SIZE:
+                    content = content.copy_to_in_mem()
+                    set_cached_content(content)
+                elif content.data is None:
+                    set_cached_content(content.metadata_only())
+                else:
+                    set_cached_content(content)
             else:
                 # @todo: we probably want to have 'cache hit' counters so we can
                 # measure the efficacy of our caches
@@ -42,15 +118,59 @@ class StaticContentServer(object):
             # convert over the DB persistent last modified timestamp to a HTTP compatible
             # timestamp, so we can simply compare the strings
             last_modified_at_str = content.last_modified_at.strftime("%a, %d-%b-%Y %H:%M:%S GMT")
+            etag = etag_of(content)
 
             # see if the client has cached this content, if so then compare the
-            # timestamps, if they are the same then just return a 304 (Not Modified)
-            if 'HTTP_IF_MODIFIED_SINCE' in request.META:
+            # ETags, or else the timestamps, and if they are the same then just
+            # return a 304 (Not Modified)
+            if 'HTTP_IF_NONE_MATCH' in request.META:
+                if_none_match = [tag.strip() for tag in request.META['HTTP_IF_NONE_MATCH'].split(',')]
+                if etag is not None and (etag in if_none_match or '*' in if_none_match):
+                    response = HttpResponseNotModified()
+                    response['ETag'] = etag
+                    return response
+            elif 'HTTP_IF_MODIFIED_SINCE' in request.META:
                 if_modified_since = request.META['HTTP_IF_MODIFIED_SINCE']
                 if if_modified_since == last_modified_at_str:
                     return HttpResponseNotModified()
 
-            response = HttpResponse(content.data, content_type=content.content_type)
+            if content.data is None and not hasattr(content, 'stream_data'):
+                # only the metadata was cached, so fetch the data to stream it
+                try:
+                    content = contentstore().find(loc, as_stream=True)
+                except NotFoundError:
+                    response = HttpResponse()
+                    response.status_code = 404
+                    return response
+
+            length = content_length_of(content)
+            byte_range = None
+            if 'HTTP_RANGE' in request.META and length is not None:
+                try:
+                    byte_range = parse_range_header(request.META['HTTP_RANGE'], length)
+                except UnsatisfiableRange:
+                    response = HttpResponse(status=416)
+                    response['Content-Range'] = 'bytes */{0}'.format(length)
+                    return response
+
+            if byte_range is None:
+                body = content.data if content.data is not None else content.stream_data()
+                response = HttpResponse(body, content_type=content.content_type)
+            else:
+                first_byte, last_byte = byte_range
+                if content.data is not None:
+                    body = content.data[first_byte:last_byte + 1]
+                else:
+                    body = content.stream_data_in_range(first_byte, last_byte)
+                response = HttpResponse(body, content_type=content.content_type, status=206)
+                response['Content-Range'] = 'bytes {0}-{1}/{2}'.format(first_byte, last_byte, length)
+                length = last_byte - first_byte + 1
+
+            if length is not None:
+                response['Content-Length'] = str(length)
+            response['Accept-Ranges'] = 'bytes'
             response['Last-Modified'] = last_modified_at_str
+            if etag is not None:
+                response['ETag'] = etag
 
             return response
@@ -0,0 +1,144 @@
+"""
+Tests for StaticContentServer
+"""
+from datetime import datetime
+from StringIO import StringIO
+
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.client import RequestFactory
+from mock import patch, Mock
+
+from cache_toolbox.core import get_cached_content
+from xmodule.contentstore.content import StaticContent, StaticContentStream
+
+from .middleware import StaticContentServer, parse_range_header, UnsatisfiableRange
+
+PATH = '/c4x/edX/toy/asset/lecture.pdf'
+DATA = ''.join(chr(ord('a') + i % 26) for i in range(100))
+MD5 = 'c3fcd3d76192e4007dfb496cca67e13b'
+
+
+class FakeGridOut(object):
+    """
+    Stands in for a GridFS file, recording the reads made from it
+    """
+    def __init__(self, data):
+        self._file = StringIO(data)
+        self.reads = []
+
+    def seek(self, position):
+        self._file.seek(position)
+
+    def read(self, size=-1):
+        self.reads.append(size)
+        return self._file.read(size)
+
+
+class StaticContentServerTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.middleware = StaticContentServer()
+        self.factory = RequestFactory()
+        self.location = StaticContent.get_location_from_path(PATH)
+
+        self.streams = []
+        self.store = Mock()
+        self.store.find.side_effect = self.find
+        patcher = patch('contentserver.middleware.contentstore', return_value=self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def find(self, location, throw_on_not_found=True, as_stream=False):
+        """
+        Returns a stream over DATA, read 16 bytes at a time
+        """
+        stream = FakeGridOut(DATA)
+        self.streams.append(stream)
+        return StaticContentStream(location, 'lecture.pdf', 'application/pdf', stream,
+                                   datetime(2013, 6, 1, 12, 0, 0), length=len(DATA),
+                                   content_digest=MD5, chunk_size=16)
+
+    def get(self, **headers):
+        return self.middleware.process_request(self.factory.get(PATH, **headers))
+
+    @patch('contentserver.middleware.MAX_CACHED_CONTENT_SIZE', 10)
+    def test_large_content_is_streamed(self):
+        response = self.get()
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(DATA, response.content)
+        self.assertEqual(str(len(DATA)), response['Content-Length'])
+        self.assertEqual('"{0}"'.format(MD5), response['ETag'])
+        self.assertEqual('bytes', response['Accept-Ranges'])
+        # read a chunk at a time, never the whole file
+        self.assertTrue(all(0 < size <= 16 for size in self.streams[0].reads))
+
+    @patch('contentserver.middleware.MAX_CACHED_CONTENT_SIZE', 10)
+    def test_large_content_caches_metadata_only(self):
+        self.get()
+        cached = get_cached_content(self.location)
+        self.assertIsNone(cached.data)
+        self.assertEqual(len(DATA), cached.length)
+
+        # the data is fetched again, but conditional requests are answered from the cache
+        self.assertEqual(DATA, self.get().content)
+        self.assertEqual(2, self.store.find.call_count)
+        self.assertEqual(304, self.get(HTTP_IF_NONE_MATCH='"{0}"'.format(MD5)).status_code)
+        self.assertEqual(2, self.store.find.call_count)
+
+    def test_small_content_is_cached_whole(self):
+        self.assertEqual(DATA, self.get().content)
+        self.assertEqual(DATA, get_cached_content(self.location).data)
+        self.assertEqual(DATA[10:20], self.get(HTTP_RANGE='bytes=10-19').content)
+        self.assertEqual(1, self.store.find.call_count)
+
+    @patch('contentserver.middleware.MAX_CACHED_CONTENT_SIZE', 10)
+    def test_range(self):
+        response = self.get(HTTP_RANGE='bytes=10-39')
+        self.assertEqual(206, response.status_code)
+        self.assertEqual(DATA[10:40], response.content)
+        self.assertEqual('bytes 10-39/100', response['Content-Range'])
+        self.assertEqual('30', response['Content-Length'])
+        # reads stop at chunk boundaries
+        self.assertEqual([6, 16, 8], self.streams[-1].reads)
+
+    @patch('contentserver.middleware.MAX_CACHED_CONTENT_SIZE', 10)
+    def test_open_ended_and_suffix_ranges(self):
+        response = self.get(HTTP_RANGE='bytes=90-')
+        self.assertEqual(DATA[90:], response.content)
+        self.assertEqual('bytes 90-99/100', response['Content-Range'])
+
+        response = self.get(HTTP_RANGE='bytes=-5')
+        self.assertEqual(DATA[-5:], response.content)
+        self.assertEqual('bytes 95-99/100', response['Content-Range'])
+
+    def test_unsatisfiable_range(self):
+        response = self.get(HTTP_RANGE='bytes=100-200')
+        self.assertEqual(416, response.status_code)
+        self.assertEqual('bytes */100', response['Content-Range'])
+
+    def test_not_modified(self):
+        self.get()
+        self.assertEqual(304, self.get(HTTP_IF_NONE_MATCH='"{0}"'.format(MD5)).status_code)
+        self.assertEqual(200, self.get(HTTP_IF_NONE_MATCH='"something-else"').status_code)
+        self.assertEqual(304, self.get(HTTP_IF_MODIFIED_SINCE='Sat, 01-Jun-2013 12:00:00 GMT').status_code)
+
+
+class ParseRangeHeaderTest(TestCase):
+
+    def test_ranges(self):
+        self.assertEqual((0, 9), parse_range_header('bytes=0-9', 100))
+        self.assertEqual((50, 99), parse_range_header('bytes=50-', 100))
+        self.assertEqual((50, 99), parse_range_header('bytes=50-1000', 100))
+        self.assertEqual((90, 99), parse_range_header('bytes=-10', 100))
+        self.assertEqual((0, 99), parse_range_header('bytes=-1000', 100))
+
+    def test_ignored(self):
+        for header in ('bytes=9-0', 'bytes=0-1,5-6', 'items=0-9', 'bytes=-'):
+            self.assertIsNone(parse_range_header(header, 100))
+
+    def test_unsatisfiable(self):
+        for header in ('bytes=100-', 'bytes=-0'):
+            with self.assertRaises(UnsatisfiableRange):
+                parse_range_header(header, 100)
@@ -2,6 +2,7 @@ import threading
 
 _request_cache_threadlocal = threading.local()
 _request_cache_threadlocal.data = {}
+_request_cache_threadlocal.in_request = False
 
 class RequestCache(object):
     @classmethod
@@ -11,10 +12,20 @@ class RequestCache(object):
     def clear_request_cache(self):
         _request_cache_threadlocal.data = {}
 
+    @classmethod
+    def in_request(cls):
+        """
+        True while this thread is handling a request, so that what's cached
+        will be cleared when it's done
+        """
+        return getattr(_request_cache_threadlocal, 'in_request', False)
+
     def process_request(self, request):
         self.clear_request_cache()
+        _request_cache_threadlocal.in_request = True
         return None
 
     def process_response(self, request, response):
         self.clear_request_cache()
+        _request_cache_threadlocal.in_request = False
         return response
\ No newline at end of file
@@ -84,5 +84,6 @@ def clear_courses():
     # from the bash shell to drop it:
     # $ mongo test_xmodule --eval "db.dropDatabase()"
     modulestore().collection.drop()
+    modulestore().structure_collection.drop()
     update_templates(modulestore('direct'))
     contentstore().fs_files.drop()
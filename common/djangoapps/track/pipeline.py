@@ -0,0 +1,186 @@
+"""
+An in-process pipeline for tracking events.
+
+log_event used to encode and write every event (and save it to the
+TrackingLog table, if that's on) on the request thread.  With the pipeline
+on, events are put on a bounded queue instead, and a background thread
+writes them in batches: each batch goes out to the tracking log, and to the
+TrackingLog table in one bulk_create.  Events are written in the order they
+were logged.
+
+When the queue is full, the overflow policy decides what happens: 'drop'
+drops the new event, and 'block' makes the request wait for room, up to
+block_timeout seconds, before dropping it.  A batch that can't be written
+is retried one event at a time.  Queue depth and dropped or failed events
+are counted in statsd.
+
+The queue is flushed when the process exits, and the pipeline is started
+again in processes forked after it was started.
+"""
+
+import atexit
+import logging
+import os
+import Queue
+import threading
+import time
+
+from statsd import statsd
+
+log = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ('drop', 'block')
+
+_CONFIG = None
+_PIPELINE = None
+_PIPELINE_LOCK = threading.Lock()
+
+
+class EventPipeline(object):
+    """
+    A bounded queue of events, written out in batches by `write_batch` on a
+    background thread
+    """
+    def __init__(self, write_batch, max_queue_size=10000, batch_size=100, flush_interval=1.0,
+                 overflow='drop', block_timeout=0.1):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("Unknown overflow policy {0!r}".format(overflow))
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+
+        self.dropped = 0
+        self.pid = os.getpid()
+        self._queue = Queue.Queue(max_queue_size)
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='tracking-event-pipeline')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, event):
+        """
+        Queue event to be written.  Returns False if it was dropped.
+        """
+        try:
+            if self.overflow == 'block':
+                self._queue.put(event, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(event)
+        except Queue.Full:
+            self.dropped += 1
+            statsd.increment('track.pipeline.dropped')
+            return False
+        return True
+
+    def qsize(self):
+        """
+        The number of events waiting to be written
+        """
+        return self._queue.qsize()
+
+    def _next_batch(self):
+        """
+        Wait for events, returning up to batch_size of them once there are
+        that many, or flush_interval seconds have passed since the first one
+        """
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            if deadline is None:
+                timeout = self.flush_interval
+            else:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except Queue.Empty:
+                if batch or self._stopping.is_set():
+                    break
+                continue
+            if deadline is None:
+                deadline = time.time() + self.flush_interval
+        return batch
+
+    def _write(self, batch):
+        """
+        Write a batch, never letting an error stop the pipeline.  If the batch
+        can't be written, its events are written one at a time, so only the
+        ones that fail are lost.
+        """
+        statsd.gauge('track.pipeline.queue_depth', self._queue.qsize())
+        try:
+            self.write_batch(batch)
+        except Exception:
+            log.exception("Failed to write %d tracking events", len(batch))
+            if len(batch) > 1:
+                for event in batch:
+                    self._write_one(event)
+
+    def _write_one(self, event):
+        """
+        Write a single event, counting it in statsd if it's lost
+        """
+        try:
+            self.write_batch([event])
+        except Exception:
+            statsd.increment('track.pipeline.failed')
+            log.exception("Failed to write a tracking event")
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+
+    def stop(self, timeout=10):
+        """
+        Write out every queued event and stop the background thread, waiting
+        at most timeout seconds for it
+        """
+        self._stopping.set()
+        self._thread.join(timeout)
+
+
+def configure_pipeline(write_batch, enabled=False, **options):
+    """
+    Turn the pipeline on (or off, if not enabled), writing batches with
+    write_batch.  options are passed on to EventPipeline, which is started on
+    first use in each process.
+    """
+    global _CONFIG, _PIPELINE
+    with _PIPELINE_LOCK:
+        if _PIPELINE is not None and _PIPELINE.pid == os.getpid():
+            _PIPELINE.stop()
+        _PIPELINE = None
+        _CONFIG = (write_batch, options) if enabled else None
+
+
+def get_pipeline():
+    """
+    Returns the pipeline of this process, or None if the pipeline is off
+    """
+    global _PIPELINE
+    pipeline = _PIPELINE
+    if pipeline is not None and pipeline.pid == os.getpid():
+        return pipeline
+
+    with _PIPELINE_LOCK:
+        if _CONFIG is None:
+            return None
+        # the pipeline hasn't been started in this process yet (or was started
+        # before a fork, and its thread didn't come along)
+        if _PIPELINE is None or _PIPELINE.pid != os.getpid():
+            write_batch, options = _CONFIG
+            _PIPELINE = EventPipeline(write_batch, **options)
+        return _PIPELINE
+
+
+def _flush_on_exit():
+    pipeline = _PIPELINE
+    if pipeline is not None and pipeline.pid == os.getpid():
+        pipeline.stop()
+
+atexit.register(_flush_on_exit)
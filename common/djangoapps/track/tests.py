@@ -1,16 +1,118 @@
 """
-This file demonstrates writing tests using the unittest module. These will pass
-when you run "manage.py test".
-
-Replace this with more appropriate tests for your application.
+Tests for the tracking event pipeline
 """
+import threading
 
+from django.conf import settings
 from django.test import TestCase
+from mock import patch
+
+from track.models import TrackingLog
+from track.pipeline import EventPipeline
+from track.views import write_events
+
+
+class EventPipelineTest(TestCase):
+
+    def setUp(self):
+        self.batches = []
+        self.written = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def write_batch(self, batch):
+        self.release.wait(5)
+        self.batches.append(list(batch))
+        self.written.set()
+
+    def written_events(self):
+        return [event for batch in self.batches for event in batch]
+
+    def test_events_are_written_in_order(self):
+        pipeline = EventPipeline(self.write_batch, batch_size=7, flush_interval=0.01)
+        for i in range(50):
+            self.assertTrue(pipeline.put({'n': i}))
+        pipeline.stop()
+
+        self.assertEqual([{'n': i} for i in range(50)], self.written_events())
+        self.assertTrue(all(len(batch) <= 7 for batch in self.batches))
+
+    def test_partial_batch_is_written_after_flush_interval(self):
+        pipeline = EventPipeline(self.write_batch, batch_size=100, flush_interval=0.01)
+        pipeline.put({'n': 1})
+        self.assertTrue(self.written.wait(5))
+        self.assertEqual([[{'n': 1}]], self.batches)
+        pipeline.stop()
+
+    def test_full_queue_drops_events(self):
+        self.release.clear()
+        pipeline = EventPipeline(self.write_batch, max_queue_size=2, batch_size=1, flush_interval=0.01)
+        # the first event is taken off the queue and held up in write_batch
+        pipeline.put({'n': 0})
+        while pipeline.qsize():
+            pass
+        results = [pipeline.put({'n': i}) for i in range(1, 5)]
+        self.assertEqual([True, True, False, False], results)
+        self.assertEqual(2, pipeline.dropped)
+
+        self.release.set()
+        pipeline.stop()
+        self.assertEqual([{'n': i} for i in range(3)], self.written_events())
+
+    def test_full_queue_blocks_then_drops(self):
+        self.release.clear()
+        pipeline = EventPipeline(self.write_batch, max_queue_size=1, batch_size=1, flush_interval=0.01,
+                                 overflow='block', block_timeout=0.01)
+        pipeline.put({'n': 0})
+        while pipeline.qsize():
+            pass
+        self.assertTrue(pipeline.put({'n': 1}))
+        self.assertFalse(pipeline.put({'n': 2}))
+        self.assertEqual(1, pipeline.dropped)
+        self.release.set()
+        pipeline.stop()
+
+    def test_write_errors_dont_stop_the_pipeline(self):
+        def write_batch(batch):
+            if batch[0]['n'] == 0:
+                raise Exception("can't write")
+            self.write_batch(batch)
+
+        pipeline = EventPipeline(write_batch, batch_size=1, flush_interval=0.01)
+        pipeline.put({'n': 0})
+        pipeline.put({'n': 1})
+        pipeline.stop()
+        self.assertEqual([{'n': 1}], self.written_events())
+
+    def test_failed_batch_is_written_one_event_at_a_time(self):
+        def write_batch(batch):
+            if {'n': 2} in batch:
+                raise Exception("can't write")
+            self.write_batch(batch)
+
+        pipeline = EventPipeline(write_batch, batch_size=5, flush_interval=0.01)
+        for i in range(5):
+            pipeline.put({'n': i})
+        pipeline.stop()
+        self.assertEqual([{'n': i} for i in (0, 1, 3, 4)], self.written_events())
+
+    def test_unknown_overflow_policy(self):
+        with self.assertRaises(ValueError):
+            EventPipeline(self.write_batch, overflow='spill')
+
+
+class WriteEventsTest(TestCase):
 
+    def event(self, username):
+        return {
+            'username': username, 'session': '', 'ip': '127.0.0.1', 'event_source': 'server',
+            'event_type': 'test', 'event': '{}', 'agent': '', 'page': None,
+            'time': '2013-06-01T12:00:00+00:00', 'host': 'testserver',
+        }
 
-class SimpleTest(TestCase):
-    def test_basic_addition(self):
-        """
-        Tests that 1 + 1 always equals 2.
-        """
-        self.assertEqual(1 + 1, 2)
+    @patch.dict(settings.MITX_FEATURES, {'ENABLE_SQL_TRACKING_LOGS': True})
+    def test_failed_bulk_insert_saves_events_one_at_a_time(self):
+        with patch.object(TrackingLog.objects, 'bulk_create', side_effect=Exception("can't insert")):
+            write_events([self.event('first'), self.event('second')])
+        self.assertEqual(['first', 'second'],
+                         sorted(TrackingLog.objects.values_list('username', flat=True)))
@@ -8,10 +8,12 @@ from django.contrib.auth.decorators import login_required
 from django.http import HttpResponse
 from django.shortcuts import redirect
 from django.conf import settings
+from django.db import connection
 from mitxmako.shortcuts import render_to_response
 
 from django_future.csrf import ensure_csrf_cookie
 from track.models import TrackingLog
+from track.pipeline import configure_pipeline, get_pipeline
 from pytz import UTC
 
 log = logging.getLogger("tracking")
@@ -19,17 +21,61 @@ log = logging.getLogger("tracking")
 LOGFIELDS = ['username', 'ip', 'event_source', 'event_type', 'event', 'agent', 'page', 'time', 'host']
 
 
-def log_event(event):
-    """Write tracking event to log file, and optionally to TrackingLog model."""
-    event_str = json.dumps(event)
-    log.info(event_str[:settings.TRACK_MAX_EVENT])
+def write_events(events):
+    """
+    Write tracking events to the log file, and optionally to the TrackingLog
+    model, saving all the TrackingLog rows in one query.
+    """
+    for event in events:
+        event_str = json.dumps(event)
+        log.info(event_str[:settings.TRACK_MAX_EVENT])
     if settings.MITX_FEATURES.get('ENABLE_SQL_TRACKING_LOGS'):
-        event['time'] = dateutil.parser.parse(event['time'])
-        tldat = TrackingLog(**dict((x, event[x]) for x in LOGFIELDS))
+        records = []
+        for event in events:
+            fields = dict((x, event[x]) for x in LOGFIELDS)
+            fields['time'] = dateutil.parser.parse(fields['time'])
+            records.append(TrackingLog(**fields))
         try:
-            tldat.save()
+            TrackingLog.objects.bulk_create(records)
         except Exception as err:
             log.exception(err)
+            if len(records) > 1:
+                # save the events one at a time, so one bad event doesn't
+                # lose the rest of them
+                for record in records:
+                    try:
+                        record.save()
+                    except Exception as err:
+                        log.exception(err)
+
+
+def _write_batch(events):
+    """
+    Write a batch of events from the tracking pipeline's thread, which has a
+    database connection of its own
+    """
+    try:
+        write_events(events)
+    finally:
+        if settings.MITX_FEATURES.get('ENABLE_SQL_TRACKING_LOGS'):
+            connection.close()
+
+
+configure_pipeline(_write_batch, **getattr(settings, 'TRACKING_PIPELINE', {}))
+
+
+def log_event(event):
+    """
+    Write tracking event to log file, and optionally to TrackingLog model.
+
+    If the tracking pipeline is on, the event is queued to be written by
+    its background thread instead.
+    """
+    pipeline = get_pipeline()
+    if pipeline is None:
+        write_events([event])
+    else:
+        pipeline.put(event)
 
 
 def user_track(request):
@@ -103,6 +149,19 @@ def task_track(request_info, task_info, event_type, event, page=None):
     """
     Logs tracking information for events occuring within celery tasks.
 
+    Arguments are as for task_event(), which builds the event logged.
+    """
+    # celery workers can exit without flushing a pipeline, so these are
+    # written right away
+    write_events([task_event(request_info, task_info, event_type, event, page)])
+
+
+def task_event(request_info, task_info, event_type, event, page=None):
+    """
+    Returns the tracking event for an event occuring within a celery task,
+    for writing with write_events().  Tasks that log many events at once can
+    write them together.
+
     The `event_type` is a string naming the particular event being logged,
     while `event` is a dict containing whatever additional contextual information
     is desired.
@@ -137,8 +196,7 @@ def task_track(request_info, task_info, event_type, event, page=None):
         "time": datetime.datetime.utcnow().isoformat(),
         "host": request_info.get('host', 'unknown')
         }
-
-    log_event(event)
+    return event
 
 
 @login_required
@@ -8,6 +8,8 @@ import copy
 import math
 import operator
 import re
+import threading
+from collections import OrderedDict
 
 import numpy
 import scipy.constants
@@ -168,9 +170,14 @@ def parallel(parse_result):
     Return NaN if there is a zero among the inputs
     """
     # convert from pyparsing.ParseResults, which doesn't support '0 in parse_result'
-    parse_result = parse_result.asList()
+    parse_result = list(parse_result)
     if len(parse_result) == 1:
         return parse_result[0]
+    if any(isinstance(e, numpy.ndarray) for e in parse_result):
+        # NaN wherever one of the inputs is zero
+        has_zero = reduce(numpy.logical_or, [numpy.equal(e, 0) for e in parse_result])
+        reciprocals = [numpy.divide(1., e) for e in parse_result]
+        return numpy.where(has_zero, float('nan'), numpy.divide(1., sum(reciprocals)))
     if 0 in parse_result:
         return float('nan')
     reciprocals = [1. / e for e in parse_result]
@@ -215,33 +222,102 @@ def prod_parse_action(parse_result):
     return prod
 
 
-def evaluator(variables, functions, string, cs=False):
+# How many compiled grammars and expressions to keep.  The grammar depends
+# only on the names of the variables and functions, so there are few of them.
+MAX_GRAMMARS = 100
+MAX_EXPRESSIONS = 1000
+
+
+class LRUCache(object):
     """
-    Evaluate an expression. Variables are passed as a dictionary
-    from string to value. Unary functions are passed as a dictionary
-    from string to function. Variables must be floats.
-    cs: Case sensitive
+    A small thread-safe least-recently-used cache
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the value stored for key, or None
+        """
+        with self._lock:
+            value = self._items.pop(key, None)
+            if value is not None:
+                self._items[key] = value
+            return value
+
+    def set(self, key, value):
+        """
+        Store value for key, evicting the least recently used items if the
+        cache is full
+        """
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        """
+        Drop every item
+        """
+        with self._lock:
+            self._items.clear()
+
+
+grammar_cache = LRUCache(MAX_GRAMMARS)
+expression_cache = LRUCache(MAX_EXPRESSIONS)
+
+
+def operation_node(action, operands):
+    """
+    Returns a compiled node that applies a parse action to its operands.
 
+    Operands are numbers, operator strings, or other compiled nodes, which
+    are evaluated first.
     """
+    def evaluate(all_variables, all_functions):
+        return action([
+            operand(all_variables, all_functions) if callable(operand) else operand
+            for operand in operands
+        ])
+    return evaluate
 
-    all_variables = copy.copy(DEFAULT_VARIABLES)
-    all_functions = copy.copy(DEFAULT_FUNCTIONS)
-    all_variables.update(variables)
-    all_functions.update(functions)
 
-    if not cs:
-        string_cs = string.lower()
-        all_functions = lower_dict(all_functions)
-        all_variables = lower_dict(all_variables)
-        CasedLiteral = CaselessLiteral
-    else:
-        string_cs = string
-        CasedLiteral = Literal
+def variable_node(name):
+    """
+    Returns a compiled node that looks up a variable
+    """
+    return lambda all_variables, all_functions: all_variables[name]
 
-    check_variables(string_cs, set(all_variables.keys() + all_functions.keys()))
 
-    if string.strip() == "":
-        return float('nan')
+def function_node(name, argument):
+    """
+    Returns a compiled node that applies a function to its (compiled) argument
+    """
+    def evaluate(all_variables, all_functions):
+        if callable(argument):
+            return all_functions[name](argument(all_variables, all_functions))
+        return all_functions[name](argument)
+    return evaluate
+
+
+def get_grammar(variable_names, function_names, cs):
+    """
+    Returns the pyparsing grammar for expressions over the given variable and
+    function names.  Parsing with it gives a compiled expression: a number,
+    or a node to be called with the variables and functions to evaluate it.
+    """
+    key = (variable_names, function_names, cs)
+    grammar = grammar_cache.get(key)
+    if grammar is not None:
+        return grammar
+
+    if cs:
+        CasedLiteral = Literal
+    else:
+        CasedLiteral = CaselessLiteral
 
     # SI suffixes and percent
     number_suffix = MatchFirst([Literal(k) for k in SUFFIXES.keys()])
@@ -268,10 +344,10 @@ def evaluator(variables, functions, string, cs=False):
     #  E.g. if we have {'R':0.5}, we make the substitution.
     # We sort the list so that var names (like "e2") match before
     # mathematical constants (like "e"). This is kind of a hack.
-    all_variables_keys = sorted(all_variables.keys(), key=len, reverse=True)
+    all_variables_keys = sorted(variable_names, key=len, reverse=True)
     varnames = MatchFirst([CasedLiteral(k) for k in all_variables_keys])
     varnames.setParseAction(
-        lambda x: [all_variables[k] for k in x]
+        lambda x: [variable_node(k) for k in x]
     )
 
     # if all_variables were empty, then pyparsing wants
@@ -279,23 +355,103 @@ def evaluator(variables, functions, string, cs=False):
     # this is not the case, as all_variables contains the defaults
 
     # Same thing for functions.
-    all_functions_keys = sorted(all_functions.keys(), key=len, reverse=True)
+    all_functions_keys = sorted(function_names, key=len, reverse=True)
     funcnames = MatchFirst([CasedLiteral(k) for k in all_functions_keys])
     function = funcnames + Suppress("(") + expr + Suppress(")")
     function.setParseAction(
-        lambda x: [all_functions[x[0]](x[1])]
+        lambda x: [function_node(x[0], x[1])]
     )
 
     atom = number | function | varnames | Suppress("(") + expr + Suppress(")")
 
+    def compiled(action):
+        """
+        Make a parse action that builds a node applying `action` later,
+        instead of applying it now
+        """
+        def parse_action(parse_result):
+            operands = parse_result.asList()
+            if not any(callable(operand) for operand in operands):
+                # only numbers: apply it now, as the grammar always did
+                return [action(operands)]
+            if len(operands) == 1 and action is not sum_parse_action:
+                # nothing to apply, e.g. a power with no exponent.  (Sums
+                # are kept, since they turn their result into a float.)
+                return operands
+            return [operation_node(action, operands)]
+        return parse_action
+
     # Do the following in the correct order to preserve order of operation
     pow_term = atom + ZeroOrMore(Suppress("^") + atom)
-    pow_term.setParseAction(exp_parse_action)  # 7^6
+    pow_term.setParseAction(compiled(exp_parse_action))  # 7^6
     par_term = pow_term + ZeroOrMore(Suppress('||') + pow_term)  # 5k || 4k
-    par_term.setParseAction(parallel)
+    par_term.setParseAction(compiled(parallel))
     prod_term = par_term + ZeroOrMore(times_div + par_term)  # 7 * 5 / 4 - 3
-    prod_term.setParseAction(prod_parse_action)
+    prod_term.setParseAction(compiled(prod_parse_action))
     sum_term = Optional(plus_minus) + prod_term + ZeroOrMore(plus_minus + prod_term)  # -5 + 4 - 3
-    sum_term.setParseAction(sum_parse_action)
+    sum_term.setParseAction(compiled(sum_parse_action))
     expr << sum_term  # finish the recursion
-    return (expr + stringEnd).parseString(string)[0]
+
+    grammar = expr + stringEnd
+    grammar_cache.set(key, grammar)
+    return grammar
+
+
+def compile_expression(string, variable_names, function_names, cs=False):
+    """
+    Parse an expression once, returning a function of (all_variables,
+    all_functions) that evaluates it.  The names are those of all the
+    variables and functions that may be used (defaults included), and should
+    already be lowercased unless cs is set.
+
+    Compiled expressions are cached, keyed by the string, the names and cs.
+    """
+    variable_names = frozenset(variable_names)
+    function_names = frozenset(function_names)
+    key = (string, variable_names, function_names, cs)
+    compiled = expression_cache.get(key)
+    if compiled is not None:
+        return compiled
+
+    if cs:
+        check_variables(string, variable_names | function_names)
+    else:
+        check_variables(string.lower(), variable_names | function_names)
+
+    grammar = get_grammar(variable_names, function_names, cs)
+    result = grammar.parseString(string)[0]
+    if callable(result):
+        compiled = result
+    else:
+        compiled = lambda all_variables, all_functions: result
+    expression_cache.set(key, compiled)
+    return compiled
+
+
+def evaluator(variables, functions, string, cs=False):
+    """
+    Evaluate an expression. Variables are passed as a dictionary
+    from string to value. Unary functions are passed as a dictionary
+    from string to function. Variables must be floats.
+    cs: Case sensitive
+
+    Variables may also be numpy arrays of the same shape, in which case the
+    expression is evaluated for all of their values at once.  Note that
+    arrays follow numpy's rules for errors, e.g. dividing by zero gives inf
+    where it raises an exception for floats.
+    """
+
+    all_variables = copy.copy(DEFAULT_VARIABLES)
+    all_functions = copy.copy(DEFAULT_FUNCTIONS)
+    all_variables.update(variables)
+    all_functions.update(functions)
+
+    if not cs:
+        all_functions = lower_dict(all_functions)
+        all_variables = lower_dict(all_variables)
+
+    if string.strip() == "":
+        return float('nan')
+
+    compiled = compile_expression(string, all_variables.keys(), all_functions.keys(), cs)
+    return compiled(all_variables, all_functions)
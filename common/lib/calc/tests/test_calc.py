@@ -474,3 +474,56 @@ class EvaluatorTest(unittest.TestCase):
                           {'r1': 5}, {}, "r1+r2")
         self.assertRaises(calc.UndefinedVariable, calc.evaluator,
                           variables, {}, "r1*r3", cs=True)
+
+
+class CompiledExpressionTest(unittest.TestCase):
+    """
+    Test that expressions are compiled once and can be evaluated over
+    numpy arrays of variable values
+    """
+
+    def setUp(self):
+        calc.expression_cache.clear()
+        calc.grammar_cache.clear()
+
+    def test_compiled_expression_is_cached(self):
+        self.assertEqual(calc.evaluator({'x': 2.0}, {}, '3*x'), 6.0)
+        compiled = calc.compile_expression('3*x', ['x'] + calc.DEFAULT_VARIABLES.keys(),
+                                           calc.DEFAULT_FUNCTIONS.keys())
+        self.assertIs(
+            compiled,
+            calc.compile_expression('3*x', ['x'] + calc.DEFAULT_VARIABLES.keys(),
+                                    calc.DEFAULT_FUNCTIONS.keys())
+        )
+        # Values aren't part of the compiled expression
+        self.assertEqual(calc.evaluator({'x': 5.0}, {}, '3*x'), 15.0)
+
+    def test_cache_key_includes_names_and_case(self):
+        self.assertEqual(calc.evaluator({'x': 2.0}, {}, 'x'), 2.0)
+        self.assertRaises(calc.UndefinedVariable, calc.evaluator, {'y': 2.0}, {}, 'x')
+
+        # 'T' is a default constant, distinct from 't' only when case sensitive
+        self.assertEqual(calc.evaluator({'t': 1.0}, {}, 'T'), 1.0)
+        self.assertAlmostEqual(calc.evaluator({'t': 1.0}, {}, 'T', cs=True), 298.15)
+
+    def test_si_suffixes_are_case_sensitive(self):
+        """
+        Case insensitivity applies to names, not to the suffixes of numbers
+        """
+        self.assertEqual(calc.evaluator({}, {}, '5M'), 5e6)
+        self.assertEqual(calc.evaluator({}, {}, '5m'), 5e-3)
+
+    def test_array_variables(self):
+        x_values = numpy.linspace(1, 2, 10)
+        y_values = numpy.linspace(-3, 3, 10)
+        variables = {'x': x_values, 'y': y_values}
+
+        results = calc.evaluator(variables, {}, 'x^2 + sin(y) - x||y')
+        for x_value, y_value, result in zip(x_values, y_values, results):
+            expected = calc.evaluator({'x': x_value, 'y': y_value}, {}, 'x^2 + sin(y) - x||y')
+            self.assertAlmostEqual(result, expected)
+
+    def test_array_parallel_with_zero(self):
+        results = calc.evaluator({'x': numpy.array([0.0, 1.0])}, {}, 'x||1')
+        self.assertTrue(numpy.isnan(results[0]))
+        self.assertEqual(results[1], 0.5)
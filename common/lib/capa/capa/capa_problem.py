@@ -27,6 +27,7 @@ import capa.inputtypes as inputtypes
 import capa.customrender as customrender
 from capa.util import contextualize_text, convert_files_to_filenames
 import capa.xqueue_interface as xqueue_interface
+from capa.problem_cache import grading_key, grading_results, grading_stats, problem_templates, problem_template_key
 
 # to be replaced with auto-registering
 import capa.responsetypes as responsetypes
@@ -107,20 +108,45 @@ class LoncapaProblem(object):
         problem_text = re.sub(r"endouttext\s*/", "/text", problem_text)
         self.problem_text = problem_text
 
-        # parse problem XML file into an element tree
-        self.tree = etree.XML(problem_text)
+        # The parsed xml, script context and responder answers are the same for
+        # every student with this seed, so they are built once and then copied.
+        # The copies are needed because responders modify both the tree and the context.
+        template_key = problem_template_key(problem_text, self.problem_id, self.seed, self.system)
+        template = problem_templates.get(template_key)
+        if template is not None:
+            self.tree = deepcopy(template['tree'])
+            self.context = deepcopy(template['context'])
+        else:
+            # parse problem XML file into an element tree
+            self.tree = etree.XML(problem_text)
+
+            # included files can change without the problem text changing, so
+            # problems with includes are never cached
+            if self.tree.find('.//include') is not None:
+                template_key = None
+
+            # handle any <include file="foo"> tags
+            self._process_includes()
 
-        # handle any <include file="foo"> tags
-        self._process_includes()
+            # construct script processor context (eg for customresponse problems)
+            self.context = self._extract_context(self.tree)
 
-        # construct script processor context (eg for customresponse problems)
-        self.context = self._extract_context(self.tree)
+            template = {'tree': deepcopy(self.tree),
+                        'context': deepcopy(self.context),
+                        'responder_answers': None}
 
         # Pre-parse the XML tree: modifies it to add ID's and perform some in-place
         # transformations.  This also creates the dict (self.responders) of Response
         # instances for each question in the problem. The dict has keys = xml subtree of
         # Response, values = Response instance
-        self._preprocess_problem(self.tree)
+        self._preprocess_problem(self.tree, template['responder_answers'])
+
+        if template['responder_answers'] is None:
+            template['responder_answers'] = dict((response.get('id'), answers)
+                                                 for response, answers in self.responder_answers.items())
+            if template_key is not None:
+                problem_templates.set(template_key, template)
+        self.template_key = template_key
 
         if not self.student_answers:  # True when student_answers is an empty dict
             self.set_initial_display()
@@ -326,12 +352,37 @@ class LoncapaProblem(object):
             if 'filesubmission' in responder.allowed_inputfields and student_answers is not None:
                 results = responder.evaluate_answers(student_answers, oldcmap)
             else:
-                results = responder.evaluate_answers(self.student_answers, oldcmap)
+                results = self._evaluate_answers(responder, oldcmap)
             newcmap.update(results)
 
         self.correct_map = newcmap
         return newcmap
 
+    def _evaluate_answers(self, responder, oldcmap):
+        """
+        Returns the CorrectMap that `responder` gives self.student_answers.
+
+        Within capa.problem_cache.memoized_grading(), the grades of deterministic
+        responses are kept, and reused for the same answers to the same problem
+        with the same seed.
+        """
+        stats = grading_stats()
+        key = grading_key(self.template_key, responder, self.student_answers) if stats is not None else None
+        if key is None:
+            return responder.evaluate_answers(self.student_answers, oldcmap)
+
+        cmap_dict = grading_results.get(key)
+        if cmap_dict is not None:
+            stats.hits += 1
+            results = CorrectMap()
+            results.set_dict(deepcopy(cmap_dict))
+            return results
+
+        results = responder.evaluate_answers(self.student_answers, oldcmap)
+        grading_results.set(key, deepcopy(results.get_dict()))
+        stats.misses += 1
+        return results
+
     def get_question_answers(self):
         """
         Returns a dict of answer_ids to answer values. If we cannot generate
@@ -607,7 +658,7 @@ class LoncapaProblem(object):
 
         return tree
 
-    def _preprocess_problem(self, tree):  # private
+    def _preprocess_problem(self, tree, cached_answers=None):  # private
         '''
         Assign IDs to all the responses
         Assign sub-IDs to all entries (textline, schematic, etc.)
@@ -616,7 +667,9 @@ class LoncapaProblem(object):
 
         Also create capa Response instances for each responsetype and save as self.responders
 
-        Obtain all responder answers and save as self.responder_answers dict (key = response)
+        Obtain all responder answers and save as self.responder_answers dict (key = response).
+        If `cached_answers` (a dict of response id -> answers) is given, the answers are taken
+        from it instead of being computed again.
         '''
         response_id = 1
         self.responders = {}
@@ -649,6 +702,9 @@ class LoncapaProblem(object):
         # eg with externalresponse)
         self.responder_answers = {}
         for response in self.responders.keys():
+            if cached_answers is not None and response.get('id') in cached_answers:
+                self.responder_answers[response] = cached_answers[response.get('id')]
+                continue
             try:
                 self.responder_answers[response] = self.responders[response].get_answers()
             except:
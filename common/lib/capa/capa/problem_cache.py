@@ -0,0 +1,147 @@
+"""
+Process-local caches of the student-independent parts of LoncapaProblems.
+
+Problems are rebuilt for every student on every request, but everything up
+to binding the student's state is the same for all students who get the same
+seed: the parsed xml (with includes resolved), the context produced by
+running the problem's scripts, and the answers the responders compute.  The
+template cache holds those, and LoncapaProblem works on copies of them.
+
+Grading is the same for every student who gives the same answers, too, for
+responses that grade deterministically.  Batch grading (such as rescoring a
+problem for every student) can opt in to reusing those grades, within
+memoized_grading().
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# How many problem templates to keep per process.  0 turns the cache off.
+PROBLEM_TEMPLATE_CACHE_SIZE = 1000
+
+# How many responses' grades to keep per process.  0 turns the cache off.
+GRADING_CACHE_SIZE = 10000
+
+
+class ProblemTemplateCache(object):
+    """
+    An LRU cache of problem templates (or any other values but None),
+    holding at most `max_size` of them.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        Returns the template stored for key, or None
+        """
+        with self._lock:
+            template = self._templates.pop(key, None)
+            if template is None:
+                self.misses += 1
+                return None
+            self._templates[key] = template
+            self.hits += 1
+            return template
+
+    def set(self, key, template):
+        """
+        Store template for key, evicting the least recently used templates
+        if the cache is full
+        """
+        if not self.max_size:
+            return
+        with self._lock:
+            self._templates.pop(key, None)
+            self._templates[key] = template
+            while len(self._templates) > self.max_size:
+                self._templates.popitem(last=False)
+
+    def clear(self):
+        """
+        Drop every template
+        """
+        with self._lock:
+            self._templates.clear()
+
+
+problem_templates = ProblemTemplateCache(PROBLEM_TEMPLATE_CACHE_SIZE)
+
+# CorrectMap dicts, keyed by grading_key()
+grading_results = ProblemTemplateCache(GRADING_CACHE_SIZE)
+
+
+class GradingStats(object):
+    """
+    Counts the grades reused from the grading cache (hits), and the grades
+    computed and stored in it (misses), within one memoized_grading() block.
+    """
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+
+_grading = threading.local()
+
+
+@contextmanager
+def memoized_grading():
+    """
+    Within this block, LoncapaProblems in this thread reuse the grades of
+    deterministic responses graded before with the same answers, rather
+    than grading them again.  Yields the GradingStats of the block.
+    """
+    outer_stats = getattr(_grading, 'stats', None)
+    _grading.stats = GradingStats()
+    try:
+        yield _grading.stats
+    finally:
+        _grading.stats = outer_stats
+
+
+def grading_stats():
+    """
+    Returns the GradingStats of the memoized_grading() block this thread is
+    in, or None outside of one
+    """
+    return getattr(_grading, 'stats', None)
+
+
+def problem_template_key(problem_text, problem_id, seed, system):
+    """
+    Returns the cache key of the template for a problem.
+
+    Besides the problem's xml and seed, the template depends on the problem id
+    (used for the ids of the responses and inputs), on the course files (used
+    for includes and the scripts' python path) and on whether scripts may run
+    outside the sandbox.
+    """
+    if isinstance(problem_text, unicode):
+        problem_text = problem_text.encode('utf-8')
+    return (
+        hashlib.sha1(problem_text).hexdigest(),
+        problem_id,
+        seed,
+        getattr(system.filestore, 'root_path', None),
+        system.can_execute_unsafe_code(),
+    )
+
+
+def grading_key(template_key, responder, student_answers):
+    """
+    Returns the key of the grade that `responder` gives `student_answers`,
+    in the problem with the given template key, or None if the grade
+    mustn't be reused.
+    """
+    if template_key is None or not responder.is_deterministic():
+        return None
+    answers = responder.canonical_answers(student_answers)
+    if answers is None:
+        return None
+    return (template_key, responder.id, answers)
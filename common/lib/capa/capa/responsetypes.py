@@ -114,11 +114,16 @@ class LoncapaResponse(object):
 
       - hint_tag             : xhtml tag identifying hint associated with this response inside
                                hintgroup
+
+      - deterministic        : (bool) whether get_score and get_hints depend on nothing but the
+                               problem and the student's answers, so that their grade can be
+                               reused for the same answers (see capa.problem_cache)
     """
     __metaclass__ = abc.ABCMeta  # abc = Abstract Base Class
 
     response_tag = None
     hint_tag = None
+    deterministic = False
 
     max_inputfields = None
     allowed_inputfields = []
@@ -236,6 +241,37 @@ class LoncapaResponse(object):
         # log.debug('new_cmap = %s' % new_cmap)
         return new_cmap
 
+    def is_deterministic(self):
+        '''
+        Whether evaluate_answers always gives the same CorrectMap for the same
+        student answers.  Hint functions are scripts, and are given the old
+        CorrectMap, so responses with one never are.
+        '''
+        if not self.deterministic:
+            return False
+        hintgroup = self.xml.find('hintgroup')
+        return hintgroup is None or not hintgroup.get('hintfn')
+
+    def canonical_answer(self, answer):
+        '''
+        Returns a form of the student's answer to one input that is graded
+        the same as the answer itself, and the same for all answers graded
+        the same way.  Overridden by responses that e.g. ignore order.
+        '''
+        return answer
+
+    def canonical_answers(self, student_answers):
+        '''
+        Returns a string standing for this response's part of student_answers,
+        for keying its grade, or None if the answers can't be represented.
+        '''
+        try:
+            answers = dict((answer_id, self.canonical_answer(student_answers[answer_id]))
+                           for answer_id in self.answer_ids if answer_id in student_answers)
+            return json.dumps(answers, sort_keys=True)
+        except (TypeError, ValueError):
+            return None
+
     def get_hints(self, student_answers, new_cmap, old_cmap):
         '''
         Generate adaptive hints for this problem based on student answers, the old CorrectMap,
@@ -653,6 +689,7 @@ class ChoiceResponse(LoncapaResponse):
     response_tag = 'choiceresponse'
     max_inputfields = 1
     allowed_inputfields = ['checkboxgroup', 'radiogroup']
+    deterministic = True
 
     def setup_response(self):
 
@@ -692,6 +729,12 @@ class ChoiceResponse(LoncapaResponse):
         else:
             return CorrectMap(self.answer_id, 'incorrect')
 
+    def canonical_answer(self, answer):
+        # graded as a set of choices
+        if not isinstance(answer, list):
+            answer = [answer]
+        return sorted(set(answer))
+
     def get_answers(self):
         return {self.answer_id: list(self.correct_choices)}
 
@@ -704,6 +747,7 @@ class MultipleChoiceResponse(LoncapaResponse):
     response_tag = 'multiplechoiceresponse'
     max_inputfields = 1
     allowed_inputfields = ['choicegroup']
+    deterministic = True
 
     def setup_response(self):
         # call secondary setup for MultipleChoice questions, to set name
@@ -778,6 +822,10 @@ class TrueFalseResponse(MultipleChoiceResponse):
 
         return CorrectMap(self.answer_id, 'incorrect')
 
+    def canonical_answer(self, answer):
+        # graded as a set of choices
+        return sorted(set(answer)) if isinstance(answer, list) else answer
+
 #-----------------------------------------------------------------------------
 
 
@@ -789,6 +837,7 @@ class OptionResponse(LoncapaResponse):
     response_tag = 'optionresponse'
     hint_tag = 'optionhint'
     allowed_inputfields = ['optioninput']
+    deterministic = True
 
     def setup_response(self):
         self.answer_fields = self.inputfields
@@ -824,6 +873,7 @@ class NumericalResponse(LoncapaResponse):
     allowed_inputfields = ['textline']
     required_attributes = ['answer']
     max_inputfields = 1
+    deterministic = True
 
     def setup_response(self):
         xml = self.xml
@@ -889,6 +939,7 @@ class StringResponse(LoncapaResponse):
     allowed_inputfields = ['textline']
     required_attributes = ['answer']
     max_inputfields = 1
+    deterministic = True
 
     def setup_response(self):
         self.correct_answer = contextualize_text(
@@ -900,6 +951,10 @@ class StringResponse(LoncapaResponse):
         correct = self.check_string(self.correct_answer, student_answer)
         return CorrectMap(self.answer_id, 'correct' if correct else 'incorrect')
 
+    def canonical_answer(self, answer):
+        # graded, and hinted, with surrounding whitespace stripped
+        return answer.strip() if isinstance(answer, basestring) else answer
+
     def check_string(self, expected, given):
         if self.xml.get('type') == 'ci':
             return given.lower() == expected.lower()
@@ -1732,15 +1787,18 @@ class FormulaResponse(LoncapaResponse):
                            samples.split('@')[1].split('#')[0].split(':')))
 
         ranges = dict(zip(variables, sranges))
-        for i in range(numsamples):
+        # TODO: allow specified ranges (i.e. integers and complex numbers) for random variables
+        sampled_values = [dict((str(var), random.uniform(*ranges[var])) for var in ranges)
+                          for i in range(numsamples)]
+
+        correctness = self.check_formula_vectorized(expected, given, sampled_values)
+        if correctness is not None:
+            return correctness
+
+        for sample in sampled_values:
             instructor_variables = self.strip_dict(dict(self.context))
-            student_variables = dict()
-            # ranges give numerical ranges for testing
-            for var in ranges:
-                # TODO: allow specified ranges (i.e. integers and complex numbers) for random variables
-                value = random.uniform(*ranges[var])
-                instructor_variables[str(var)] = value
-                student_variables[str(var)] = value
+            instructor_variables.update(sample)
+            student_variables = dict(sample)
             # log.debug('formula: instructor_vars=%s, expected=%s' %
             # (instructor_variables,expected))
             instructor_result = evaluator(instructor_variables, dict(),
@@ -1779,6 +1837,39 @@ class FormulaResponse(LoncapaResponse):
                 return "incorrect"
         return "correct"
 
+    def check_formula_vectorized(self, expected, given, sampled_values):
+        """
+        Check the formula at all the samples at once, by evaluating both
+        expressions over numpy arrays of the sampled values.
+
+        Returns "correct" or "incorrect", or None if the arrays didn't give
+        a clean answer (an error, or a value that isn't finite).  Since numpy
+        doesn't raise errors the way floats do, those cases have to be checked
+        one sample at a time to report the same result.
+        """
+        if not sampled_values:
+            return None
+
+        arrays = dict((var, numpy.array([sample[var] for sample in sampled_values]))
+                      for var in sampled_values[0])
+        instructor_variables = self.strip_dict(dict(self.context))
+        instructor_variables.update(arrays)
+        try:
+            instructor_results = evaluator(instructor_variables, dict(), expected, cs=self.case_sensitive)
+            student_results = evaluator(dict(arrays), dict(), given, cs=self.case_sensitive)
+            # expressions that don't use the variables give a single value
+            instructor_results = numpy.zeros(len(sampled_values)) + instructor_results
+            student_results = numpy.zeros(len(sampled_values)) + student_results
+            if not (numpy.all(numpy.isfinite(instructor_results)) and numpy.all(numpy.isfinite(student_results))):
+                return None
+        except Exception:
+            return None
+
+        for student_result, instructor_result in zip(student_results, instructor_results):
+            if not compare_with_tolerance(student_result, instructor_result, self.tolerance):
+                return "incorrect"
+        return "correct"
+
     def strip_dict(self, d):
         ''' Takes a dict. Returns an identical dict, with all non-word
         keys and all non-numeric values stripped out. All values also
@@ -0,0 +1,272 @@
+"""
+A pool of warm sandbox workers for capa.safe_exec.
+
+Running code with codejail.safe_exec starts a new sandboxed python for every
+execution, which then has to import numpy, scipy and friends again.  The
+workers in this pool are started once, through the same sandbox command that
+codejail is configured with, import those modules up front and then run each
+piece of code in a freshly forked child with codejail's limits applied (see
+pool_worker.py).  Workers are replaced after a number of executions, or once
+code run in them has used more than a memory limit.
+
+The pool is off unless configure_pool() is called with a size, and is only
+used when codejail is configured to sandbox python.
+"""
+
+import json
+import logging
+import os
+import os.path
+import Queue
+import select
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from codejail import jail_code
+from codejail.safe_exec import json_safe, SafeExecException
+from statsd import statsd
+
+log = logging.getLogger(__name__)
+
+# The worker script, read now so that it can be copied into each worker's directory
+worker_py_file = os.path.join(os.path.dirname(__file__), 'pool_worker.py')
+worker_py = open(worker_py_file).read()
+
+# How long to wait for a new worker to be ready, in seconds
+WORKER_START_TIMEOUT = 30
+
+# How much of a dead worker's stderr to report, in bytes
+WORKER_STDERR_LENGTH = 2000
+
+_POOL_OPTIONS = {}
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+class WorkerError(Exception):
+    """
+    Raised when a sandbox worker dies or stops answering
+    """
+    pass
+
+
+def make_sandbox_directory():
+    """
+    Make a temporary directory that the sandbox user can read, named the way
+    codejail names its directories so that the sandbox's AppArmor profile
+    allows access to it
+    """
+    directory = tempfile.mkdtemp(prefix="codejail-")
+    os.chmod(directory, 0755)
+    return directory
+
+
+class SandboxWorker(object):
+    """
+    A single long-running sandboxed python, running pool_worker.py
+    """
+    def __init__(self):
+        self.directory = make_sandbox_directory()
+        worker_path = os.path.join(self.directory, 'pool_worker.py')
+        with open(worker_path, 'w') as worker_file:
+            worker_file.write(worker_py)
+
+        # The worker's stderr goes to a file rather than a pipe, so that it can
+        # never block writing to it; it's read if the worker dies.
+        self.stderr = tempfile.TemporaryFile()
+        cmd = jail_code.COMMANDS['python']['cmdline_start'] + [worker_path]
+        self.process = subprocess.Popen(
+            cmd, cwd=self.directory, env={}, close_fds=True,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=self.stderr,
+        )
+        self.executions = 0
+        self.rss_kb = 0
+        self._read_message(WORKER_START_TIMEOUT)
+
+    def _read_message(self, timeout):
+        """
+        Read one JSON line from the worker, raising WorkerError if none comes
+        within timeout seconds
+        """
+        ready, _, _ = select.select([self.process.stdout], [], [], timeout)
+        if not ready:
+            raise WorkerError("Sandbox worker didn't answer within {0} seconds".format(timeout))
+        line = self.process.stdout.readline()
+        if not line:
+            self.stderr.seek(0)
+            raise WorkerError("Sandbox worker exited: {0}".format(self.stderr.read()[-WORKER_STDERR_LENGTH:]))
+        return json.loads(line)
+
+    def execute(self, code, globals_dict, python_path, limits):
+        """
+        Run code in the worker, returning (emsg, globals)
+        """
+        request = {
+            'code': code,
+            'globals': json_safe(globals_dict),
+            'python_path': python_path,
+            'limits': limits,
+        }
+        try:
+            self.process.stdin.write(json.dumps(request) + '\n')
+            self.process.stdin.flush()
+        except IOError as err:
+            raise WorkerError("Couldn't send code to sandbox worker: {0}".format(err))
+
+        # The worker kills the code after REALTIME seconds, so only wait for
+        # it a little longer than that
+        timeout = (limits.get('REALTIME') or limits.get('CPU') or 1) + 5
+        result = self._read_message(timeout)
+
+        self.executions += 1
+        self.rss_kb = result.get('rss_kb', 0)
+        return result['emsg'], result['globals']
+
+    def stop(self):
+        """
+        Stop the worker and clean up its directory
+        """
+        try:
+            # the worker exits once its stdin is closed
+            self.process.stdin.close()
+            if self.process.poll() is None:
+                self.process.terminate()
+        except (IOError, OSError):
+            pass
+        self.stderr.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class SandboxPool(object):
+    """
+    A fixed-size pool of SandboxWorkers for one process
+    """
+    def __init__(self, size, max_executions=100, max_rss_kb=256 * 1024):
+        self.size = size
+        self.max_executions = max_executions
+        self.max_rss_kb = max_rss_kb
+        self.pid = os.getpid()
+        self._idle = Queue.Queue()
+        self._lock = threading.Lock()
+        self._num_workers = 0
+        self._num_waiting = 0
+
+    def _start_worker(self):
+        """
+        Start a new worker and make it available
+        """
+        try:
+            worker = SandboxWorker()
+        except (WorkerError, OSError):
+            log.exception("Couldn't start sandbox worker")
+            with self._lock:
+                self._num_workers -= 1
+            return
+        self._idle.put(worker)
+
+    def _checkout(self):
+        """
+        Take an idle worker, starting one if the pool isn't full yet
+        """
+        with self._lock:
+            start_worker = self._idle.empty() and self._num_workers < self.size
+            if start_worker:
+                self._num_workers += 1
+            self._num_waiting += 1
+            statsd.gauge('capa.safe_exec.pool.queue_depth', self._num_waiting)
+
+        start = time.time()
+        try:
+            if start_worker:
+                self._start_worker()
+            return self._idle.get(timeout=WORKER_START_TIMEOUT)
+        except Queue.Empty:
+            raise SafeExecException("No sandbox worker became available")
+        finally:
+            with self._lock:
+                self._num_waiting -= 1
+            statsd.histogram('capa.safe_exec.pool.wait_time', (time.time() - start) * 1000)
+
+    def _checkin(self, worker, failed=False):
+        """
+        Return a worker to the pool, replacing it if it failed, has run
+        enough executions or has grown too large
+        """
+        if failed or worker.executions >= self.max_executions or worker.rss_kb > self.max_rss_kb:
+            statsd.increment('capa.safe_exec.pool.recycled')
+            worker.stop()
+            # start the replacement in the background so this request doesn't wait for it
+            threading.Thread(target=self._start_worker).start()
+        else:
+            self._idle.put(worker)
+
+    def safe_exec(self, code, globals_dict, python_path=None, slug=None):
+        """
+        Execute code as codejail.safe_exec.safe_exec does, but in a pooled worker
+        """
+        # like codejail, copy the python path into a directory the sandbox can read
+        path_directory = make_sandbox_directory()
+        try:
+            sandbox_path = []
+            for index, directory in enumerate(python_path or []):
+                copy = os.path.join(path_directory, "{0}_{1}".format(index, os.path.basename(directory)))
+                shutil.copytree(directory, copy)
+                sandbox_path.append(copy)
+
+            worker = self._checkout()
+            try:
+                emsg, cleaned_results = worker.execute(code, globals_dict, sandbox_path, dict(jail_code.LIMITS))
+            except WorkerError as err:
+                log.warning("Sandbox worker failed running %s: %s", slug, err)
+                self._checkin(worker, failed=True)
+                raise SafeExecException("Couldn't execute jailed code: {0}".format(err))
+            self._checkin(worker)
+        finally:
+            shutil.rmtree(path_directory, ignore_errors=True)
+
+        if emsg:
+            raise SafeExecException("Couldn't execute jailed code: {0}".format(emsg))
+        globals_dict.update(cleaned_results)
+
+    def stop(self):
+        """
+        Stop all the idle workers
+        """
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except Queue.Empty:
+                break
+
+
+def configure_pool(size=0, max_executions=100, max_rss_kb=256 * 1024):
+    """
+    Set up the sandbox pool.  A size of 0 turns it off.  Workers are only
+    started when code is first executed, in each process that executes code.
+    """
+    global _POOL
+    with _POOL_LOCK:
+        _POOL_OPTIONS.clear()
+        _POOL_OPTIONS.update(size=size, max_executions=max_executions, max_rss_kb=max_rss_kb)
+        if _POOL is not None:
+            _POOL.stop()
+            _POOL = None
+
+
+def get_pool():
+    """
+    Returns the sandbox pool of this process, or None if there shouldn't be
+    one: the pool is off, or codejail isn't configured to sandbox python
+    """
+    global _POOL
+    if not _POOL_OPTIONS.get('size') or not jail_code.is_configured('python'):
+        return None
+
+    with _POOL_LOCK:
+        # A pool created before a fork belongs to the parent process
+        if _POOL is None or _POOL.pid != os.getpid():
+            _POOL = SandboxPool(**_POOL_OPTIONS)
+        return _POOL
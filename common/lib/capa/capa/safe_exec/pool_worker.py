@@ -0,0 +1,180 @@
+"""
+A long-running sandbox worker for capa.safe_exec.pool.
+
+This file is run as a script by the sandboxed python, so it only uses the
+standard library.  It imports the modules that problem code usually needs,
+then reads one JSON request per line from stdin and answers each with one
+JSON line on stdout.
+
+Every request is executed in a freshly forked child, so code never sees the
+state left behind by earlier executions.  As with codejail, the child runs
+in a new empty directory with no stdin, may not write files, and applies the
+resource limits of the request before running any code.  It is killed if it
+runs longer than the real-time limit.
+
+A request is {"code": ..., "globals": ..., "python_path": [...], "limits": {...}},
+and the answer is {"globals": ..., "emsg": ..., "rss_kb": ...}, where emsg
+is None unless the code raised an exception, and rss_kb is the most memory
+any execution in this worker has used.
+"""
+
+import json
+import os
+import resource
+import select
+import shutil
+import signal
+import sys
+import tempfile
+import time
+import traceback
+
+PRELOAD_MODULES = [
+    'numpy', 'math', 'scipy', 'random',
+    'calc', 'eia', 'chem.chemcalc', 'chem.chemtools', 'chem.miller', 'verifiers.draganddrop',
+]
+
+
+def json_safe(d):
+    """
+    Return only the JSON-safe part of d: values that survive a round trip
+    through JSON, dropping modules, functions and the like
+    """
+    ok_types = (type(None), int, long, float, str, unicode, list, tuple, dict)
+    bad_keys = ("__builtins__",)
+    jd = {}
+    for k, v in d.iteritems():
+        if not isinstance(v, ok_types):
+            continue
+        if k in bad_keys:
+            continue
+        try:
+            # Python's JSON encoder will produce output that
+            # the JSON decoder cannot parse if the input string
+            # contains unicode "unpaired surrogates" (only on Linux)
+            # To test for this, we try decoding the output and check
+            # for a ValueError
+            json.loads(json.dumps(v))
+
+            # Also ensure that the keys encode/decode correctly
+            json.loads(json.dumps(k))
+        except (TypeError, ValueError):
+            continue
+        else:
+            jd[k] = v
+    return json.loads(json.dumps(jd))
+
+
+def set_limits(limits):
+    """
+    Apply the limits of a request to the current (child) process
+    """
+    cpu = limits.get('CPU')
+    if cpu:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu))
+    vmem = limits.get('VMEM')
+    if vmem:
+        resource.setrlimit(resource.RLIMIT_AS, (vmem, vmem))
+    # executed code may not start processes of its own, or write files
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (0, 0))
+    # so that writing a file raises an error rather than killing the child
+    signal.signal(signal.SIGXFSZ, signal.SIG_IGN)
+
+
+def run_child(request, result_fd, directory):
+    """
+    Execute the request in this (forked) process, in the empty `directory`,
+    and write the result to result_fd
+    """
+    # The code gets no input, and anything it prints must not end up in our
+    # protocol stream, or fill up the worker's stderr
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    os.close(devnull)
+
+    os.chdir(directory)
+    os.environ['TMPDIR'] = tempfile.tempdir = directory
+
+    set_limits(request.get('limits', {}))
+    sys.path.extend(request.get('python_path', []))
+
+    g_dict = request['globals']
+    try:
+        exec request['code'] in g_dict
+        result = {'globals': json_safe(g_dict), 'emsg': None}
+    except BaseException:
+        result = {'globals': {}, 'emsg': traceback.format_exc()}
+
+    with os.fdopen(result_fd, 'w') as result_file:
+        json.dump(result, result_file)
+
+
+def execute(request):
+    """
+    Execute a request in a forked child, returning its result
+    """
+    directory = tempfile.mkdtemp(prefix='codejail-')
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            run_child(request, write_fd, directory)
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    realtime = request.get('limits', {}).get('REALTIME') or None
+    deadline = time.time() + realtime if realtime else None
+
+    chunks = []
+    timed_out = False
+    while True:
+        timeout = max(deadline - time.time(), 0) if deadline else None
+        ready, _, _ = select.select([read_fd], [], [], timeout)
+        if not ready:
+            timed_out = True
+            os.kill(pid, signal.SIGKILL)
+            break
+        chunk = os.read(read_fd, 65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    os.close(read_fd)
+    _, status = os.waitpid(pid, 0)
+    shutil.rmtree(directory, ignore_errors=True)
+
+    if timed_out:
+        return {'globals': {}, 'emsg': 'Code took longer than {0} seconds to run'.format(realtime)}
+    try:
+        return json.loads(''.join(chunks))
+    except ValueError:
+        return {'globals': {}, 'emsg': 'Sandboxed code exited with status {0}'.format(status)}
+
+
+def main():
+    for name in PRELOAD_MODULES:
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+
+    # signal that we are ready to take requests
+    sys.stdout.write(json.dumps({'ready': True}) + '\n')
+    sys.stdout.flush()
+
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            break
+        result = execute(json.loads(line))
+        # The executions run in children, so the worker itself never grows
+        result['rss_kb'] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        sys.stdout.write(json.dumps(result) + '\n')
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,7 @@ import unittest
 from nose.plugins.skip import SkipTest
 
 from capa.safe_exec import safe_exec, update_hash
+from capa.safe_exec.pool import configure_pool, get_pool
 from codejail.safe_exec import SafeExecException
 from codejail.jail_code import is_configured
 
@@ -90,6 +91,53 @@ class TestSafeOrNot(unittest.TestCase):
         self.assertEqual(g['files'], os.listdir('/'))
 
 
+class TestPooledSafeExec(TestSafeExec):
+    """Run the safe_exec tests again, through a pool of sandbox workers."""
+
+    def setUp(self):
+        # The pool is only used when CodeJail is configured for python.
+        if not is_configured("python"):
+            raise SkipTest
+        configure_pool(size=1)
+
+    def tearDown(self):
+        configure_pool(size=0)
+
+    def test_workers_are_reused(self):
+        safe_exec("a = 1", {})
+        worker = get_pool()._idle.queue[0]
+        safe_exec("a = 2", {})
+        self.assertIs(get_pool()._idle.queue[0], worker)
+        self.assertEqual(worker.executions, 2)
+
+    def test_executions_dont_share_state(self):
+        safe_exec("import math; math.leftover = 1", {})
+        g = {}
+        safe_exec("import math; a = hasattr(math, 'leftover')", g)
+        self.assertFalse(g['a'])
+
+    def test_cant_do_something_forbidden(self):
+        g = {}
+        with self.assertRaises(SafeExecException) as cm:
+            safe_exec("import os; files = os.listdir('/')", g)
+        self.assertIn("OSError", cm.exception.message)
+
+    def test_executions_cant_leave_files(self):
+        with self.assertRaises(SafeExecException) as cm:
+            safe_exec("f = open('leftover.txt', 'w'); f.write('secret'); f.close()", {})
+        self.assertIn("IOError", cm.exception.message)
+        g = {}
+        safe_exec("import os; exists = os.path.exists('leftover.txt')", g)
+        self.assertFalse(g['exists'])
+
+    def test_stderr_doesnt_fill_up(self):
+        # more than a pipe's worth of output, in every execution
+        for _ in range(3):
+            g = {}
+            safe_exec("import sys; sys.stderr.write('x' * 100000); a = 1", g)
+            self.assertEqual(g['a'], 1)
+
+
 class DictCache(object):
     """A cache implementation over a simple dict, for testing."""
 
@@ -0,0 +1,131 @@
+"""
+Tests for reusing the grades of deterministic responses, within memoized_grading()
+"""
+import textwrap
+import unittest
+
+from capa.problem_cache import grading_results, memoized_grading
+from .response_xml_factory import ChoiceResponseXMLFactory, CustomResponseXMLFactory, StringResponseXMLFactory
+from . import new_loncapa_problem, test_responsetypes
+
+
+class MemoizedGradingMixin(object):
+    """
+    Runs each test of a ResponseTest twice within memoized_grading(): once
+    with an empty grading cache, and once more with every grade the first run
+    computed, which must all be reused, and must pass the same assertions.
+    """
+    def __init__(self, methodName='runTest'):
+        super(MemoizedGradingMixin, self).__init__(methodName)
+        test_method = getattr(self, methodName, None)
+        if test_method is None:
+            return
+
+        def run_twice():
+            grading_results.clear()
+            with memoized_grading() as first:
+                test_method()
+            with memoized_grading() as second:
+                test_method()
+            self.assertEqual(0, second.misses)
+            self.assertEqual(first.hits + first.misses, second.hits)
+
+        setattr(self, methodName, run_twice)
+
+
+class MemoizedMultiChoiceResponseTest(MemoizedGradingMixin, test_responsetypes.MultiChoiceResponseTest):
+    pass
+
+
+class MemoizedTrueFalseResponseTest(MemoizedGradingMixin, test_responsetypes.TrueFalseResponseTest):
+    pass
+
+
+class MemoizedOptionResponseTest(MemoizedGradingMixin, test_responsetypes.OptionResponseTest):
+    pass
+
+
+class MemoizedStringResponseTest(MemoizedGradingMixin, test_responsetypes.StringResponseTest):
+    pass
+
+
+class MemoizedChoiceResponseTest(MemoizedGradingMixin, test_responsetypes.ChoiceResponseTest):
+    pass
+
+
+class MemoizedNumericalResponseTest(MemoizedGradingMixin, test_responsetypes.NumericalResponseTest):
+    pass
+
+
+class GradingMemoTest(unittest.TestCase):
+
+    def setUp(self):
+        super(GradingMemoTest, self).setUp()
+        grading_results.clear()
+
+    def grade_twice(self, xml_str, answer):
+        """
+        Grades `answer` to two copies of the problem, within memoized_grading(),
+        and returns the grading stats along with the second CorrectMap
+        """
+        with memoized_grading() as stats:
+            new_loncapa_problem(xml_str).grade_answers({'1_2_1': answer})
+            correct_map = new_loncapa_problem(xml_str).grade_answers({'1_2_1': answer})
+        return stats, correct_map
+
+    def test_not_memoized_by_default(self):
+        xml_str = StringResponseXMLFactory().build_xml(answer="Michigan")
+        new_loncapa_problem(xml_str).grade_answers({'1_2_1': 'Michigan'})
+        with memoized_grading() as stats:
+            new_loncapa_problem(xml_str).grade_answers({'1_2_1': 'Michigan'})
+        self.assertEqual((0, 1), (stats.hits, stats.misses))
+
+    def test_grade_reused(self):
+        xml_str = StringResponseXMLFactory().build_xml(answer="Michigan")
+        stats, correct_map = self.grade_twice(xml_str, 'Michigan')
+        self.assertEqual((1, 1), (stats.hits, stats.misses))
+        self.assertEqual('correct', correct_map.get_correctness('1_2_1'))
+
+    def test_reused_grade_not_shared(self):
+        xml_str = StringResponseXMLFactory().build_xml(answer="Michigan")
+        with memoized_grading():
+            first = new_loncapa_problem(xml_str).grade_answers({'1_2_1': 'Michigan'})
+            first.set_property('1_2_1', 'msg', 'changed')
+            second = new_loncapa_problem(xml_str).grade_answers({'1_2_1': 'Michigan'})
+        self.assertEqual('', second.get_msg('1_2_1'))
+
+    def test_equivalent_answers_share_grades(self):
+        xml_str = ChoiceResponseXMLFactory().build_xml(choice_type='checkbox', choices=[True, False, True])
+        with memoized_grading() as stats:
+            new_loncapa_problem(xml_str).grade_answers({'1_2_1': ['choice_0', 'choice_2']})
+            correct_map = new_loncapa_problem(xml_str).grade_answers({'1_2_1': ['choice_2', 'choice_0']})
+        self.assertEqual((1, 1), (stats.hits, stats.misses))
+        self.assertEqual('correct', correct_map.get_correctness('1_2_1'))
+
+    def test_different_answers_graded(self):
+        xml_str = StringResponseXMLFactory().build_xml(answer="Michigan")
+        with memoized_grading() as stats:
+            new_loncapa_problem(xml_str).grade_answers({'1_2_1': 'Michigan'})
+            correct_map = new_loncapa_problem(xml_str).grade_answers({'1_2_1': 'Minnesota'})
+        self.assertEqual((0, 2), (stats.hits, stats.misses))
+        self.assertEqual('incorrect', correct_map.get_correctness('1_2_1'))
+
+    def test_hint_functions_not_memoized(self):
+        script = textwrap.dedent("""
+            def hint_fn(answer_ids, student_answers, new_cmap, old_cmap):
+                new_cmap.set_hint_and_mode(answer_ids[0], 'a hint', 'always')
+        """)
+        xml_str = StringResponseXMLFactory().build_xml(answer="Michigan", script=script, hintfn="hint_fn")
+        stats, correct_map = self.grade_twice(xml_str, 'Michigan')
+        self.assertEqual((0, 0), (stats.hits, stats.misses))
+        self.assertEqual('a hint', correct_map.get_hint('1_2_1'))
+
+    def test_custom_responses_not_memoized(self):
+        script = textwrap.dedent("""
+            def check_func(expect, answer_given):
+                return {'ok': answer_given == expect, 'msg': 'Message for ' + answer_given}
+        """)
+        xml_str = CustomResponseXMLFactory().build_xml(script=script, cfn="check_func", expect="42")
+        stats, correct_map = self.grade_twice(xml_str, '42')
+        self.assertEqual((0, 0), (stats.hits, stats.misses))
+        self.assertEqual('correct', correct_map.get_correctness('1_2_1'))
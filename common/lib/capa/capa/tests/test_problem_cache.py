@@ -0,0 +1,57 @@
+"""
+Tests for the cache of student-independent problem templates
+"""
+import textwrap
+import unittest
+
+from capa.capa_problem import LoncapaProblem
+from capa.problem_cache import problem_templates
+from .response_xml_factory import CustomResponseXMLFactory, StringResponseXMLFactory
+from . import test_system, new_loncapa_problem
+
+
+class ProblemTemplateCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        super(ProblemTemplateCacheTest, self).setUp()
+        problem_templates.clear()
+        self.system = test_system()
+
+    def test_template_reused(self):
+        xml_str = StringResponseXMLFactory().build_xml(answer="Michigan")
+
+        hits = problem_templates.hits
+        first = new_loncapa_problem(xml_str, system=self.system)
+        second = new_loncapa_problem(xml_str, system=self.system)
+
+        self.assertEqual(hits + 1, problem_templates.hits)
+        self.assertEqual(first.get_question_answers(), second.get_question_answers())
+        # each problem works on its own copy of the tree
+        self.assertIsNot(first.tree, second.tree)
+        self.assertIsNot(first.responders.values()[0], second.responders.values()[0])
+
+    def test_student_state_not_shared(self):
+        script = textwrap.dedent("""
+            def check_func(expect, answer_given):
+                return {'ok': answer_given == expect, 'msg': 'Message for ' + answer_given}
+        """)
+        xml_str = CustomResponseXMLFactory().build_xml(script=script, cfn="check_func", expect="42")
+
+        first = new_loncapa_problem(xml_str, system=self.system)
+        first.grade_answers({'1_2_1': '42'})
+
+        second = new_loncapa_problem(xml_str, system=self.system)
+        self.assertEqual({}, second.correct_map.get_dict())
+        second.grade_answers({'1_2_1': '41'})
+
+        self.assertEqual('correct', first.correct_map.get_correctness('1_2_1'))
+        self.assertEqual('incorrect', second.correct_map.get_correctness('1_2_1'))
+
+    def test_different_seeds(self):
+        xml_str = StringResponseXMLFactory().build_xml(answer="Michigan")
+
+        LoncapaProblem(xml_str, id='1', seed=1, system=self.system)
+        misses = problem_templates.misses
+        LoncapaProblem(xml_str, id='1', seed=2, system=self.system)
+
+        self.assertEqual(misses + 1, problem_templates.misses)
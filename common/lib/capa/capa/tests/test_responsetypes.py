@@ -576,6 +576,20 @@ class FormulaResponseTest(ResponseTest):
         input_dict = {'1_2_1': '1/0'}
         self.assertRaises(StudentInputError, problem.grade_answers, input_dict)
 
+    def test_errors_at_some_samples(self):
+        """
+        Errors that numpy doesn't raise for arrays are still reported, the
+        same way as when checking one sample at a time.
+        """
+        sample_dict = {'x': (-2, -1)}
+        problem = self.build_problem(sample_dict=sample_dict,
+                                     num_samples=10,
+                                     tolerance="1%",
+                                     answer="x")
+        # a negative number can't be raised to a fractional power
+        input_dict = {'1_2_1': 'x^0.5'}
+        self.assertRaises(StudentInputError, problem.grade_answers, input_dict)
+
 
 class StringResponseTest(ResponseTest):
     from capa.tests.response_xml_factory import StringResponseXMLFactory
@@ -14,7 +14,8 @@ from PIL import Image
 
 
 class StaticContent(object):
-    def __init__(self, loc, name, content_type, data, last_modified_at=None, thumbnail_location=None, import_path=None):
+    def __init__(self, loc, name, content_type, data, last_modified_at=None, thumbnail_location=None, import_path=None,
+                 length=None, content_digest=None):
         self.location = loc
         self.name = name   # a display string which can be edited, and thus not part of the location which needs to be fixed
         self.content_type = content_type
@@ -24,6 +25,17 @@ class StaticContent(object):
         # optional information about where this file was imported from. This is needed to support import/export
         # cycles
         self.import_path = import_path
+        # the size of data in bytes, and its md5 hex digest, as recorded by the contentstore
+        self.length = length
+        self.content_digest = content_digest
+
+    def metadata_only(self):
+        """
+        Returns a copy of this content without its data, small enough to
+        cache whatever the size of the content
+        """
+        return StaticContent(self.location, self.name, self.content_type, None, self.last_modified_at,
+                             self.thumbnail_location, self.import_path, self.length, self.content_digest)
 
     @property
     def is_thumbnail(self):
@@ -81,6 +93,51 @@ class StaticContent(object):
         return StaticContent.get_url_path_from_location(loc)
 
 
+class StaticContentStream(StaticContent):
+    """
+    StaticContent whose data is read from a stream (a GridFS file) as it is
+    served, rather than held in memory.  The stream must support seek() and
+    read(size), and its chunk_size is the size of the reads made from it.
+    """
+    def __init__(self, loc, name, content_type, stream, last_modified_at=None, thumbnail_location=None,
+                 import_path=None, length=None, content_digest=None, chunk_size=256 * 1024):
+        super(StaticContentStream, self).__init__(loc, name, content_type, None, last_modified_at,
+                                                  thumbnail_location, import_path, length, content_digest)
+        self._stream = stream
+        self.chunk_size = chunk_size
+
+    def stream_data(self):
+        """
+        Iterate over the whole content, a chunk at a time
+        """
+        return self.stream_data_in_range(0, self.length - 1)
+
+    def stream_data_in_range(self, first_byte, last_byte):
+        """
+        Iterate over the bytes from first_byte to last_byte (inclusive) of
+        the content, reading no more than one stored chunk at a time
+        """
+        self._stream.seek(first_byte)
+        position = first_byte
+        while position <= last_byte:
+            # stop reads at chunk boundaries, so that each read needs one chunk
+            size = min(self.chunk_size - position % self.chunk_size, last_byte - position + 1)
+            chunk = self._stream.read(size)
+            if not chunk:
+                break
+            position += len(chunk)
+            yield chunk
+
+    def copy_to_in_mem(self):
+        """
+        Returns a StaticContent holding all of the data of this content
+        """
+        self._stream.seek(0)
+        return StaticContent(self.location, self.name, self.content_type, self._stream.read(),
+                             self.last_modified_at, self.thumbnail_location, self.import_path,
+                             self.length, self.content_digest)
+
+
 class ContentStore(object):
     '''
     Abstraction for all ContentStore providers (e.g. MongoDB)
@@ -88,7 +145,11 @@ class ContentStore(object):
     def save(self, content):
         raise NotImplementedError
 
-    def find(self, filename):
+    def find(self, location, throw_on_not_found=True, as_stream=False):
+        """
+        Returns the StaticContent at location.  With as_stream, the content
+        may be a StaticContentStream that reads its data as it is served.
+        """
         raise NotImplementedError
 
     def get_all_content_for_course(self, location):
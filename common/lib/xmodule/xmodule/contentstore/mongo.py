@@ -7,7 +7,7 @@ from xmodule.contentstore.content import XASSET_LOCATION_TAG
 
 import logging
 
-from .content import StaticContent, ContentStore
+from .content import StaticContent, StaticContentStream, ContentStore
 from xmodule.exceptions import NotFoundError
 from fs.osfs import OSFS
 import os
@@ -43,14 +43,23 @@ class MongoContentStore(ContentStore):
         if self.fs.exists({"_id": id}):
             self.fs.delete(id)
 
-    def find(self, location, throw_on_not_found=True):
+    def find(self, location, throw_on_not_found=True, as_stream=False):
         id = StaticContent.get_id_from_location(location)
         try:
+            if as_stream:
+                # the chunks are only read as the content is served
+                fp = self.fs.get(id)
+                return StaticContentStream(location, fp.displayname, fp.content_type, fp,
+                                           fp.uploadDate,
+                                           thumbnail_location=fp.thumbnail_location if hasattr(fp, 'thumbnail_location') else None,
+                                           import_path=fp.import_path if hasattr(fp, 'import_path') else None,
+                                           length=fp.length, content_digest=fp.md5, chunk_size=fp.chunk_size)
             with self.fs.get(id) as fp:
                 return StaticContent(location, fp.displayname, fp.content_type, fp.read(),
                                      fp.uploadDate,
                                      thumbnail_location=fp.thumbnail_location if hasattr(fp, 'thumbnail_location') else None,
-                                     import_path=fp.import_path if hasattr(fp, 'import_path') else None)
+                                     import_path=fp.import_path if hasattr(fp, 'import_path') else None,
+                                     length=fp.length, content_digest=fp.md5)
         except NoFile:
             if throw_on_not_found:
                 raise NotFoundError()
@@ -361,6 +361,21 @@ class ModuleStore(object):
         """
         raise NotImplementedError
 
+    def bulk_update_items(self, items):
+        """
+        Write many items at once.  items is a list of (location, data,
+        children, metadata), each of which is written as by update_item,
+        update_children (unless children is None) and update_metadata.
+
+        Modulestores that can write a batch of items with fewer round trips
+        override this.
+        """
+        for location, data, children, metadata in items:
+            self.update_item(location, data)
+            if children is not None:
+                self.update_children(location, children)
+            self.update_metadata(location, metadata)
+
     def delete_item(self, location):
         """
         Delete an item from this modulestore
@@ -391,6 +406,15 @@ class ModuleStore(object):
         '''
         raise NotImplementedError
 
+    def get_path_index(self, course_id):
+        '''
+        Returns the path index of the course (see
+        xmodule.modulestore.search.compute_path_index), or None if this
+        modulestore doesn't keep one, in which case path_to_location searches
+        for paths through get_parent_locations.
+        '''
+        return None
+
     def get_containing_courses(self, location):
         '''
         Returns the list of courses that contains the specified location
@@ -0,0 +1,251 @@
+"""
+A compiled summary of the module tree of a course, stored by the
+MongoModuleStore as a single document per course.  It holds the parent/child
+edges of every module along with the few fields needed to navigate and grade
+a course without loading it (category, display name, format, graded) and the
+inheritable metadata, so that structural questions (who are the parents of a
+module, what are all its descendants, what metadata does it inherit) can be
+answered without walking the course one level at a time.
+"""
+
+from . import Location
+from .inheritance import INHERITABLE_METADATA
+
+# Metadata kept for each module in the structure
+STRUCTURE_METADATA = ('display_name', 'format') + INHERITABLE_METADATA
+
+# The categories whose own metadata is passed down to their children.  Other
+# modules only receive metadata from their parent.
+INHERITANCE_CONTAINER_CATEGORIES = (
+    'course', 'chapter', 'sequential', 'vertical',
+    'wrapper', 'problemset', 'conditional', 'randomize',
+)
+
+
+def structure_record_filter():
+    """
+    Returns the mongo field filter that selects just the parts of a module
+    record that go into its structure block
+    """
+    record_filter = {'_id': 1, 'definition.children': 1}
+    for attr in STRUCTURE_METADATA:
+        record_filter['metadata.{0}'.format(attr)] = 1
+    return record_filter
+
+
+def block_from_record(record):
+    """
+    Build the structure block for a module record, as returned from the
+    modulestore collection (filtered by structure_record_filter())
+    """
+    location = Location(record['_id'])
+    metadata = record.get('metadata', {})
+    return {
+        'location': location.url(),
+        'revision': location.revision,
+        'category': location.category,
+        'children': record.get('definition', {}).get('children', []),
+        'metadata': dict((attr, metadata[attr]) for attr in STRUCTURE_METADATA if attr in metadata),
+    }
+
+
+class CourseStructure(object):
+    """
+    The module tree of a single course (an org/course pair), built from a list
+    of structure blocks.  There is one block per stored revision of a module,
+    so a module with both a draft and a published version has two blocks.
+    """
+    def __init__(self, blocks):
+        self.blocks = []
+        self._blocks_by_url = {}
+        self._parents = {}
+        for block in blocks:
+            self._add_block(block)
+
+    def _add_block(self, block):
+        """
+        Add a single block to the structure and its indexes
+        """
+        self.blocks.append(block)
+        self._blocks_by_url.setdefault(block['location'], []).append(block)
+        for child in block['children']:
+            self._parents.setdefault(child, []).append(block)
+
+    def replace_blocks(self, url, blocks):
+        """
+        Replace all the blocks for the module at `url` with `blocks`
+        """
+        for block in self._blocks_by_url.pop(url, []):
+            self.blocks.remove(block)
+            for child in block['children']:
+                self._parents[child].remove(block)
+        for block in blocks:
+            self._add_block(block)
+
+    def get_block(self, url):
+        """
+        Returns the block for the module at `url`, preferring the published
+        version if there is one, or None if the module isn't in the course
+        """
+        blocks = self._blocks_by_url.get(url)
+        if not blocks:
+            return None
+        for block in blocks:
+            if block['revision'] is None:
+                return block
+        return blocks[0]
+
+    def get_revision_block(self, url, revision=None):
+        """
+        Returns the block for `revision` of the module at `url` (None being the
+        published revision), or None if there isn't one.  Other revisions, i.e.
+        drafts, fall back to the published block.
+        """
+        published = None
+        for block in self._blocks_by_url.get(url, []):
+            if block['revision'] == revision:
+                return block
+            if block['revision'] is None:
+                published = block
+        return published
+
+    def children(self, url, revision=None):
+        """
+        Returns the urls of the children of `revision` of `url`, in order (see
+        get_revision_block).  A module that has only been drafted has no
+        published children.
+        """
+        block = self.get_revision_block(url, revision)
+        return list(block['children']) if block is not None else []
+
+    def _all_children(self, url):
+        """
+        Returns the urls of the children of `url` across all of its revisions,
+        in order, without duplicates.  Metadata is inherited by drafts too, so
+        it's passed down to all of these.
+        """
+        children = []
+        for block in self._blocks_by_url.get(url, []):
+            for child in block['children']:
+                if child not in children:
+                    children.append(child)
+        return children
+
+    def parents(self, url):
+        """
+        Returns the Locations (including revision) of every module that lists
+        `url` as a child
+        """
+        return [Location(block['location']).replace(revision=block['revision'])
+                for block in self._parents.get(url, [])]
+
+    def descendants(self, urls, depth=None, revision=None):
+        """
+        Returns the urls of all descendants of `revision` of `urls`, down to
+        `depth` levels (None for all of them), following the children of the
+        same revision of each descendant (see children()).  The modules in
+        `urls` are not included.
+        """
+        seen = set(urls)
+        descendants = []
+        level = list(urls)
+        while level and (depth is None or depth > 0):
+            next_level = []
+            for url in level:
+                for child in self.children(url, revision):
+                    if child not in seen:
+                        seen.add(child)
+                        next_level.append(child)
+            descendants.extend(next_level)
+            level = next_level
+            if depth is not None:
+                depth -= 1
+        return descendants
+
+    def _own_inheritable_metadata(self, url):
+        """
+        Returns the inheritable metadata set on the module at `url` itself
+        """
+        block = self.get_block(url)
+        metadata = block['metadata'] if block is not None else {}
+        return dict((attr, metadata[attr]) for attr in INHERITABLE_METADATA if attr in metadata)
+
+    def _inherit_to_children(self, url, my_metadata, metadata_to_inherit, visited):
+        """
+        Fill in metadata_to_inherit for the descendants of `url`, given the
+        metadata `url` passes down to its children.
+
+        Metadata dicts are shared rather than copied wherever a module doesn't
+        add anything of its own, so the dicts in the tree must not be mutated.
+        """
+        visited.add(url)
+        for child in self._all_children(url):
+            child_block = self.get_block(child)
+            if child_block is not None and child_block['category'] in INHERITANCE_CONTAINER_CATEGORIES:
+                child_metadata = self._own_inheritable_metadata(child)
+                if child_metadata:
+                    new_child_metadata = dict(my_metadata)
+                    new_child_metadata.update(child_metadata)
+                else:
+                    new_child_metadata = my_metadata
+                metadata_to_inherit[child] = new_child_metadata
+                if child not in visited:
+                    self._inherit_to_children(child, new_child_metadata, metadata_to_inherit, visited)
+            else:
+                metadata_to_inherit[child] = my_metadata
+
+    def _passed_down_metadata(self, url, metadata_to_inherit):
+        """
+        Returns the metadata that `url` passes down to its children according
+        to metadata_to_inherit, or None if `url` isn't part of the tree
+        """
+        block = self.get_block(url)
+        if block is None:
+            return None
+        if block['category'] == 'course':
+            return self._own_inheritable_metadata(url)
+        if block['category'] in INHERITANCE_CONTAINER_CATEGORIES:
+            # containers are recorded with their own metadata already merged in
+            return metadata_to_inherit.get(url)
+        return None
+
+    def inherited_metadata(self):
+        """
+        Returns a dict mapping module url -> the metadata it inherits from its
+        ancestors, in the form used by the metadata inheritance tree
+        """
+        metadata_to_inherit = {}
+        for url, blocks in self._blocks_by_url.items():
+            if blocks[0]['category'] == 'course':
+                self._inherit_to_children(url, self._own_inheritable_metadata(url), metadata_to_inherit, set())
+
+        return metadata_to_inherit
+
+    def update_inherited_metadata(self, metadata_to_inherit, url):
+        """
+        Update metadata_to_inherit in place after the module at `url` has
+        changed, recomputing only `url` and its descendants.  The entries for
+        `url` come from whichever of its parents is part of the tree.
+        """
+        block = self.get_block(url)
+        if block is not None and block['category'] == 'course':
+            self._inherit_to_children(url, self._own_inheritable_metadata(url), metadata_to_inherit, set())
+            return
+
+        for parent in self.parents(url):
+            parent_metadata = self._passed_down_metadata(parent.url(), metadata_to_inherit)
+            if parent_metadata is None:
+                continue
+            # recompute url's entry as part of its parent's children
+            if block is not None and block['category'] in INHERITANCE_CONTAINER_CATEGORIES:
+                own_metadata = self._own_inheritable_metadata(url)
+                if own_metadata:
+                    my_metadata = dict(parent_metadata)
+                    my_metadata.update(own_metadata)
+                else:
+                    my_metadata = parent_metadata
+                metadata_to_inherit[url] = my_metadata
+                self._inherit_to_children(url, my_metadata, metadata_to_inherit, set([parent.url()]))
+            else:
+                metadata_to_inherit[url] = parent_metadata
+            return
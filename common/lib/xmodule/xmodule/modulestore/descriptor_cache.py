@@ -0,0 +1,88 @@
+"""
+A bounded, process-local cache of loaded XModuleDescriptors, used by the
+MongoModuleStore so that each request doesn't rebuild the descriptors it
+needs from the raw Mongo json.
+
+Entries are tagged with a per-course version token.  Writes to a course
+replace its token (in the shared cache subsystem, e.g. memcached, when one
+is configured), so every process sees its cached descriptors for that course
+go stale at once.
+"""
+
+import threading
+from collections import OrderedDict
+from uuid import uuid4
+
+
+class DescriptorCache(object):
+    """
+    An LRU cache of descriptors keyed by (location, depth), holding at most
+    `max_size` entries.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, version):
+        """
+        Returns the descriptor stored for key, or None if there isn't one
+        stored for this version of its course
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] != version:
+                self.invalidations += 1
+                self.misses += 1
+                return None
+
+            # re-insert to mark as most recently used
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, version, descriptor):
+        """
+        Store descriptor for key, evicting the least recently used entries
+        if the cache is full
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (version, descriptor)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Drop every entry
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns the cache counters, for sizing the cache
+        """
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
+
+
+def new_version():
+    """
+    Returns a new, unique course version token
+    """
+    return uuid4().hex
@@ -1,6 +1,6 @@
 from datetime import datetime
 
-from . import ModuleStoreBase, Location, namedtuple_to_son
+from . import ModuleStore, ModuleStoreBase, Location, namedtuple_to_son
 from .exceptions import ItemNotFoundError
 from .inheritance import own_metadata
 from xmodule.exceptions import InvalidVersionError
@@ -172,6 +172,13 @@ class DraftModuleStore(ModuleStoreBase):
 
         return super(DraftModuleStore, self).update_metadata(draft_loc, metadata)
 
+    def bulk_update_items(self, items):
+        """
+        Write many items at once.  Drafts are written one item at a time, since
+        each write may have to create the draft first.
+        """
+        ModuleStore.bulk_update_items(self, items)
+
     def delete_item(self, location, delete_all_versions=False):
         """
         Delete an item from this modulestore
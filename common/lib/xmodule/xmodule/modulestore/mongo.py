@@ -1,9 +1,8 @@
 import pymongo
 import sys
 import logging
-import copy
 
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 from fs.osfs import OSFS
 from itertools import repeat
 from path import path
@@ -15,6 +14,7 @@ from xmodule.errortracker import null_error_tracker, exc_info_to_str
 from xmodule.mako_module import MakoDescriptorSystem
 from xmodule.x_module import XModuleDescriptor
 from xmodule.error_module import ErrorDescriptor
+from xmodule.course_module import CourseDescriptor
 from xblock.runtime import DbModel, KeyValueStore, InvalidScopeError
 from xblock.core import Scope
 
@@ -22,7 +22,10 @@ from . import ModuleStoreBase, Location, namedtuple_to_son
 from .draft import DraftModuleStore
 from .exceptions import (ItemNotFoundError,
                          DuplicateItemError)
-from .inheritance import own_metadata, INHERITABLE_METADATA, inherit_metadata
+from .inheritance import own_metadata, inherit_metadata
+from .course_structure import CourseStructure, block_from_record, structure_record_filter
+from .descriptor_cache import DescriptorCache, new_version
+from .search import compute_path_index
 
 log = logging.getLogger(__name__)
 
@@ -241,7 +244,7 @@ class MongoModuleStore(ModuleStoreBase):
                  port=27017, default_class=None,
                  error_tracker=null_error_tracker,
                  user=None, password=None, request_cache=None,
-                 metadata_inheritance_cache_subsystem=None, **kwargs):
+                 metadata_inheritance_cache_subsystem=None, descriptor_cache_size=0, **kwargs):
 
         ModuleStoreBase.__init__(self)
 
@@ -263,6 +266,9 @@ class MongoModuleStore(ModuleStoreBase):
         self.collection.ensure_index(
             zip(('_id.' + field for field in Location._fields), repeat(1)))
 
+        # One compiled structure document per course, keyed by org/course
+        self.structure_collection = self.collection.structures
+
         if default_class is not None:
             module_path, _, class_name = default_class.rpartition('.')
             class_ = getattr(import_module(module_path), class_name)
@@ -276,81 +282,105 @@ class MongoModuleStore(ModuleStoreBase):
         self.request_cache = request_cache
         self.metadata_inheritance_cache_subsystem = metadata_inheritance_cache_subsystem
 
+        # Loaded descriptors are shared between requests, so the descriptor cache
+        # should only be turned on for read-only (LMS) stores
+        self.descriptor_cache = DescriptorCache(descriptor_cache_size) if descriptor_cache_size else None
+        self._course_versions = {}
+        self._path_indexes = {}  # course_id -> (course version token, path index)
+
+    def compute_course_structure(self, location):
+        """
+        Compute the CourseStructure for the org/course of location from all
+        of the modules stored for the course
+        """
+        query = {'_id.org': location.org,
+                 '_id.course': location.course}
+        resultset = self.collection.find(query, structure_record_filter())
+        return CourseStructure([block_from_record(result) for result in resultset])
+
+    def get_course_structure(self, location, force_refresh=False):
+        """
+        Returns the CourseStructure for the org/course of location, computing
+        and storing it if it hasn't been stored yet (or on force_refresh)
+        """
+        key = get_course_id_no_run(location)
+
+        if not force_refresh and self.request_cache is not None:
+            if key in self.request_cache.data.get('course_structure', {}):
+                return self.request_cache.data['course_structure'][key]
+
+        document = None
+        if not force_refresh:
+            document = self.structure_collection.find_one({'_id': key})
+
+        if document is not None:
+            structure = CourseStructure(document['blocks'])
+        else:
+            structure = self.compute_course_structure(location)
+            self._save_course_structure(key, structure)
+
+        if self.request_cache is not None:
+            self.request_cache.data.setdefault('course_structure', {})[key] = structure
+
+        return structure
+
+    def _save_course_structure(self, key, structure, version=None):
+        """
+        Store `structure` as the structure document for the course `key`.
+
+        Every document stored gets a new version token.  If the `version` of
+        the stored document that `structure` was derived from is given, the
+        document is only replaced if it's still at that version, in one update.
+        If it has changed in the meantime, or the structure can't be stored
+        (e.g. it's too large for a document), the stored structure is removed,
+        and computed again when next needed.
+        """
+        document = {'_id': key, 'blocks': structure.blocks, 'version': new_version()}
+        # Must include safe to avoid the django debug toolbar (which defines the deprecated "safe=False")
+        # from overriding our default value set in the init method.
+        try:
+            if version is None:
+                # a full recomputation replaces whatever is stored
+                self.structure_collection.save(document, safe=self.collection.safe)
+                return
+            result = self.structure_collection.update({'_id': key, 'version': version}, document,
+                                                      safe=self.collection.safe)
+            if result['n'] == 1:
+                return
+        except (pymongo.errors.InvalidDocument, pymongo.errors.OperationFailure):
+            log.warning("Couldn't store the course structure of %s", key, exc_info=True)
+        self.structure_collection.remove({'_id': key}, safe=self.collection.safe)
+
+    def update_course_structure(self, location):
+        """
+        Patch the blocks for location (all of its revisions) in the stored
+        course structure to match what is currently in the modulestore,
+        rather than recomputing the structure of the whole course
+        """
+        location = Location(location)
+        key = get_course_id_no_run(location)
+
+        query = location_to_query(location.replace(revision=None))
+        del query['_id.revision']
+        blocks = [block_from_record(result) for result in self.collection.find(query, structure_record_filter())]
+
+        # If the structure hasn't been stored yet, it will be computed in full
+        # when it is next needed
+        document = self.structure_collection.find_one({'_id': key})
+        if document is not None:
+            structure = CourseStructure(document['blocks'])
+            structure.replace_blocks(location.url(), blocks)
+            # documents stored without a version are never matched, so replaced in full
+            self._save_course_structure(key, structure, document.get('version', ''))
+
+        if self.request_cache is not None and key in self.request_cache.data.get('course_structure', {}):
+            self.request_cache.data['course_structure'][key].replace_blocks(location.url(), blocks)
+
     def compute_metadata_inheritance_tree(self, location):
         '''
         TODO (cdodge) This method can be deleted when the 'split module store' work has been completed
         '''
-
-        # get all collections in the course, this query should not return any leaf nodes
-        # note this is a bit ugly as when we add new categories of containers, we have to add it here
-        query = {'_id.org': location.org,
-                 '_id.course': location.course,
-                 '_id.category': {'$in': ['course', 'chapter', 'sequential', 'vertical',
-                                          'wrapper', 'problemset', 'conditional', 'randomize']}
-                 }
-        # we just want the Location, children, and inheritable metadata
-        record_filter = {'_id': 1, 'definition.children': 1}
-
-        # just get the inheritable metadata since that is all we need for the computation
-        # this minimizes both data pushed over the wire
-        for attr in INHERITABLE_METADATA:
-            record_filter['metadata.{0}'.format(attr)] = 1
-
-        # call out to the DB
-        resultset = self.collection.find(query, record_filter)
-
-        results_by_url = {}
-        root = None
-
-        # now go through the results and order them by the location url
-        for result in resultset:
-            location = Location(result['_id'])
-            # We need to collate between draft and non-draft
-            # i.e. draft verticals can have children which are not in non-draft versions
-            location = location.replace(revision=None)
-            location_url = location.url()
-            if location_url in results_by_url:
-                existing_children = results_by_url[location_url].get('definition', {}).get('children', [])
-                additional_children = result.get('definition', {}).get('children', [])
-                total_children = existing_children + additional_children
-                if 'definition' not in results_by_url[location_url]:
-                    results_by_url[location_url]['definition'] = {}
-                results_by_url[location_url]['definition']['children'] = total_children
-            results_by_url[location.url()] = result
-            if location.category == 'course':
-                root = location.url()
-
-        # now traverse the tree and compute down the inherited metadata
-        metadata_to_inherit = {}
-
-        def _compute_inherited_metadata(url):
-            """
-            Helper method for computing inherited metadata for a specific location url
-            """
-            # check for presence of metadata key. Note that a given module may not yet be fully formed.
-            # example: update_item -> update_children -> update_metadata sequence on new item create
-            # if we get called here without update_metadata called first then 'metadata' hasn't been set
-            # as we're not fully transactional at the DB layer. Same comment applies to below key name
-            # check
-            my_metadata = results_by_url[url].get('metadata', {})
-
-            # go through all the children and recurse, but only if we have
-            # in the result set. Remember results will not contain leaf nodes
-            for child in results_by_url[url].get('definition', {}).get('children', []):
-                if child in results_by_url:
-                    new_child_metadata = copy.deepcopy(my_metadata)
-                    new_child_metadata.update(results_by_url[child].get('metadata', {}))
-                    results_by_url[child]['metadata'] = new_child_metadata
-                    metadata_to_inherit[child] = new_child_metadata
-                    _compute_inherited_metadata(child)
-                else:
-                    # this is likely a leaf node, so let's record what metadata we need to inherit
-                    metadata_to_inherit[child] = my_metadata
-
-        if root is not None:
-            _compute_inherited_metadata(root)
-
-        return metadata_to_inherit
+        return self.get_course_structure(location).inherited_metadata()
 
     def get_cached_metadata_inheritance_tree(self, location, force_refresh=False):
         '''
@@ -392,13 +422,39 @@ class MongoModuleStore(ModuleStoreBase):
 
     def refresh_cached_metadata_inheritance_tree(self, location):
         """
-        Refresh the cached metadata inheritance tree for the org/course combination
-        for location
+        Refresh the course structure and the cached metadata inheritance tree
+        for the org/course combination for location
         """
         pseudo_course_id = '/'.join([location.org, location.course])
         if pseudo_course_id not in self.ignore_write_events_on_courses:
+            self.get_course_structure(location, force_refresh=True)
             self.get_cached_metadata_inheritance_tree(location, force_refresh=True)
 
+    def refresh_cached_item_structure(self, location):
+        """
+        Update the course structure and the cached metadata inheritance tree
+        after the item at location has been written
+        """
+        pseudo_course_id = '/'.join([location.org, location.course])
+        if pseudo_course_id not in self.ignore_write_events_on_courses:
+            self.update_course_structure(location)
+            self.update_cached_metadata_inheritance_tree(location)
+
+    def update_cached_metadata_inheritance_tree(self, location):
+        """
+        Patch the cached metadata inheritance tree after the item at location
+        has been written, recomputing only the entries for location and its
+        descendants rather than the whole tree
+        """
+        key = metadata_cache_key(location)
+        tree = self.get_cached_metadata_inheritance_tree(location)
+        self.get_course_structure(location).update_inherited_metadata(tree, location.url())
+
+        # the request cache holds the tree we just patched, so only the caching
+        # subsystem needs to be written back
+        if self.metadata_inheritance_cache_subsystem is not None:
+            self.metadata_inheritance_cache_subsystem.set(key, tree)
+
     def _clean_item_data(self, item):
         """
         Renames the '_id' field in item to 'location'
@@ -419,32 +475,32 @@ class MongoModuleStore(ModuleStoreBase):
         for all descendents of items up to the specified depth.
         (0 = no descendents, 1 = children, 2 = grandchildren, etc)
         If depth is None, will load all the children.
-        This will make a number of queries that is linear in the depth.
+        The descendents are found from the course structures, so they are all
+        loaded in a single query, whatever the depth.
         """
 
         data = {}
-        to_process = list(items)
-        while to_process and depth is None or depth >= 0:
-            children = []
-            for item in to_process:
+        urls_by_course = {}
+        for item in items:
+            self._clean_item_data(item)
+            location = Location(item['location'])
+            data[location] = item
+            # the descendants of drafts are those of the draft revisions
+            course_key = (metadata_cache_key(location), location.revision)
+            urls_by_course.setdefault(course_key, (location, []))[1].append(location.url())
+
+        if depth == 0:
+            return data
+
+        descendants = []
+        for location, urls in urls_by_course.values():
+            descendants.extend(self.get_course_structure(location).descendants(urls, depth, location.revision))
+
+        if descendants:
+            for item in self._query_children_for_cache_children(descendants):
                 self._clean_item_data(item)
-                children.extend(item.get('definition', {}).get('children', []))
                 data[Location(item['location'])] = item
 
-            if depth == 0:
-                break
-
-            # Load all children by id. See
-            # http://www.mongodb.org/display/DOCS/Advanced+Queries#AdvancedQueries-%24or
-            # for or-query syntax
-            to_process = []
-            if children:
-                to_process = self._query_children_for_cache_children(children)
-
-            # If depth is None, then we just recurse until we hit all the descendents
-            if depth is not None:
-                depth -= 1
-
         return data
 
     def _load_item(self, item, data_cache, apply_cached_metadata=True):
@@ -544,8 +600,18 @@ class MongoModuleStore(ModuleStoreBase):
             calls to get_children() to cache. None indicates to cache all descendents.
         """
         location = Location.ensure_fully_specified(location)
+
+        if self.descriptor_cache is not None:
+            version = self._get_course_version(location)
+            module = self.descriptor_cache.get((location, depth), version)
+            if module is not None:
+                return module
+
         item = self._find_one(location)
         module = self._load_items([item], depth)[0]
+
+        if self.descriptor_cache is not None:
+            self.descriptor_cache.set((location, depth), version, module)
         return module
 
     def get_instance(self, course_id, location, depth=0):
@@ -609,13 +675,59 @@ class MongoModuleStore(ModuleStoreBase):
         except pymongo.errors.DuplicateKeyError:
             raise DuplicateItemError(location)
 
-        # recompute (and update) the metadata inheritance tree which is cached
-        self.refresh_cached_metadata_inheritance_tree(Location(location))
+        # update the course structure and the metadata inheritance tree which is cached
+        self.refresh_cached_item_structure(Location(location))
         self.fire_updated_modulestore_signal(get_course_id_no_run(Location(location)), Location(location))
 
         return item
 
+    def _course_version_key(self, location):
+        """
+        Returns the key of the version token of the course of location
+        """
+        return 'descriptor_cache_version:{0}'.format(get_course_id_no_run(location))
+
+    def _get_course_version(self, location):
+        """
+        Returns the current version token of the course of location.  The token
+        is shared between processes through the metadata inheritance cache
+        subsystem if there is one, and looked up at most once per request.
+        """
+        key = self._course_version_key(location)
+
+        if self.request_cache is not None and key in self.request_cache.data.get('descriptor_cache_version', {}):
+            return self.request_cache.data['descriptor_cache_version'][key]
+
+        if self.metadata_inheritance_cache_subsystem is not None:
+            version = self.metadata_inheritance_cache_subsystem.get(key)
+            if version is None:
+                # add() doesn't overwrite a token that another process set in the meantime
+                self.metadata_inheritance_cache_subsystem.add(key, new_version())
+                version = self.metadata_inheritance_cache_subsystem.get(key)
+        else:
+            version = self._course_versions.setdefault(key, new_version())
+
+        if self.request_cache is not None:
+            self.request_cache.data.setdefault('descriptor_cache_version', {})[key] = version
+
+        return version
+
+    def _bump_course_version(self, location):
+        """
+        Replace the version token of the course of location, so that every
+        process stops using the descriptors it has cached for the course
+        """
+        key = self._course_version_key(location)
+        version = new_version()
+        if self.metadata_inheritance_cache_subsystem is not None:
+            self.metadata_inheritance_cache_subsystem.set(key, version)
+        self._course_versions[key] = version
+
+        if self.request_cache is not None:
+            self.request_cache.data.get('descriptor_cache_version', {}).pop(key, None)
+
     def fire_updated_modulestore_signal(self, course_id, location):
+        self._bump_course_version(location)
         if self.modulestore_update_signal is not None:
             self.modulestore_update_signal.send(self, modulestore=self, course_id=course_id,
                                                 location=location)
@@ -677,6 +789,8 @@ class MongoModuleStore(ModuleStoreBase):
         """
 
         self._update_single_item(location, {'definition.data': data})
+        # fire signal that we've written to DB
+        self.fire_updated_modulestore_signal(get_course_id_no_run(Location(location)), Location(location))
 
     def update_children(self, location, children):
         """
@@ -688,11 +802,27 @@ class MongoModuleStore(ModuleStoreBase):
         """
 
         self._update_single_item(location, {'definition.children': children})
-        # recompute (and update) the metadata inheritance tree which is cached
-        self.refresh_cached_metadata_inheritance_tree(Location(location))
+        # update the course structure and the metadata inheritance tree which is cached
+        self.refresh_cached_item_structure(Location(location))
         # fire signal that we've written to DB
         self.fire_updated_modulestore_signal(get_course_id_no_run(Location(location)), Location(location))
 
+    def _update_static_tab_name(self, location, metadata):
+        """
+        Update the name of the course tab for the static tab at location
+        """
+        # VS[compat] cdodge: This is a hack because static_tabs also have references from the course module, so
+        # if we add one then we need to also add it to the policy information (i.e. metadata)
+        # we should remove this once we can break this reference from the course to static tabs
+        course = self.get_course_for_item(location)
+        existing_tabs = course.tabs or []
+        for tab in existing_tabs:
+            if tab.get('url_slug') == location.name:
+                tab['name'] = metadata.get('display_name')
+                break
+        course.tabs = existing_tabs
+        self.update_metadata(course.location, own_metadata(course))
+
     def update_metadata(self, location, metadata):
         """
         Set the metadata for the item specified by the location to
@@ -701,25 +831,74 @@ class MongoModuleStore(ModuleStoreBase):
         location: Something that can be passed to Location
         metadata: A nested dictionary of module metadata
         """
-        # VS[compat] cdodge: This is a hack because static_tabs also have references from the course module, so
-        # if we add one then we need to also add it to the policy information (i.e. metadata)
-        # we should remove this once we can break this reference from the course to static tabs
         loc = Location(location)
         if loc.category == 'static_tab':
-            course = self.get_course_for_item(loc)
-            existing_tabs = course.tabs or []
-            for tab in existing_tabs:
-                if tab.get('url_slug') == loc.name:
-                    tab['name'] = metadata.get('display_name')
-                    break
-            course.tabs = existing_tabs
-            self.update_metadata(course.location, own_metadata(course))
+            self._update_static_tab_name(loc, metadata)
 
         self._update_single_item(location, {'metadata': metadata})
-        # recompute (and update) the metadata inheritance tree which is cached
-        self.refresh_cached_metadata_inheritance_tree(loc)
+        # update the course structure and the metadata inheritance tree which is cached
+        self.refresh_cached_item_structure(loc)
         self.fire_updated_modulestore_signal(get_course_id_no_run(Location(location)), Location(location))
 
+    def bulk_update_items(self, items):
+        """
+        Write many items at once (see ModuleStore.bulk_update_items): the
+        existing records are read with one query and updated in memory, and
+        the new records are written with one batch insert.
+
+        Existing records are then replaced one at a time, each replacement
+        being atomic, so that a failed write never leaves an item missing.
+        On a first import, nothing exists yet and the batch insert is all.
+        """
+        records = OrderedDict()
+        for location, data, children, metadata in items:
+            location = Location(location)
+            records[location.url()] = (location, data, children, metadata)
+        if not records:
+            return
+
+        ids = [location.dict() for location, _, _, _ in records.itervalues()]
+        existing = dict(
+            (Location(record['_id']).url(), record)
+            for record in self.collection.find({'_id': {'$in': ids}})
+        )
+
+        new_records = []
+        updated_records = []
+        for url, (location, data, children, metadata) in records.iteritems():
+            record = existing.get(url, {})
+            # the key order of _id matters to queries, and isn't kept when reading it back
+            record['_id'] = location.dict()
+            record.setdefault('definition', {})['data'] = data
+            if children is not None:
+                record['definition']['children'] = children
+            record['metadata'] = metadata
+            (updated_records if url in existing else new_records).append(record)
+
+        # Must include this to avoid the django debug toolbar (which defines the deprecated "safe=False")
+        # from overriding our default value set in the init method.
+        if new_records:
+            self.collection.insert(new_records, safe=self.collection.safe)
+        for record in updated_records:
+            self.collection.update({'_id': record['_id']}, record, upsert=True, safe=self.collection.safe)
+
+        courses = OrderedDict()
+        for location, _, _, metadata in records.itervalues():
+            courses.setdefault(get_course_id_no_run(location), location)
+            if location.category == 'static_tab':
+                self._update_static_tab_name(location, metadata)
+
+        for course_id, location in courses.iteritems():
+            if course_id in self.ignore_write_events_on_courses:
+                # an import writes batch after batch, and refreshes the course
+                # and signals once at the end (see import_from_xml)
+                self._bump_course_version(location)
+                continue
+            # update the course structure and the metadata inheritance tree once
+            # for the whole batch, rather than patching them item by item
+            self.refresh_cached_metadata_inheritance_tree(location)
+            self.fire_updated_modulestore_signal(course_id, location)
+
     def delete_item(self, location, delete_all_versions=False):
         """
         Delete an item from this modulestore
@@ -740,8 +919,8 @@ class MongoModuleStore(ModuleStoreBase):
         # Must include this to avoid the django debug toolbar (which defines the deprecated "safe=False")
         # from overriding our default value set in the init method.
         self.collection.remove({'_id': Location(location).dict()}, safe=self.collection.safe)
-        # recompute (and update) the metadata inheritance tree which is cached
-        self.refresh_cached_metadata_inheritance_tree(Location(location))
+        # update the course structure and the metadata inheritance tree which is cached
+        self.refresh_cached_item_structure(Location(location))
         self.fire_updated_modulestore_signal(get_course_id_no_run(Location(location)), Location(location))
 
     def get_parent_locations(self, location, course_id):
@@ -749,9 +928,29 @@ class MongoModuleStore(ModuleStoreBase):
         course.  Needed for path_to_location().
         '''
         location = Location.ensure_fully_specified(location)
-        items = self.collection.find({'definition.children': location.url()},
-                                     {'_id': True})
-        return [i['_id'] for i in items]
+        return self.get_course_structure(location).parents(location.url())
+
+    def get_path_index(self, course_id):
+        """
+        Returns the path index of course_id, built from the course structure.
+        It is kept until the version token of the course changes, which
+        every write to the course does.
+        """
+        course_location = CourseDescriptor.id_to_location(course_id)
+        version = self._get_course_version(course_location)
+        cached = self._path_indexes.get(course_id)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+
+        structure = self.get_course_structure(course_location)
+
+        def children(url):
+            return [child for child in structure.children(url)
+                    if structure.get_revision_block(child) is not None]
+
+        path_index = compute_path_index(course_id, course_location, children)
+        self._path_indexes[course_id] = (version, path_index)
+        return path_index
 
     def get_errored_courses(self):
         """
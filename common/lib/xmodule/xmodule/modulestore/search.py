@@ -6,6 +6,49 @@ from .exceptions import (ItemNotFoundError, NoPathToItem)
 from . import Location
 
 
+# The categories whose children are shown one at a time, so that the path to
+# a descendant includes its position
+POSITIONAL_CATEGORIES = ('sequential', 'videosequence')
+
+
+def compute_path_index(course_id, course_location, children):
+    '''
+    Build the path index of a course: a dict mapping the url of every location
+    reachable from the course to the (course_id, chapter, section, position)
+    tuple that path_to_location returns for it.
+
+    course_location: the Location of the course
+    children: a function returning the urls of the children of a url, in
+        order, leaving out children that don't exist
+
+    Where a location can be reached by more than one path, the first one in
+    a depth-first walk of the course is used.
+    '''
+    index = {}
+    # (url, depth, chapter, section, positions so far), depth 0 being the course
+    stack = [(course_location.url(), 0, None, None, ())]
+    while stack:
+        url, depth, chapter, section, positions = stack.pop()
+        if url in index:
+            continue
+        location = Location(url)
+        if depth == 1:
+            chapter = location.name
+        elif depth == 2:
+            section = location.name
+        # like path_to_location, only give a position below the section
+        position = "_".join(positions) if depth > 2 else None
+        index[url] = (course_id, chapter, section, position)
+
+        child_urls = children(url)
+        positional = depth >= 2 and location.category in POSITIONAL_CATEGORIES
+        # push in reverse, so that children are visited in order
+        for child_index in reversed(range(len(child_urls))):
+            child_positions = positions + (str(child_index + 1),) if positional else positions
+            stack.append((child_urls[child_index], depth + 1, chapter, section, child_positions))
+    return index
+
+
 def path_to_location(modulestore, course_id, location):
     '''
     Try to find a course_id/chapter/section[/position] path to location in
@@ -29,6 +72,26 @@ def path_to_location(modulestore, course_id, location):
     If the section is a sequential or vertical, position will be the position
     of this location in that sequence.  Otherwise, position will
     be None. TODO (vshnayder): Not true yet.
+
+    Uses the modulestore's path index for the course if it has one, and
+    searches for a path otherwise.
+    '''
+    path_index = modulestore.get_path_index(course_id)
+    if path_index is not None:
+        path = path_index.get(Location(location).url())
+        if path is not None:
+            return path
+        if not modulestore.has_item(location):
+            raise ItemNotFoundError
+        raise NoPathToItem(location)
+
+    return search_path_to_location(modulestore, course_id, location)
+
+
+def search_path_to_location(modulestore, course_id, location):
+    '''
+    path_to_location, found by searching up from location through its
+    parents rather than from a path index
     '''
 
     def flatten(xs):
@@ -106,7 +169,7 @@ def path_to_location(modulestore, course_id, location):
         position_list = []
         for path_index in range(2, n - 1):
             category = path[path_index].category
-            if category == 'sequential' or category == 'videosequence':
+            if category in POSITIONAL_CATEGORIES:
                 section_desc = modulestore.get_instance(course_id, path[path_index])
                 child_locs = [c.location for c in section_desc.get_children()]
                 # positions are 1-indexed, and should be strings to be consistent with
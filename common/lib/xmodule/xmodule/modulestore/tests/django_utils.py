@@ -28,6 +28,7 @@ class ModuleStoreTestCase(TestCase):
         # Remove everything except templates
         modulestore.collection.remove(query)
         modulestore.collection.drop()
+        modulestore.structure_collection.drop()
 
     @staticmethod
     def load_templates_if_necessary():
@@ -74,6 +75,7 @@ class ModuleStoreTestCase(TestCase):
         # Clean up by dropping the collection
         modulestore = xmodule.modulestore.django.modulestore()
         modulestore.collection.drop()
+        modulestore.structure_collection.drop()
 
         xmodule.modulestore.django._MODULESTORES.clear()
 
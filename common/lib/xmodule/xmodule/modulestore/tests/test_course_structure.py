@@ -0,0 +1,101 @@
+from nose.tools import assert_equals, assert_is
+
+from xmodule.modulestore import Location
+from xmodule.modulestore.course_structure import CourseStructure
+
+
+def block(url, children=(), revision=None, **metadata):
+    '''Build a structure block for url'''
+    return {
+        'location': url,
+        'revision': revision,
+        'category': Location(url).category,
+        'children': list(children),
+        'metadata': metadata,
+    }
+
+
+COURSE = 'i4x://org/course/course/run'
+CHAPTER = 'i4x://org/course/chapter/one'
+SEQUENTIAL = 'i4x://org/course/sequential/one'
+VERTICAL = 'i4x://org/course/vertical/one'
+PROBLEM = 'i4x://org/course/problem/one'
+HTML = 'i4x://org/course/html/one'
+
+
+class TestCourseStructure(object):
+
+    def setUp(self):
+        self.structure = CourseStructure([
+            block(COURSE, [CHAPTER], start='2013-01-01'),
+            block(CHAPTER, [SEQUENTIAL]),
+            block(SEQUENTIAL, [VERTICAL], graded=True, format='Homework'),
+            block(VERTICAL, [PROBLEM, HTML]),
+            block(PROBLEM),
+            block(HTML),
+        ])
+
+    def test_navigation(self):
+        assert_equals([Location(CHAPTER)], self.structure.parents(SEQUENTIAL))
+        assert_equals([SEQUENTIAL], self.structure.descendants([CHAPTER], depth=1))
+        assert_equals([SEQUENTIAL, VERTICAL, PROBLEM, HTML], self.structure.descendants([CHAPTER]))
+
+    def test_children_of_each_revision(self):
+        draft_problem = 'i4x://org/course/problem/two'
+        self.structure.replace_blocks(VERTICAL, [
+            block(VERTICAL, [PROBLEM, HTML]),
+            block(VERTICAL, [PROBLEM, HTML, draft_problem], revision='draft'),
+        ])
+        self.structure.replace_blocks(draft_problem, [block(draft_problem, revision='draft')])
+
+        assert_equals([PROBLEM, HTML], self.structure.children(VERTICAL))
+        assert_equals([PROBLEM, HTML, draft_problem], self.structure.children(VERTICAL, 'draft'))
+        assert_equals([VERTICAL, PROBLEM, HTML], self.structure.descendants([SEQUENTIAL]))
+        assert_equals([VERTICAL, PROBLEM, HTML, draft_problem], self.structure.descendants([SEQUENTIAL], revision='draft'))
+        assert_equals([Location(VERTICAL), Location(VERTICAL).replace(revision='draft')],
+                      self.structure.parents(PROBLEM))
+        # drafts inherit metadata too
+        assert_equals({'start': '2013-01-01', 'graded': True}, self.structure.inherited_metadata()[draft_problem])
+
+    def test_draft_only_module_has_no_published_children(self):
+        draft_vertical = 'i4x://org/course/vertical/two'
+        self.structure.replace_blocks(draft_vertical, [block(draft_vertical, [HTML], revision='draft')])
+        assert_equals([], self.structure.children(draft_vertical))
+        assert_equals([HTML], self.structure.children(draft_vertical, 'draft'))
+
+    def test_inherited_metadata(self):
+        tree = self.structure.inherited_metadata()
+        assert_equals({'start': '2013-01-01'}, tree[CHAPTER])
+        assert_equals({'start': '2013-01-01', 'graded': True}, tree[SEQUENTIAL])
+        assert_equals({'start': '2013-01-01', 'graded': True}, tree[PROBLEM])
+        # modules that don't add metadata of their own share their parent's dict
+        assert_is(tree[SEQUENTIAL], tree[VERTICAL])
+
+    def test_update_inherited_metadata(self):
+        tree = self.structure.inherited_metadata()
+        untouched = tree[CHAPTER]
+
+        self.structure.replace_blocks(SEQUENTIAL, [block(SEQUENTIAL, [VERTICAL], due='2013-02-01')])
+        self.structure.update_inherited_metadata(tree, SEQUENTIAL)
+
+        assert_equals(self.structure.inherited_metadata(), tree)
+        assert_is(untouched, tree[CHAPTER])
+
+    def test_update_inherited_metadata_new_child(self):
+        tree = self.structure.inherited_metadata()
+        new_problem = 'i4x://org/course/problem/two'
+
+        self.structure.replace_blocks(new_problem, [block(new_problem)])
+        self.structure.replace_blocks(VERTICAL, [block(VERTICAL, [PROBLEM, HTML, new_problem])])
+        self.structure.update_inherited_metadata(tree, VERTICAL)
+
+        assert_equals(self.structure.inherited_metadata(), tree)
+
+    def test_update_inherited_metadata_course(self):
+        tree = self.structure.inherited_metadata()
+
+        self.structure.replace_blocks(COURSE, [block(COURSE, [CHAPTER], start='2014-01-01')])
+        self.structure.update_inherited_metadata(tree, COURSE)
+
+        assert_equals(self.structure.inherited_metadata(), tree)
+        assert_equals('2014-01-01', tree[HTML]['start'])
@@ -0,0 +1,38 @@
+from nose.tools import assert_equals, assert_is, assert_is_none
+
+from xmodule.modulestore.descriptor_cache import DescriptorCache
+
+
+class TestDescriptorCache(object):
+
+    def setUp(self):
+        self.cache = DescriptorCache(2)
+
+    def test_hit_and_miss(self):
+        descriptor = object()
+        assert_is_none(self.cache.get(('a', 0), 'v1'))
+        self.cache.set(('a', 0), 'v1', descriptor)
+        assert_is(descriptor, self.cache.get(('a', 0), 'v1'))
+        assert_is_none(self.cache.get(('a', None), 'v1'))
+
+        stats = self.cache.stats()
+        assert_equals((1, 2), (stats['hits'], stats['misses']))
+
+    def test_stale_version(self):
+        self.cache.set(('a', 0), 'v1', object())
+        assert_is_none(self.cache.get(('a', 0), 'v2'))
+        assert_equals(1, self.cache.stats()['invalidations'])
+        # stale entries are dropped
+        assert_equals(0, self.cache.stats()['size'])
+
+    def test_lru_eviction(self):
+        self.cache.set('a', 'v1', 'A')
+        self.cache.set('b', 'v1', 'B')
+        # touch a, so b is the least recently used
+        self.cache.get('a', 'v1')
+        self.cache.set('c', 'v1', 'C')
+
+        assert_equals('A', self.cache.get('a', 'v1'))
+        assert_is_none(self.cache.get('b', 'v1'))
+        assert_equals('C', self.cache.get('c', 'v1'))
+        assert_equals(1, self.cache.stats()['evictions'])
@@ -1,7 +1,7 @@
-from nose.tools import assert_equals, assert_raises
+from nose.tools import assert_equals, assert_raises, assert_true
 
 from xmodule.modulestore.exceptions import ItemNotFoundError
-from xmodule.modulestore.search import path_to_location
+from xmodule.modulestore.search import path_to_location, search_path_to_location
 
 
 def check_path_to_location(modulestore):
@@ -23,3 +23,12 @@ def check_path_to_location(modulestore):
     )
     for location in not_found:
         assert_raises(ItemNotFoundError, path_to_location, modulestore, course_id, location)
+
+
+def check_path_index(modulestore, course_id):
+    '''Make sure that the path index of course_id gives the paths that
+    searching for them does'''
+    path_index = modulestore.get_path_index(course_id)
+    assert_true(len(path_index) > 1)
+    for url, path in path_index.items():
+        assert_equals(path, search_path_to_location(modulestore, course_id, url))
@@ -1,4 +1,5 @@
 import pymongo
+from mock import patch
 
 from nose.tools import assert_equals, assert_raises, assert_not_equals, assert_false
 from pprint import pprint
@@ -7,11 +8,12 @@ from xblock.core import Scope
 from xblock.runtime import KeyValueStore, InvalidScopeError
 
 from xmodule.modulestore import Location
+from xmodule.modulestore.course_structure import CourseStructure
 from xmodule.modulestore.mongo import MongoModuleStore, MongoKeyValueStore
 from xmodule.modulestore.xml_importer import import_from_xml
 from xmodule.templates import update_templates
 
-from .test_modulestore import check_path_to_location
+from .test_modulestore import check_path_to_location, check_path_index
 from . import DATA_DIR
 from uuid import uuid4
 
@@ -111,6 +113,153 @@ class TestMongoModuleStore(object):
         '''Make sure that path_to_location works'''
         check_path_to_location(self.store)
 
+    def test_path_index(self):
+        '''Make sure that the path index agrees with searching for paths'''
+        check_path_index(self.store, 'edX/toy/2012_Fall')
+        check_path_index(self.store, 'edX/simple/2012_Fall')
+
+    def test_get_parent_locations(self):
+        assert_equals(
+            [Location("i4x://edX/toy/chapter/Overview")],
+            self.store.get_parent_locations("i4x://edX/toy/video/Welcome", None))
+
+        assert_equals(
+            [Location("i4x://edX/toy/course/2012_Fall")],
+            self.store.get_parent_locations("i4x://edX/toy/chapter/Overview", None))
+
+        assert_equals([], self.store.get_parent_locations("i4x://edX/toy/course/2012_Fall", None))
+
+    def test_course_structure(self):
+        '''The stored course structure should match the modules in the course'''
+        course_location = Location("i4x://edX/toy/course/2012_Fall")
+        structure = self.store.get_course_structure(course_location)
+
+        assert_equals(['i4x://edX/toy/chapter/Overview', 'i4x://edX/toy/chapter/secret:magic'],
+                      structure.children(course_location.url()))
+        assert_equals('chapter', structure.get_block('i4x://edX/toy/chapter/Overview')['category'])
+        assert_equals(2, len(structure.descendants([course_location.url()], depth=1)))
+
+        computed = self.store.compute_course_structure(course_location)
+        assert_equals(
+            sorted(block['location'] for block in computed.blocks),
+            sorted(block['location'] for block in structure.blocks))
+
+    def test_get_item_depth_uses_structure(self):
+        '''Loading with depth=None should prefetch every descendant'''
+        course_location = Location("i4x://edX/toy/course/2012_Fall")
+        course = self.store.get_item(course_location, depth=None)
+        descendants = self.store.get_course_structure(course_location).descendants([course_location.url()])
+
+        cached = set(location.url() for location in course.system.module_data)
+        for url in descendants:
+            assert url in cached, url
+
+    def test_descriptor_cache(self):
+        '''Descriptors are reused until the course is written to'''
+        store = MongoModuleStore(HOST, DB, COLLECTION, FS_ROOT, RENDER_TEMPLATE,
+            default_class=DEFAULT_CLASS, descriptor_cache_size=10)
+        location = Location("i4x://edX/toy/video/Welcome")
+
+        descriptor = store.get_item(location)
+        assert store.get_item(location) is descriptor
+        assert store.get_item(location, depth=None) is not descriptor
+
+        store.fire_updated_modulestore_signal('edX/toy', location)
+        assert store.get_item(location) is not descriptor
+
+        stats = store.descriptor_cache.stats()
+        assert_equals((1, 3), (stats['hits'], stats['misses']))
+
+    def test_bulk_import_matches_module_by_module_import(self):
+        '''Importing in batches should store the same records as importing one module at a time'''
+        stores = []
+        for collection, batch_size in (('import_one_by_one', 0), ('import_batched', 7)):
+            store = MongoModuleStore(HOST, DB, collection, FS_ROOT, RENDER_TEMPLATE,
+                default_class=DEFAULT_CLASS)
+            import_from_xml(store, DATA_DIR, ['toy'], batch_size=batch_size)
+            stores.append(store)
+
+        def records(store):
+            return sorted(store.collection.find(), key=lambda record: Location(record['_id']).url())
+
+        one_by_one, batched = [records(store) for store in stores]
+        assert_equals(len(one_by_one), len(batched))
+        for expected, actual in zip(one_by_one, batched):
+            assert_equals(expected, actual)
+
+        course_location = Location("i4x://edX/toy/course/2012_Fall")
+        one_by_one, batched = [
+            sorted(store.get_course_structure(course_location).blocks, key=lambda block: block['location'])
+            for store in stores
+        ]
+        assert_equals(one_by_one, batched)
+
+    def test_import_refreshes_and_signals_once(self):
+        store = MongoModuleStore(HOST, DB, 'import_signals', FS_ROOT, RENDER_TEMPLATE,
+            default_class=DEFAULT_CLASS)
+        with patch.object(store, 'refresh_cached_metadata_inheritance_tree') as refresh:
+            with patch.object(store, 'fire_updated_modulestore_signal') as fire_signal:
+                import_from_xml(store, DATA_DIR, ['toy'], batch_size=7)
+        assert_equals(1, refresh.call_count)
+        assert_equals(1, fire_signal.call_count)
+        assert_equals('edX/toy', fire_signal.call_args[0][0])
+
+    def test_failed_bulk_update_keeps_existing_items(self):
+        store = MongoModuleStore(HOST, DB, 'import_failed', FS_ROOT, RENDER_TEMPLATE,
+            default_class=DEFAULT_CLASS)
+        import_from_xml(store, DATA_DIR, ['toy'])
+        existing = Location("i4x://edX/toy/video/Welcome")
+        before = store.collection.find_one({'_id': existing.dict()})
+
+        with patch.object(store.collection, 'insert', side_effect=pymongo.errors.OperationFailure('insert failed')):
+            with assert_raises(pymongo.errors.OperationFailure):
+                store.bulk_update_items([
+                    (existing, 'changed', None, {}),
+                    (Location("i4x://edX/toy/html/new_html"), 'new', None, {}),
+                ])
+
+        assert_equals(before, store.collection.find_one({'_id': existing.dict()}))
+
+    def test_bulk_update_replaces_existing_items(self):
+        store = MongoModuleStore(HOST, DB, 'import_replaced', FS_ROOT, RENDER_TEMPLATE,
+            default_class=DEFAULT_CLASS)
+        import_from_xml(store, DATA_DIR, ['toy'])
+        existing = Location("i4x://edX/toy/video/Welcome")
+        store.bulk_update_items([
+            (existing, 'changed', None, {'display_name': 'Changed'}),
+            (Location("i4x://edX/toy/html/new_html"), 'new', None, {}),
+        ])
+
+        def record(location):
+            return store.collection.find_one({'_id': location.dict()})
+
+        assert_equals('changed', record(existing)['definition']['data'])
+        assert_equals({'display_name': 'Changed'}, record(existing)['metadata'])
+        assert_equals('new', record(Location("i4x://edX/toy/html/new_html"))['definition']['data'])
+
+    def test_course_structure_updated_in_one_write(self):
+        store = MongoModuleStore(HOST, DB, 'structure_updates', FS_ROOT, RENDER_TEMPLATE,
+            default_class=DEFAULT_CLASS)
+        import_from_xml(store, DATA_DIR, ['toy'])
+        course_location = Location("i4x://edX/toy/course/2012_Fall")
+        key = 'edX/toy'
+        store.get_course_structure(course_location)
+        version = store.structure_collection.find_one({'_id': key})['version']
+
+        store.update_metadata(Location("i4x://edX/toy/chapter/Overview"), {'display_name': 'Changed'})
+        document = store.structure_collection.find_one({'_id': key})
+        assert_not_equals(version, document['version'])
+        assert_equals('Changed', CourseStructure(document['blocks']).get_block(
+            'i4x://edX/toy/chapter/Overview')['metadata']['display_name'])
+
+        # a structure that can't be written is dropped, to be computed again
+        with patch.object(store.structure_collection, 'update',
+                          side_effect=pymongo.errors.OperationFailure('document too large')):
+            store.update_metadata(Location("i4x://edX/toy/chapter/Overview"), {'display_name': 'Again'})
+        assert_equals(None, store.structure_collection.find_one({'_id': key}))
+        assert_equals('Again', store.get_course_structure(course_location).get_block(
+            'i4x://edX/toy/chapter/Overview')['metadata']['display_name'])
+
     def test_get_courses_has_no_templates(self):
         courses = self.store.get_courses()
         for course in courses:
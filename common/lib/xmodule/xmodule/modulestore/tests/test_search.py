@@ -0,0 +1,43 @@
+from nose.tools import assert_equals
+
+from xmodule.modulestore import Location
+from xmodule.modulestore.search import compute_path_index
+
+
+COURSE_ID = 'org/course/run'
+COURSE = 'i4x://org/course/course/run'
+CHAPTER = 'i4x://org/course/chapter/one'
+SEQUENTIAL = 'i4x://org/course/sequential/one'
+INNER_SEQUENTIAL = 'i4x://org/course/sequential/inner'
+VERTICAL = 'i4x://org/course/vertical/one'
+PROBLEM = 'i4x://org/course/problem/one'
+HTML = 'i4x://org/course/html/one'
+ORPHAN = 'i4x://org/course/problem/orphan'
+
+
+class TestComputePathIndex(object):
+
+    def setUp(self):
+        tree = {
+            COURSE: [CHAPTER],
+            CHAPTER: [SEQUENTIAL],
+            SEQUENTIAL: [HTML, VERTICAL, INNER_SEQUENTIAL],
+            VERTICAL: [PROBLEM],
+            INNER_SEQUENTIAL: [HTML, PROBLEM],
+            ORPHAN: [],
+        }
+        self.index = compute_path_index(COURSE_ID, Location(COURSE), lambda url: tree.get(url, []))
+
+    def test_paths(self):
+        assert_equals((COURSE_ID, None, None, None), self.index[COURSE])
+        assert_equals((COURSE_ID, 'one', None, None), self.index[CHAPTER])
+        assert_equals((COURSE_ID, 'one', 'one', None), self.index[SEQUENTIAL])
+        assert_equals((COURSE_ID, 'one', 'one', '1'), self.index[HTML])
+        assert_equals((COURSE_ID, 'one', 'one', '3'), self.index[INNER_SEQUENTIAL])
+
+    def test_positions_below_non_positional_modules(self):
+        # verticals don't add to the position
+        assert_equals((COURSE_ID, 'one', 'one', '2'), self.index[PROBLEM])
+
+    def test_unreachable(self):
+        assert ORPHAN not in self.index
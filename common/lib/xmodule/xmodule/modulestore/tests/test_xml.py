@@ -3,9 +3,9 @@ import os.path
 from xmodule.course_module import CourseDescriptor
 from xmodule.modulestore.xml import XMLModuleStore
 
-from nose.tools import assert_raises
+from nose.tools import assert_raises, assert_equals, assert_true
 
-from .test_modulestore import check_path_to_location
+from .test_modulestore import check_path_to_location, check_path_index
 from . import DATA_DIR
 
 
@@ -19,6 +19,12 @@ class TestXMLModuleStore(object):
 
         check_path_to_location(modulestore)
 
+    def test_path_index(self):
+        """The path index agrees with searching for paths"""
+        modulestore = XMLModuleStore(DATA_DIR, course_dirs=['toy', 'simple'])
+        check_path_index(modulestore, 'edX/toy/2012_Fall')
+        check_path_index(modulestore, 'edX/simple/2012_Fall')
+
     def test_unicode_chars_in_xml_content(self):
         # edX/full/6.002_Spring_2012 has non-ASCII chars, and during
         # uniquification of names, would raise a UnicodeError. It no longer does.
@@ -37,3 +43,57 @@ class TestXMLModuleStore(object):
         location = CourseDescriptor.id_to_location("edX/full/6.002_Spring_2012")
         errors = modulestore.get_item_errors(location)
         assert errors == []
+
+    def test_lazy_load(self):
+        """A lazy store loads only what is asked for, and ends up with the same modules as an eager one"""
+        course_dirs = ['toy', 'simple']
+        eager = XMLModuleStore(DATA_DIR, course_dirs=course_dirs)
+        lazy = XMLModuleStore(DATA_DIR, course_dirs=course_dirs, lazy=True)
+
+        num_modules = lambda store: sum(len(modules) for modules in store.modules.values())
+        assert_true(num_modules(lazy) < num_modules(eager))
+
+        for course_id, modules in eager.modules.items():
+            for location, descriptor in modules.items():
+                lazy_descriptor = lazy.get_instance(course_id, location)
+                assert_equals(descriptor.location, lazy_descriptor.location)
+                assert_equals(getattr(descriptor, '_inherited_metadata', {}),
+                              getattr(lazy_descriptor, '_inherited_metadata', {}))
+        assert_equals(num_modules(eager), num_modules(lazy))
+
+    def test_lazy_path_to_location(self):
+        """path_to_location works without loading the course up front"""
+        modulestore = XMLModuleStore(DATA_DIR, course_dirs=['toy', 'simple'], lazy=True)
+        check_path_to_location(modulestore)
+
+    def test_lazy_load_drops_cold_subtrees(self):
+        """With a memory cap, subtrees are dropped and loaded again at the same locations"""
+        modulestore = XMLModuleStore(DATA_DIR, course_dirs=['conditional_and_poll'],
+                                     lazy=True, lazy_max_modules=1)
+        course_id = 'HarvardX/ER22x/2013_Spring'
+        deferred = modulestore._deferred[course_id].keys()
+        assert_true(len(deferred) > 1)
+
+        loaded = [modulestore.get_instance(course_id, location) for location in deferred]
+        # only the most recently loaded subtree is kept
+        assert_true(deferred[0] not in modulestore.modules[course_id])
+        assert_true(deferred[-1] in modulestore.modules[course_id])
+
+        for descriptor in loaded:
+            reloaded = modulestore.get_instance(course_id, descriptor.location)
+            assert_equals(descriptor.location, reloaded.location)
+            assert_equals(descriptor.children, reloaded.children)
+
+    def test_lazy_has_item_loads_only_its_course(self):
+        """has_item looks for a missing item in its own course only"""
+        modulestore = XMLModuleStore(DATA_DIR, course_dirs=['toy', 'simple'], lazy=True)
+        assert_true(modulestore.has_item('i4x://edX/toy/video/Welcome'))
+
+        num_loaded = dict((course_id, len(modules)) for course_id, modules in modulestore.modules.items())
+        assert_true(not modulestore.has_item('i4x://edX/nonexistent/video/Welcome'))
+        for course_id, modules in modulestore.modules.items():
+            assert_equals(num_loaded[course_id], len(modules))
+
+        assert_true(not modulestore.has_item('i4x://edX/toy/video/Nonexistent'))
+        assert_true('edX/toy/2012_Fall' in modulestore._fully_loaded)
+        assert_true('edX/simple/2012_Fall' not in modulestore._fully_loaded)
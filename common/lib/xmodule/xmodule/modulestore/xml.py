@@ -5,8 +5,9 @@ import os
 import re
 import sys
 import glob
+import threading
 
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from cStringIO import StringIO
 from fs.osfs import OSFS
 from importlib import import_module
@@ -18,12 +19,14 @@ from xmodule.errortracker import make_error_tracker, exc_info_to_str
 from xmodule.course_module import CourseDescriptor
 from xmodule.mako_module import MakoDescriptorSystem
 from xmodule.x_module import XModuleDescriptor, XMLParsingSystem
+from xmodule.xml_module import XmlDescriptor, is_pointer_tag
 
 from xmodule.html_module import HtmlDescriptor
 
 from . import ModuleStoreBase, Location
 from .exceptions import ItemNotFoundError
-from .inheritance import compute_inherited_metadata
+from .inheritance import compute_inherited_metadata, inherit_metadata
+from .search import compute_path_index
 
 edx_xml_parser = etree.XMLParser(dtd_validation=False, load_dtd=False,
                                  remove_comments=True, remove_blank_text=True)
@@ -42,15 +45,27 @@ def clean_out_mako_templating(xml_string):
     return xml_string
 
 
+class DeferredDescriptor(object):
+    """
+    Stands in for a descriptor that a lazy XMLModuleStore has indexed, but not
+    loaded yet.  Only its location is known.
+    """
+    def __init__(self, location):
+        self.location = location
+
+
 class ImportSystem(XMLParsingSystem, MakoDescriptorSystem):
     def __init__(self, xmlstore, course_id, course_dir,
                  policy, error_tracker, parent_tracker,
-                 load_error_modules=True, **kwargs):
+                 load_error_modules=True, lazy=False, **kwargs):
         """
         A class that handles loading from xml.  Does some munging to ensure that
         all elements have unique slugs.
 
         xmlstore: the XMLModuleStore to store the loaded modules in
+
+        lazy: if True, pointers to the files of other descriptors are handed to
+            xmlstore.defer_item instead of being loaded
         """
         self.unnamed = defaultdict(int)  # category -> num of new url_names for that category
         self.used_names = defaultdict(set)  # category -> set of used url_names
@@ -58,10 +73,17 @@ class ImportSystem(XMLParsingSystem, MakoDescriptorSystem):
         # cdodge: adding the course_id as passed in for later reference rather than having to recomine the org/course/url_name
         self.course_id = course_id
         self.load_error_modules = load_error_modules
+        self.lazy = lazy
+        # stack of ([locations loaded], [(tag, url_name) used]), one for each
+        # deferred item being materialized
+        self.load_logs = []
 
-        def process_xml(xml):
+        def load_xml(xml, materialize=False):
             """Takes an xml string, and returns a XModuleDescriptor created from
             that xml.
+
+            If materialize is True, xml is a pointer that was deferred earlier:
+            its url_name has already been made unique, and it is loaded now.
             """
 
             def make_name_unique(xml_data):
@@ -149,6 +171,8 @@ class ImportSystem(XMLParsingSystem, MakoDescriptorSystem):
                         url_name = fallback_name(url_name)
 
                 self.used_names[tag].add(url_name)
+                if self.load_logs:
+                    self.load_logs[-1][1].append((tag, url_name))
                 xml_data.set('url_name', url_name)
 
             try:
@@ -158,7 +182,12 @@ class ImportSystem(XMLParsingSystem, MakoDescriptorSystem):
                 xml = clean_out_mako_templating(xml)
                 xml_data = etree.fromstring(xml)
 
-                make_name_unique(xml_data)
+                if not materialize:
+                    make_name_unique(xml_data)
+
+                    if self.lazy and xmlstore.can_defer(xml_data):
+                        location = Location('i4x', self.org, self.course, xml_data.tag, xml_data.get('url_name'))
+                        return xmlstore.defer_item(self, location, etree.tostring(xml_data, encoding='unicode'))
 
                 descriptor = XModuleDescriptor.load_from_xml(
                     etree.tostring(xml_data, encoding='unicode'), self, self.org,
@@ -187,15 +216,35 @@ class ImportSystem(XMLParsingSystem, MakoDescriptorSystem):
                     err_msg
                 )
 
+            # a translating descriptor (see backcompat_module) can hand back a deferred child
+            if isinstance(descriptor, DeferredDescriptor):
+                return descriptor
+
             setattr(descriptor, 'data_dir', course_dir)
 
             xmlstore.modules[course_id][descriptor.location] = descriptor
+            if self.load_logs:
+                self.load_logs[-1][0].append(descriptor.location)
 
             if hasattr(descriptor, 'children'):
-                for child in descriptor.get_children():
-                    parent_tracker.add_parent(child.location, descriptor.location)
+                if self.lazy:
+                    # don't load deferred children just to learn their locations
+                    for child_location in descriptor.children:
+                        parent_tracker.add_parent(child_location, descriptor.location)
+                else:
+                    for child in descriptor.get_children():
+                        parent_tracker.add_parent(child.location, descriptor.location)
             return descriptor
 
+        def process_xml(xml):
+            """Takes an xml string, and returns a XModuleDescriptor created from
+            that xml.
+            """
+            return load_xml(xml)
+
+        # loads the pointer xml of a deferred item
+        self.materialize = lambda xml: load_xml(xml, materialize=True)
+
         render_template = lambda: ''
         # TODO (vshnayder): we are somewhat architecturally confused in the loading code:
         # load_item should actually be get_instance, because it expects the course-specific
@@ -253,7 +302,8 @@ class XMLModuleStore(ModuleStoreBase):
     """
     An XML backed ModuleStore
     """
-    def __init__(self, data_dir, default_class=None, course_dirs=None, load_error_modules=True):
+    def __init__(self, data_dir, default_class=None, course_dirs=None, load_error_modules=True,
+                 lazy=False, lazy_max_modules=None):
         """
         Initialize an XMLModuleStore from data_dir
 
@@ -264,6 +314,17 @@ class XMLModuleStore(ModuleStoreBase):
 
         course_dirs: If specified, the list of course_dirs to load. Otherwise,
             load all course dirs
+
+        lazy: If True, only course.xml is loaded up front.  Pointers to other
+            files (<chapter url_name="..."/> and the like) are indexed, and
+            the subtree in each file is loaded the first time it's asked for.
+            Url_names are made unique in the order things are loaded, so
+            courses with duplicate url_names can get different locations than
+            when loaded eagerly.
+
+        lazy_max_modules: In lazy mode, the number of lazily loaded modules to
+            keep.  Past that, the least recently used subtrees are dropped,
+            to be loaded again when next asked for.  None means no limit.
         """
         ModuleStoreBase.__init__(self)
 
@@ -283,6 +344,21 @@ class XMLModuleStore(ModuleStoreBase):
 
         self.parent_trackers = defaultdict(ParentTracker)
 
+        self.lazy = lazy
+        self.lazy_max_modules = lazy_max_modules
+        self._deferred = defaultdict(dict)  # course_id -> dict(location -> (ImportSystem, pointer xml))
+        self._fully_loaded = set()  # course_ids with every deferred item loaded at least once
+        # (course_id, location) -> (ImportSystem, [locations loaded], [(tag, url_name) used]) for
+        # each materialized deferred item, least recently used first
+        self._subtrees = OrderedDict()
+        # (course_id, location) -> location of the deferred item it was loaded with, so
+        # that dropped items can be found again
+        self._subtree_roots = {}
+        self._num_materialized = 0
+        self._eviction_paused = 0
+        self._lazy_lock = threading.RLock()
+        self._path_indexes = {}  # course_id -> path index
+
         # If we are specifically asked for missing courses, that should
         # be an error.  If we are asked for "all" courses, find the ones
         # that have a course.xml. We sort the dirs in alpha order so we always
@@ -415,6 +491,7 @@ class XMLModuleStore(ModuleStoreBase):
                 tracker,
                 self.parent_trackers[course_id],
                 self.load_error_modules,
+                self.lazy,
             )
 
             course_descriptor = system.process_xml(etree.tostring(course_data, encoding='unicode'))
@@ -427,7 +504,11 @@ class XMLModuleStore(ModuleStoreBase):
             # breaks metadata inheritance via get_children().  Instead
             # (actually, in addition to, for now), we do a final inheritance pass
             # after we have the course descriptor.
-            compute_inherited_metadata(course_descriptor)
+            if self.lazy:
+                # deferred items inherit when they are materialized
+                self._inherit_loaded_metadata(course_id, course_descriptor)
+            else:
+                compute_inherited_metadata(course_descriptor)
 
             # now import all pieces of course_info which is expected to be stored
             # in <content_dir>/info or <content_dir>/info/<url_name>
@@ -494,17 +575,187 @@ class XMLModuleStore(ModuleStoreBase):
         """
         location = Location(location)
         try:
-            return self.modules[course_id][location]
+            descriptor = self.modules[course_id][location]
         except KeyError:
-            raise ItemNotFoundError(location)
+            if not self.lazy:
+                raise ItemNotFoundError(location)
+            return self._load_deferred(course_id, location)
+
+        if self.lazy and (course_id, location) in self._subtrees:
+            with self._lazy_lock:
+                # mark the subtree as recently used
+                key = (course_id, location)
+                if key in self._subtrees:
+                    self._subtrees[key] = self._subtrees.pop(key)
+        return descriptor
 
     def has_item(self, location):
         """
         Returns True if location exists in this ModuleStore.
         """
         location = Location(location)
+        if self.lazy:
+            # only the courses of location's org/course can hold it, so don't
+            # go loading the deferred items of any other course
+            for course_id in self.modules.keys():
+                if course_id.split('/')[:2] != [location.org, location.course]:
+                    continue
+                try:
+                    self.get_instance(course_id, location)
+                    return True
+                except ItemNotFoundError:
+                    pass
+            return False
         return any(location in course_modules for course_modules in self.modules.values())
 
+    def can_defer(self, xml_data):
+        """
+        Returns True if, in lazy mode, loading the descriptor for the parsed
+        xml_data can be put off: it is a pointer to a file, and the location of
+        the descriptor follows from the pointer alone.
+        """
+        if xml_data.tag == 'course' or not is_pointer_tag(xml_data):
+            return False
+        class_ = XModuleDescriptor.load_class(xml_data.tag, self.default_class)
+        # descriptors that parse their own xml may end up at a different location
+        return (issubclass(class_, XmlDescriptor) and
+                class_.from_xml.im_func is XmlDescriptor.from_xml.im_func)
+
+    def defer_item(self, system, location, xml):
+        """
+        Index the pointer xml for the item at location, rather than loading it.
+
+        Returns the item if it's loaded already, and a DeferredDescriptor
+        otherwise.
+        """
+        self._deferred[system.course_id].setdefault(location, (system, xml))
+        descriptor = self.modules[system.course_id].get(location)
+        if descriptor is None:
+            descriptor = DeferredDescriptor(location)
+        return descriptor
+
+    def _load_deferred(self, course_id, location):
+        """
+        Load the item at location in lazy mode, materializing deferred items
+        until it turns up.  An item that isn't indexed may still be inside a
+        file that hasn't been loaded yet, so looking for one loads the whole
+        course, once.
+        """
+        with self._lazy_lock:
+            modules = self.modules[course_id]
+            if location in modules:
+                return modules[location]
+            if location in self._deferred[course_id]:
+                return self._materialize(course_id, location)
+            root = self._subtree_roots.get((course_id, location))
+            if root is not None:
+                # it was loaded with a subtree that has been dropped since
+                self._materialize(course_id, root)
+                if location in modules:
+                    return modules[location]
+
+            if course_id not in self._fully_loaded:
+                self._load_all_deferred(course_id, until=location)
+                self._evict_cold_subtrees()
+            if location in modules:
+                return modules[location]
+            raise ItemNotFoundError(location)
+
+    def _load_all_deferred(self, course_id, until=None):
+        """
+        Materialize every deferred item of course_id, or only until the item
+        at location `until` has been loaded.  Nothing is evicted meanwhile.
+        Call with _lazy_lock held.
+        """
+        tried = set()
+        self._eviction_paused += 1
+        try:
+            while True:
+                pending = [location for location in self._deferred[course_id] if location not in tried]
+                if not pending:
+                    break
+                for location in pending:
+                    tried.add(location)
+                    if location not in self.modules[course_id]:
+                        self._materialize(course_id, location)
+                    if until is not None and until in self.modules[course_id]:
+                        return
+            self._fully_loaded.add(course_id)
+        finally:
+            self._eviction_paused -= 1
+
+    def _materialize(self, course_id, location):
+        """
+        Load the deferred item at location, and the subtree stored with it.
+        Call with _lazy_lock held.
+        """
+        system, xml = self._deferred[course_id][location]
+        system.load_logs.append(([], []))
+        try:
+            descriptor = system.materialize(xml)
+        finally:
+            locations, names = system.load_logs.pop()
+
+        if descriptor.location != location:
+            # it failed to load, and is an ErrorDescriptor.  Don't try again.
+            self.modules[course_id][location] = descriptor
+            locations.append(location)
+
+        # the parent has done its inheritance already (it is loaded
+        # first, if it was dropped), so pass that on to the new subtree
+        tracker = self.parent_trackers[course_id]
+        parents = tracker.parents(location) if tracker.is_known(location) else []
+        if parents:
+            parent = self.get_instance(course_id, parents[0])
+            inherit_metadata(descriptor, parent._model_data)
+        self._inherit_loaded_metadata(course_id, descriptor)
+
+        self._subtrees[(course_id, location)] = (system, locations, names)
+        for loaded_location in locations:
+            self._subtree_roots[(course_id, loaded_location)] = location
+        self._num_materialized += len(locations)
+        self._evict_cold_subtrees()
+        return descriptor
+
+    def _inherit_loaded_metadata(self, course_id, descriptor):
+        """
+        Like compute_inherited_metadata, but only walks into the children
+        that are loaded, rather than loading deferred ones
+        """
+        for child_location in getattr(descriptor, 'children', []):
+            child = self.modules[course_id].get(Location(child_location))
+            if child is not None:
+                inherit_metadata(child, descriptor._model_data)
+                self._inherit_loaded_metadata(course_id, child)
+
+    def _evict_cold_subtrees(self):
+        """
+        Drop the least recently used materialized subtrees until no more than
+        lazy_max_modules modules are materialized.  The most recently used
+        subtree is always kept.  Call with _lazy_lock held.
+        """
+        if self.lazy_max_modules is None or self._eviction_paused:
+            return
+        while self._num_materialized > self.lazy_max_modules and len(self._subtrees) > 1:
+            (course_id, location), (system, locations, names) = self._subtrees.popitem(last=False)
+            modules = self.modules[course_id]
+            for loaded_location in locations:
+                modules.pop(loaded_location, None)
+            # the names come back into use when the subtree is loaded again
+            for tag, url_name in names:
+                system.used_names[tag].discard(url_name)
+            self._num_materialized -= len(locations)
+
+            # parents hold on to their loaded children, so let go of those too.
+            # A partial list means the parent is still loading its children
+            # (that's what got us here), so leave that one alone.
+            tracker = self.parent_trackers[course_id]
+            for parent_location in (tracker.parents(location) if tracker.is_known(location) else []):
+                parent = modules.get(parent_location)
+                child_instances = getattr(parent, '_child_instances', None)
+                if child_instances is not None and len(child_instances) == len(parent.children):
+                    parent._child_instances = None
+
     def get_item(self, location, depth=0):
         """
         Returns an XModuleDescriptor instance for the item at location.
@@ -530,11 +781,14 @@ class XMLModuleStore(ModuleStoreBase):
                 if all(goal is None or goal == value for goal, value in zip(location, mod_loc)):
                     items.append(module)
 
-        if course_id is None:
-            for _, modules in self.modules.iteritems():
-                _add_get_items(self, location, modules)
-        else:
-            _add_get_items(self, location, self.modules[course_id])
+        course_ids = self.modules.keys() if course_id is None else [course_id]
+        with self._lazy_lock:
+            for course_id in course_ids:
+                if self.lazy:
+                    self._load_all_deferred(course_id)
+                _add_get_items(self, location, self.modules[course_id])
+            if self.lazy:
+                self._evict_cold_subtrees()
 
         return items
 
@@ -545,6 +799,25 @@ class XMLModuleStore(ModuleStoreBase):
         """
         return self.courses.values()
 
+    def get_path_index(self, course_id):
+        """
+        Returns the path index of course_id.  XML courses don't change once
+        loaded, so it is built once.  Lazy stores don't keep one, as building
+        it would load the whole course.
+        """
+        if self.lazy:
+            return None
+        if course_id not in self._path_indexes:
+            modules = self.modules[course_id]
+
+            def children(url):
+                descriptor = modules.get(Location(url))
+                return [child for child in getattr(descriptor, 'children', []) if Location(child) in modules]
+
+            self._path_indexes[course_id] = compute_path_index(
+                course_id, CourseDescriptor.id_to_location(course_id), children)
+        return self._path_indexes[course_id]
+
     def get_errored_courses(self):
         """
         Return a dictionary of course_dir -> [(msg, exception_str)], for each
@@ -590,6 +863,9 @@ class XMLModuleStore(ModuleStoreBase):
         be empty if there are no parents.
         '''
         location = Location.ensure_fully_specified(location)
+        if self.lazy and not self.parent_trackers[course_id].is_known(location):
+            # only loaded items have their children's parents recorded
+            self.get_instance(course_id, location)
         if not self.parent_trackers[course_id].is_known(location):
             raise ItemNotFoundError("{0} not in {1}".format(location, course_id))
 
@@ -1,6 +1,7 @@
 import logging
 import os
 import mimetypes
+from multiprocessing.pool import ThreadPool
 from lxml.html import rewrite_links as lxml_rewrite_links
 from path import path
 
@@ -14,51 +15,77 @@ from xmodule.errortracker import make_error_tracker
 
 log = logging.getLogger(__name__)
 
+# How many modules to write to the modulestore at once (see ModuleStore.bulk_update_items)
+IMPORT_BATCH_SIZE = 100
+
+# How many static assets to save to the contentstore at the same time
+STATIC_IMPORT_WORKERS = 4
+
 
 def import_static_content(modules, course_loc, course_data_path, static_content_store, target_location_namespace,
-                          subpath='static', verbose=False):
+                          subpath='static', verbose=False, workers=STATIC_IMPORT_WORKERS):
+    """
+    Save all the files under course_data_path/subpath to static_content_store,
+    `workers` at a time.
 
-    remap_dict = {}
+    Returns a dict mapping the path of each file (relative to subpath) to the
+    name of its content location.
+    """
 
     # now import all static assets
     static_dir = course_data_path / subpath
 
     verbose = True
 
-    for dirname, dirnames, filenames in os.walk(static_dir):
-        for filename in filenames:
+    def import_file(content_path):
+        """
+        Save one file, returning (path relative to static_dir, location name)
+        """
+        if verbose:
+            log.debug('importing static content {0}...'.format(content_path))
 
-            try:
-                content_path = os.path.join(dirname, filename)
-                if verbose:
-                    log.debug('importing static content {0}...'.format(content_path))
+        filename = os.path.basename(content_path)
+        fullname_with_subpath = content_path.replace(static_dir, '')  # strip away leading path from the name
+        if fullname_with_subpath.startswith('/'):
+            fullname_with_subpath = fullname_with_subpath[1:]
+        content_loc = StaticContent.compute_location(target_location_namespace.org, target_location_namespace.course, fullname_with_subpath)
+        mime_type = mimetypes.guess_type(filename)[0]
 
-                fullname_with_subpath = content_path.replace(static_dir, '')  # strip away leading path from the name
-                if fullname_with_subpath.startswith('/'):
-                    fullname_with_subpath = fullname_with_subpath[1:]
-                content_loc = StaticContent.compute_location(target_location_namespace.org, target_location_namespace.course, fullname_with_subpath)
-                mime_type = mimetypes.guess_type(filename)[0]
+        with open(content_path, 'rb') as f:
+            data = f.read()
 
-                with open(content_path, 'rb') as f:
-                    data = f.read()
+        content = StaticContent(content_loc, filename, mime_type, data, import_path=fullname_with_subpath)
 
-                content = StaticContent(content_loc, filename, mime_type, data, import_path=fullname_with_subpath)
+        # first let's save a thumbnail so we can get back a thumbnail location
+        (thumbnail_content, thumbnail_location) = static_content_store.generate_thumbnail(content)
 
-                # first let's save a thumbnail so we can get back a thumbnail location
-                (thumbnail_content, thumbnail_location) = static_content_store.generate_thumbnail(content)
+        if thumbnail_content is not None:
+            content.thumbnail_location = thumbnail_location
 
-                if thumbnail_content is not None:
-                    content.thumbnail_location = thumbnail_location
+        #then commit the content
+        static_content_store.save(content)
 
-                #then commit the content
-                static_content_store.save(content)
+        #store the remapping information which will be needed to subsitute in the module data
+        return fullname_with_subpath, content_loc.name
 
-                #store the remapping information which will be needed to subsitute in the module data
-                remap_dict[fullname_with_subpath] = content_loc.name
-            except:
-                raise
+    content_paths = [
+        os.path.join(dirname, filename)
+        for dirname, dirnames, filenames in os.walk(static_dir)
+        for filename in filenames
+    ]
+
+    if workers > 1 and len(content_paths) > 1:
+        # each worker holds one file in memory at a time
+        pool = ThreadPool(min(workers, len(content_paths)))
+        try:
+            results = pool.map(import_file, content_paths)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [import_file(content_path) for content_path in content_paths]
 
-    return remap_dict
+    return dict(results)
 
 
 def verify_content_links(module, base_dir, static_content_store, link, remap_dict=None):
@@ -175,7 +202,7 @@ def import_course_from_xml(modulestore, static_content_store, course_data_path,
 def import_from_xml(store, data_dir, course_dirs=None,
                     default_class='xmodule.raw_module.RawDescriptor',
                     load_error_modules=True, static_content_store=None, target_location_namespace=None,
-                    verbose=False, draft_store=None):
+                    verbose=False, draft_store=None, batch_size=IMPORT_BATCH_SIZE):
     """
     Import the specified xml data_dir into the "store" modulestore,
     using org and course as the location org and course.
@@ -188,6 +215,9 @@ def import_from_xml(store, data_dir, course_dirs=None,
     expects a 'url_name' as an identifier to where things are on disk e.g. ../policies/<url_name>/policy.json as well as metadata keys in
     the policy.json. so we need to keep the original url_name during import
 
+    batch_size is how many modules to write to the store at once.  If it's 0, modules
+    are written one at a time.
+
     """
 
     xml_module_store = XMLModuleStore(
@@ -216,6 +246,7 @@ def import_from_xml(store, data_dir, course_dirs=None,
 
             course_data_path = None
             course_location = None
+            batch = ModuleImportBatch(store, static_content_store, batch_size)
 
             if verbose:
                 log.debug("Scanning {0} for course module...".format(course_id))
@@ -239,7 +270,9 @@ def import_from_xml(store, data_dir, course_dirs=None,
                                        {"type": "discussion", "name": "Discussion"},
                                        {"type": "wiki", "name": "Wiki"}]  # note, add 'progress' when we can support it on Edge
 
-                    import_module(module, store, course_data_path, static_content_store)
+                    batch.add(module, course_data_path)
+                    # the course module has to be in the store before the rest of the course
+                    batch.flush()
 
                     # a bit of a hack, but typically the "course image" which is shown on marketing pages is hard coded to /images/course_image.jpg
                     # so let's make sure we import in case there are no other references to it in the modules
@@ -270,7 +303,9 @@ def import_from_xml(store, data_dir, course_dirs=None,
                 if verbose:
                     log.debug('importing module location {0}'.format(module.location))
 
-                import_module(module, store, course_data_path, static_content_store)
+                batch.add(module, course_data_path)
+
+            batch.flush()
 
             # now import any 'draft' items
             if draft_store is not None:
@@ -279,16 +314,56 @@ def import_from_xml(store, data_dir, course_dirs=None,
                                     else course_location)
 
         finally:
-            # turn back on all write signalling
+            # turn back on all write signalling, and refresh the course and
+            # signal the writes once for the whole import
             if pseudo_course_id in store.ignore_write_events_on_courses:
                 store.ignore_write_events_on_courses.remove(pseudo_course_id)
-                store.refresh_cached_metadata_inheritance_tree(target_location_namespace if
-                                                               target_location_namespace is not None else course_location)
+                imported_location = (target_location_namespace if
+                                     target_location_namespace is not None else course_location)
+                store.refresh_cached_metadata_inheritance_tree(imported_location)
+                store.fire_updated_modulestore_signal(pseudo_course_id, imported_location)
 
     return xml_module_store, course_items
 
 
-def import_module(module, store, course_data_path, static_content_store, allow_not_found=False):
+class ModuleImportBatch(object):
+    """
+    Collects imported modules and writes them to the store batch_size at a
+    time, with ModuleStore.bulk_update_items.  With a batch_size of 0, each
+    module is written as soon as it is added, with import_module.
+    """
+    def __init__(self, store, static_content_store, batch_size=IMPORT_BATCH_SIZE):
+        self.store = store
+        self.static_content_store = static_content_store
+        self.batch_size = batch_size
+        self.items = []
+
+    def add(self, module, course_data_path):
+        """
+        Add module to the batch, writing the batch if it is full
+        """
+        if not self.batch_size:
+            import_module(module, self.store, course_data_path, self.static_content_store)
+            return
+
+        self.items.append((module.location,) + module_import_fields(module, course_data_path, self.static_content_store))
+        if len(self.items) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write all the modules added since the last flush
+        """
+        if self.items:
+            self.store.bulk_update_items(self.items)
+            self.items = []
+
+
+def module_import_fields(module, course_data_path, static_content_store):
+    """
+    Returns the (data, children, metadata) to store for module, importing the
+    static content its data links to.  children is None if the module has none.
+    """
     content = {}
     for field in module.fields:
         if field.scope != Scope.content:
@@ -326,17 +401,27 @@ def import_module(module, store, course_data_path, static_content_store, allow_n
     else:
         module_data = content
 
+    children = None
+    if hasattr(module, 'children') and module.children != []:
+        children = module.children
+
+    # NOTE: It's important to use own_metadata here to avoid writing
+    # inherited metadata everywhere.
+    return module_data, children, dict(own_metadata(module))
+
+
+def import_module(module, store, course_data_path, static_content_store, allow_not_found=False):
+    module_data, children, metadata = module_import_fields(module, course_data_path, static_content_store)
+
     if allow_not_found:
         store.update_item(module.location, module_data, allow_not_found=allow_not_found)
     else:
         store.update_item(module.location, module_data)
 
-    if hasattr(module, 'children') and module.children != []:
-        store.update_children(module.location, module.children)
+    if children is not None:
+        store.update_children(module.location, children)
 
-    # NOTE: It's important to use own_metadata here to avoid writing
-    # inherited metadata everywhere.
-    store.update_metadata(module.location, dict(own_metadata(module)))
+    store.update_metadata(module.location, metadata)
 
 
 def import_course_draft(xml_module_store, store, draft_store, course_data_path, static_content_store, target_location_namespace):
@@ -6,7 +6,9 @@ from datetime import datetime, timedelta
 from functools import partial
 
 from django.conf import settings
-from django.contrib.auth.models import Group
+from django.contrib.auth.models import Group, User
+from django.db.models.signals import m2m_changed, post_delete
+from django.dispatch import receiver
 
 from xmodule.course_module import CourseDescriptor
 from xmodule.error_module import ErrorDescriptor
@@ -16,10 +18,14 @@ from xmodule.x_module import XModule, XModuleDescriptor
 from student.models import CourseEnrollmentAllowed
 from external_auth.models import ExternalAuthMap
 from courseware.masquerade import is_masquerading_as_student
+from request_cache.middleware import RequestCache
 from django.utils.timezone import UTC
 
 DEBUG_ACCESS = False
 
+# the key of the access caches in the request cache
+ACCESS_CACHE_KEY = 'courseware.access'
+
 log = logging.getLogger(__name__)
 
 
@@ -107,6 +113,57 @@ def get_access_group_name(obj, action):
 
 
 # ================ Implementation helpers ================================
+def _access_cache_for(user):
+    """
+    Returns the access cache of user for this request: a dict with the names
+    of the user's groups ('group_names', once they've been looked up) and the
+    group access decisions made for them ('decisions').
+
+    Outside of requests (in tests, tasks and commands), nothing would clear
+    the cache, so a fresh entry is returned every time.  Entries are only
+    used for the user object they were made for.
+    """
+    if RequestCache.in_request():
+        caches = RequestCache.get_request_cache().data.setdefault(ACCESS_CACHE_KEY, {})
+    else:
+        caches = {}
+    entry = caches.get(user.id)
+    if entry is None or entry['user'] is not user:
+        entry = caches[user.id] = {'user': user, 'group_names': None, 'decisions': {}}
+    return entry
+
+
+def _user_group_names(user):
+    """
+    Returns the set of the names of the groups user is in, looking them up
+    at most once a request
+    """
+    entry = _access_cache_for(user)
+    if entry['group_names'] is None:
+        entry['group_names'] = frozenset(g.name for g in user.groups.all())
+    return entry['group_names']
+
+
+def clear_access_cache():
+    """
+    Drop the group names and access decisions cached for this request.
+    Called whenever group membership changes.
+    """
+    data = getattr(RequestCache.get_request_cache(), 'data', None)
+    if data is not None:
+        data.pop(ACCESS_CACHE_KEY, None)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def _group_membership_changed(sender, **kwargs):
+    clear_access_cache()
+
+
+@receiver(post_delete, sender=Group)
+def _group_deleted(sender, **kwargs):
+    clear_access_cache()
+
+
 def _has_access_course_desc(user, course, action):
     """
     Check if user has access to a course descriptor.
@@ -518,10 +575,8 @@ def _adjust_start_date_for_beta_testers(user, descriptor):
         # bail early if no beta testing is set up
         return descriptor.lms.start
 
-    user_groups = [g.name for g in user.groups.all()]
-
     beta_group = course_beta_test_group_name(descriptor.location)
-    if beta_group in user_groups:
+    if beta_group in _user_group_names(user):
         debug("Adjust start time: user in group %s", beta_group)
         start_as_datetime = descriptor.lms.start
         delta = timedelta(descriptor.lms.days_early_for_beta)
@@ -567,7 +622,23 @@ def _has_access_to_location(user, location, access_level, course_context):
         return True
 
     # If not global staff, is the user in the Auth group for this class?
-    user_groups = [g.name for g in user.groups.all()]
+    # The answer only depends on the user's groups and the names of the groups
+    # with access, so it's only worked out once a request for each set of names.
+    loc = Location(location)
+    course_name = loc.name if loc.category == 'course' else None
+    decision_key = (access_level, loc.org, loc.course, course_name, course_context)
+    decisions = _access_cache_for(user)['decisions']
+    if decision_key not in decisions:
+        decisions[decision_key] = _in_access_groups(user, location, access_level, course_context)
+    return decisions[decision_key]
+
+
+def _in_access_groups(user, location, access_level, course_context):
+    """
+    Returns True if user is in one of the groups with access_level access to
+    location.  See _has_access_to_location.
+    """
+    user_groups = _user_group_names(user)
 
     if access_level == 'staff':
         staff_groups = group_names_for_staff(location, course_context) + \
@@ -0,0 +1,271 @@
+"""
+Persistent per-section score store used by courseware.grades.
+
+Grading a student from scratch means walking the course's grading context,
+building a ModelDataCache and possibly instantiating an XModule for every
+scored module.  When MITX_FEATURES['ENABLE_PERSISTENT_GRADES'] is set, the
+scores computed for each graded section are saved in StudentSectionScore, and
+later calls to grades.grade() only recompute sections whose row is missing or
+has been marked stale.
+
+Rows are marked stale when:
+    - a module in the section publishes a new grade (module_render.publish)
+    - a StudentModule for a module in the section is created or deleted
+
+Marking a row stale also bumps its invalidation count.  grade() reads the
+counts before it reads any student state, and only stores the scores it
+computes if the count hasn't moved since, so a grade published while the
+section was being graded isn't overwritten with the older scores.  Rows for
+sections being graded for the first time are created, stale, beforehand.
+
+Rows also record the content version of their section: a hash of the scored
+modules in it, with their names, weights and content.  Rows stored for another
+version of the section, from before the course was changed, are ignored and
+recomputed.
+
+Mapping a module back to its section uses a module -> section map derived from
+course.grading_context, kept in the django cache along with the content
+version of the course it was built for.  If that map isn't available, every
+row for the (student, course) pair is marked stale instead.
+"""
+import hashlib
+import json
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from xmodule.graders import Score
+
+from .models import StudentModule, StudentSectionScore
+
+log = logging.getLogger(__name__)
+
+SECTION_MAP_CACHE_TIMEOUT = 60 * 60  # seconds
+
+
+def persistent_grades_enabled():
+    """
+    Returns True if section scores should be read from and written to the store.
+    """
+    return settings.MITX_FEATURES.get('ENABLE_PERSISTENT_GRADES', False)
+
+
+def _section_map_cache_key(course_id):
+    return u'courseware.grade_store.section_map.{0}'.format(course_id)
+
+
+def section_content_version(section):
+    """
+    Returns the content version of `section`, one of the graded sections of
+    a course.grading_context: a hash of everything its scores depend on
+    besides student state.  It's worked out once per grading context.
+    """
+    version = section.get('content_version')
+    if version is None:
+        digest = hashlib.sha1()
+        for descriptor in section['xmoduledescriptors']:
+            digest.update(json.dumps([
+                descriptor.location.url(),
+                descriptor.display_name_with_default,
+                descriptor.lms.graded,
+                getattr(descriptor, 'weight', None),
+                getattr(descriptor, 'data', None),
+            ], default=unicode))
+        version = section['content_version'] = digest.hexdigest()
+    return version
+
+
+def content_versions(course):
+    """
+    Returns a dict of section location url -> content version for every
+    graded section of `course`
+    """
+    return dict(
+        (section['section_descriptor'].location.url(), section_content_version(section))
+        for sections in course.grading_context['graded_sections'].itervalues()
+        for section in sections
+    )
+
+
+def cache_section_map(course, versions=None):
+    """
+    Make sure the module -> section map for the current content of `course`
+    (whose content_versions() may be passed in as `versions`) is in the
+    django cache.
+
+    The map is keyed by the location url of every scored module (and every
+    graded section) and gives the location url of the graded section it
+    belongs to.
+    """
+    if versions is None:
+        versions = content_versions(course)
+    course_version = hashlib.sha1(json.dumps(sorted(versions.items()))).hexdigest()
+
+    key = _section_map_cache_key(course.id)
+    cached = cache.get(key)
+    if cached is not None and cached['version'] == course_version:
+        return
+
+    section_map = {}
+    for sections in course.grading_context['graded_sections'].itervalues():
+        for section in sections:
+            section_url = section['section_descriptor'].location.url()
+            section_map[section_url] = section_url
+            for descriptor in section['xmoduledescriptors']:
+                section_map[descriptor.location.url()] = section_url
+
+    cache.set(key, {'version': course_version, 'map': section_map}, SECTION_MAP_CACHE_TIMEOUT)
+
+
+def clear_section_map(course_id):
+    """
+    Drop the cached module -> section map for `course_id`, e.g. after the
+    course structure has been changed.
+    """
+    cache.delete(_section_map_cache_key(course_id))
+
+
+def get_section_scores(student, course_id, versions=None, invalidations=None):
+    """
+    Returns a dict of section location url -> list of Scores (or None if the
+    student hasn't seen the section) for every non-stale row stored for
+    `student` in `course_id`.  If a dict of section location url -> content
+    version is given as `versions`, only rows stored for those versions of
+    their sections are returned.
+
+    If a dict is given as `invalidations`, the invalidation count of every
+    row, stale or not, is added to it by section location url.
+    """
+    section_scores = {}
+    rows = StudentSectionScore.objects.filter(
+        student=student,
+        course_id=course_id,
+    ).values_list('section_location', 'scores', 'content_version', 'stale', 'invalidations')
+
+    for section_location, scores, content_version, stale, row_invalidations in rows:
+        if invalidations is not None:
+            invalidations[section_location] = row_invalidations
+        if stale or (versions is not None and versions.get(section_location) != content_version):
+            continue
+        decoded = json.loads(scores) if scores is not None else None
+        if decoded is not None:
+            decoded = [Score(*score) for score in decoded]
+        section_scores[section_location] = decoded
+
+    return section_scores
+
+
+def add_section_rows(student, course_id, section_locations, invalidations):
+    """
+    Create a stale row for each of `section_locations` that `student` has
+    none for yet, adding their invalidation counts to `invalidations`.  Call
+    it before reading the state the scores are computed from, so that the
+    scores can be stored with set_section_scores(invalidations=...).
+    """
+    for section_location in section_locations:
+        row, _ = StudentSectionScore.objects.get_or_create(
+            student=student,
+            course_id=course_id,
+            section_location=section_location,
+            defaults={'stale': True},
+        )
+        invalidations[section_location] = row.invalidations
+
+
+def set_section_scores(student, course_id, section_location, scores, content_version='', invalidations=None):
+    """
+    Store the list of Scores (or None, for an unseen section) computed for
+    `section_location` at `content_version`, clearing any stale flag on it.
+
+    If the invalidation count of the row, read before the state the scores
+    were computed from, is given as `invalidations`, the scores are only
+    stored if the row hasn't been invalidated since, and never create a row.
+    Returns whether they were stored.
+    """
+    encoded = json.dumps([list(score) for score in scores]) if scores is not None else None
+    if invalidations is not None:
+        updated = StudentSectionScore.objects.filter(
+            student=student,
+            course_id=course_id,
+            section_location=section_location,
+            invalidations=invalidations,
+        ).update(scores=encoded, content_version=content_version, stale=False, modified=timezone.now())
+        return updated > 0
+
+    row, created = StudentSectionScore.objects.get_or_create(
+        student=student,
+        course_id=course_id,
+        section_location=section_location,
+        defaults={'scores': encoded, 'content_version': content_version},
+    )
+    if not created:
+        row.scores = encoded
+        row.content_version = content_version
+        row.stale = False
+        row.save()
+    return True
+
+
+def delete_section_scores(course_id, student=None):
+    """
+    Remove all stored section scores for `course_id`, optionally only those
+    belonging to `student`.
+    """
+    rows = StudentSectionScore.objects.filter(course_id=course_id)
+    if student is not None:
+        rows = rows.filter(student=student)
+    rows.delete()
+
+
+def invalidate_module(student_id, course_id, module_state_key):
+    """
+    Mark stale the stored score of the section containing `module_state_key`
+    for the given student.  Does nothing if the module isn't graded.
+    """
+    invalidate_modules([student_id], course_id, module_state_key)
+
+
+def invalidate_modules(student_ids, course_id, module_state_key):
+    """
+    Mark stale the stored scores of the section containing `module_state_key`
+    for all of the given students, with one query.  Does nothing if the
+    module isn't graded.
+    """
+    if not persistent_grades_enabled():
+        return
+
+    rows = StudentSectionScore.objects.filter(student__id__in=student_ids, course_id=course_id)
+
+    cached = cache.get(_section_map_cache_key(course_id))
+    if cached is not None:
+        section_location = cached['map'].get(module_state_key)
+        if section_location is None:
+            return
+        rows = rows.filter(section_location=section_location)
+
+    rows.update(stale=True, invalidations=F('invalidations') + 1)
+
+
+@receiver(post_save, sender=StudentModule)
+def invalidate_on_create(sender, instance, created, **kwargs):
+    """
+    A section without any StudentModule is stored as unseen, so creating one
+    has to invalidate the section.  Later saves go through publish() if they
+    change the grade.
+    """
+    if created:
+        invalidate_module(instance.student_id, instance.course_id, instance.module_state_key)
+
+
+@receiver(post_delete, sender=StudentModule)
+def invalidate_on_delete(sender, instance, **kwargs):
+    """
+    Deleting student state (e.g. from the instructor dashboard) resets the
+    score of the module.
+    """
+    invalidate_module(instance.student_id, instance.course_id, instance.module_state_key)
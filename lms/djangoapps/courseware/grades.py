@@ -1,14 +1,16 @@
 # Compute grades using real division, with no integer truncation
 from __future__ import division
 
-import random
+import json
 import logging
+import multiprocessing
+import random
 
-from collections import defaultdict
+from collections import defaultdict, deque
 from django.conf import settings
-from django.contrib.auth.models import User
 
-from .model_data import ModelDataCache, LmsKeyValueStore
+from . import grade_store
+from .model_data import ModelDataCache, LmsKeyValueStore, chunks
 from xblock.core import Scope
 from .module_render import get_module, get_module_for_descriptor
 from xmodule import graders
@@ -50,18 +52,19 @@ def yield_dynamic_descriptor_descendents(descriptor, module_creator):
         yield next_descriptor
 
 
-def yield_problems(request, course, student):
+def yield_problems(request, course, student, model_data_cache=None):
     """
     Return an iterator over capa_modules that this student has
     potentially answered.  (all that student has answered will definitely be in
     the list, but there may be others as well).
+
+    If a `model_data_cache` holding the student's state for the course's
+    graded descriptors is passed in, no further queries are made for it.
     """
     grading_context = course.grading_context
 
-    descriptor_locations = (descriptor.location.url() for descriptor in grading_context['all_descriptors'])
-    existing_student_modules = set(StudentModule.objects.filter(
-        module_state_key__in=descriptor_locations
-    ).values_list('module_state_key', flat=True))
+    if model_data_cache is None:
+        model_data_cache = ModelDataCache(grading_context['all_descriptors'], course.id, student)
 
     sections_to_list = []
     for _, sections in grading_context['graded_sections'].iteritems():
@@ -71,11 +74,16 @@ def yield_problems(request, course, student):
 
             # If the student hasn't seen a single problem in the section, skip it.
             for moduledescriptor in section['xmoduledescriptors']:
-                if moduledescriptor.location.url() in existing_student_modules:
+                key = LmsKeyValueStore.Key(
+                    Scope.user_state,
+                    student.id,
+                    moduledescriptor.location,
+                    None
+                )
+                if model_data_cache.find(key):
                     sections_to_list.append(section_descriptor)
                     break
 
-    model_data_cache = ModelDataCache(sections_to_list, course.id, student)
     for section_descriptor in sections_to_list:
         section_module = get_module(student, request,
                                     section_descriptor.location, model_data_cache,
@@ -92,7 +100,64 @@ def yield_problems(request, course, student):
                 yield problem
 
 
-def answer_distributions(request, course):
+# Number of StudentModule rows read (and counted) at a time by answer_distributions
+ANSWER_DISTRIBUTION_CHUNK_SIZE = 1000
+
+# Number of problems whose StudentModules are read by one query
+ANSWER_DISTRIBUTION_KEYS_PER_QUERY = 100
+
+
+def _answer_states(course_id, module_state_keys, chunk_size):
+    """
+    Yields the (module_state_key, state) of enrolled students' StudentModules
+    in course_id for module_state_keys, in lists of up to chunk_size
+    """
+    for key_chunk in chunks(module_state_keys, ANSWER_DISTRIBUTION_KEYS_PER_QUERY):
+        student_modules = StudentModule.objects.filter(
+            course_id=course_id,
+            module_state_key__in=key_chunk,
+            student__courseenrollment__course_id=course_id,
+        ).order_by('id')
+        last_id = 0
+        while True:
+            rows = list(student_modules.filter(id__gt=last_id).values_list(
+                'id', 'module_state_key', 'state')[:chunk_size])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            yield [(module_state_key, state) for _, module_state_key, state in rows]
+
+
+def _answer_text(answer):
+    """
+    Answers can be lists or other unhashable values; count them by their text
+    """
+    if isinstance(answer, basestring):
+        return answer
+    return str(answer)
+
+
+def _count_answers(states):
+    """
+    Counts the student_answers in a list of (module_state_key, state).
+
+    Returns a dict: (module_state_key, answer id, answer) -> count.  This is
+    run in the worker processes of answer_distributions, so it mustn't touch
+    the database.
+    """
+    counts = defaultdict(int)
+    for module_state_key, state in states:
+        try:
+            student_answers = json.loads(state).get('student_answers') or {}
+        except (TypeError, ValueError, AttributeError):
+            log.warning("Skipping unreadable state for %s", module_state_key)
+            continue
+        for answer_id, answer in student_answers.iteritems():
+            counts[(module_state_key, answer_id, _answer_text(answer))] += 1
+    return dict(counts)
+
+
+def answer_distributions(course, num_processes=1, chunk_size=ANSWER_DISTRIBUTION_CHUNK_SIZE):
     """
     Given a course_descriptor, compute frequencies of answers for each problem:
 
@@ -100,26 +165,50 @@ def answer_distributions(request, course):
 
     dict: (problem url_name, problem display_name, problem_id) -> (dict : answer ->  count)
 
-    TODO (vshnayder): this is currently doing a full linear pass through all
-    students and all problems.  This will be just a little slow.
+    The answers are read straight from the stored state of enrolled students'
+    problems, without loading any modules.  StudentModules are read
+    `chunk_size` at a time; if `num_processes` is more than one, the chunks
+    are counted by a pool of that many worker processes while the next ones
+    are read.
     """
-
+    problems = dict(
+        (descriptor.location.url(), descriptor)
+        for descriptor in course.grading_context['all_descriptors']
+        if descriptor.location.category == 'problem'
+    )
     counts = defaultdict(lambda: defaultdict(int))
 
-    enrolled_students = User.objects.filter(courseenrollment__course_id=course.id)
-
-    for student in enrolled_students:
-        for capa_module in yield_problems(request, course, student):
-            for problem_id in capa_module.lcp.student_answers:
-                # Answer can be a list or some other unhashable element.  Convert to string.
-                answer = str(capa_module.lcp.student_answers[problem_id])
-                key = (capa_module.url_name, capa_module.display_name_with_default, problem_id)
-                counts[key][answer] += 1
+    def add(chunk_counts):
+        for (module_state_key, problem_id, answer), count in chunk_counts.iteritems():
+            problem = problems[module_state_key]
+            counts[(problem.url_name, problem.display_name_with_default, problem_id)][answer] += count
+
+    state_chunks = _answer_states(course.id, problems.keys(), chunk_size)
+    if num_processes > 1:
+        # The workers only decode state they're handed, so our database
+        # connection can stay open across the fork.  Chunks are read here,
+        # not by the pool's feeder thread, which would need a connection of
+        # its own; a few are kept in flight so reading and counting overlap.
+        pool = multiprocessing.Pool(num_processes)
+        try:
+            pending = deque()
+            for states in state_chunks:
+                pending.append(pool.apply_async(_count_answers, (states,)))
+                if len(pending) > 2 * num_processes:
+                    add(pending.popleft().get())
+            while pending:
+                add(pending.popleft().get())
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for states in state_chunks:
+            add(_count_answers(states))
 
     return counts
 
 
-def grade(student, request, course, model_data_cache=None, keep_raw_scores=False):
+def grade(student, request, course, model_data_cache=None, keep_raw_scores=False, use_persisted=True):
     """
     This grades a student as quickly as possible. It returns the
     output from the course grader, augmented with the final letter
@@ -134,15 +223,33 @@ def grade(student, request, course, model_data_cache=None, keep_raw_scores=False
     - grade_breakdown : A breakdown of the major components that
         make up the final grade. (For display)
     - keep_raw_scores : if True, then value for key 'raw_scores' contains scores for every graded module
+    - use_persisted : if False, ignore the persistent section score store and
+        grade every section from scratch (see courseware.grade_store)
+
+    Recomputed sections are only stored if no grade in them changed while they
+    were being graded, including, for a model_data_cache passed in, since it
+    was read.
 
     More information on the format is in the docstring for CourseGrader.
     """
 
     grading_context = course.grading_context
     raw_scores = []
-
-    if model_data_cache is None:
-        model_data_cache = ModelDataCache(grading_context['all_descriptors'], course.id, student)
+    cache_passed_in = model_data_cache is not None
+    regraded = None
+
+    use_store = (use_persisted and grade_store.persistent_grades_enabled() and
+                 student.is_authenticated() and not settings.GENERATE_PROFILE_SCORES)
+    if use_store:
+        versions = grade_store.content_versions(course)
+        grade_store.cache_section_map(course, versions)
+        invalidations = {}
+        persisted_scores = grade_store.get_section_scores(student, course.id, versions, invalidations)
+        grade_store.add_section_rows(
+            student, course.id, [url for url in versions if url not in invalidations], invalidations
+        )
+    else:
+        persisted_scores = {}
 
     totaled_scores = {}
     # This next complicated loop is just to collect the totaled_scores, which is
@@ -152,56 +259,35 @@ def grade(student, request, course, model_data_cache=None, keep_raw_scores=False
         for section in sections:
             section_descriptor = section['section_descriptor']
             section_name = section_descriptor.display_name_with_default
+            section_location = section_descriptor.location.url()
 
-            should_grade_section = False
-            # If we haven't seen a single problem in the section, we don't have to grade it at all! We can assume 0%
-            for moduledescriptor in section['xmoduledescriptors']:
-                # some problems have state that is updated independently of interaction
-                # with the LMS, so they need to always be scored. (E.g. foldit.)
-                if moduledescriptor.always_recalculate_grades:
-                    should_grade_section = True
-                    break
+            if section_location in persisted_scores:
+                scores = persisted_scores[section_location]
+            else:
+                # Only build the ModelDataCache once we know that some section
+                # can't be served from the store
+                if model_data_cache is None:
+                    model_data_cache = ModelDataCache(grading_context['all_descriptors'], course.id, student)
 
-                # Create a fake key to pull out a StudentModule object from the ModelDataCache
+                scores = _grade_section(student, request, course, section, model_data_cache)
 
-                key = LmsKeyValueStore.Key(
-                    Scope.user_state,
-                    student.id,
-                    moduledescriptor.location,
-                    None
+                # Sections that always need recalculating can't be persisted
+                always_recalculate = any(
+                    descriptor.always_recalculate_grades for descriptor in section['xmoduledescriptors']
                 )
-                if model_data_cache.find(key):
-                    should_grade_section = True
-                    break
-
-            if should_grade_section:
-                scores = []
-
-                def create_module(descriptor):
-                    '''creates an XModule instance given a descriptor'''
-                    # TODO: We need the request to pass into here. If we could forego that, our arguments
-                    # would be simpler
-                    return get_module_for_descriptor(student, request, descriptor, model_data_cache, course.id)
-
-                for module_descriptor in yield_dynamic_descriptor_descendents(section_descriptor, create_module):
-
-                    (correct, total) = get_score(course.id, student, module_descriptor, create_module, model_data_cache)
-                    if correct is None and total is None:
-                        continue
-
-                    if settings.GENERATE_PROFILE_SCORES:  	# for debugging!
-                        if total > 1:
-                            correct = random.randrange(max(total - 2, 1), total + 1)
-                        else:
-                            correct = total
-
-                    graded = module_descriptor.lms.graded
-                    if not total > 0:
-                        #We simply cannot grade a problem that is 12/0, because we might need it as a percentage
-                        graded = False
-
-                    scores.append(Score(correct, total, graded, module_descriptor.display_name_with_default))
-
+                if use_store and not always_recalculate:
+                    if regraded is None:
+                        # a cache passed in may have been read before the
+                        # invalidation counts were, so they can't tell if a
+                        # grade has changed in between
+                        regraded = (_regraded_since_read(student, course.id, model_data_cache)
+                                    if cache_passed_in else set())
+                    if not regraded.intersection(descriptor.location.url()
+                                                 for descriptor in section['xmoduledescriptors']):
+                        grade_store.set_section_scores(student, course.id, section_location, scores,
+                                                       versions[section_location], invalidations[section_location])
+
+            if scores is not None:
                 _, graded_total = graders.aggregate_scores(scores, section_name)
                 if keep_raw_scores:
                     raw_scores += scores
@@ -232,6 +318,131 @@ def grade(student, request, course, model_data_cache=None, keep_raw_scores=False
     return grade_summary
 
 
+def _regraded_since_read(student, course_id, model_data_cache):
+    """
+    Returns the location urls of the modules of `student` in `course_id`
+    whose StudentModule has been created, deleted or given a new grade since
+    model_data_cache read it
+    """
+    regraded = set()
+    cached = dict(
+        (key[1], field_object) for key, field_object in model_data_cache.cache.items()
+        if key[0] == Scope.user_state
+    )
+    rows = StudentModule.objects.filter(student=student, course_id=course_id).values_list(
+        'module_state_key', 'grade', 'max_grade'
+    )
+    for module_state_key, grade, max_grade in rows:
+        student_module = cached.pop(module_state_key, None)
+        if student_module is None or (student_module.grade, student_module.max_grade) != (grade, max_grade):
+            regraded.add(module_state_key)
+    regraded.update(cached)
+    return regraded
+
+
+def _grade_section(student, request, course, section, model_data_cache):
+    """
+    Compute the list of Scores for every scored module in one graded section
+    of the course's grading context.
+
+    Returns None if the student hasn't seen a single problem in the section,
+    in which case it can be treated as 0%.
+    """
+    section_descriptor = section['section_descriptor']
+
+    should_grade_section = False
+    # If we haven't seen a single problem in the section, we don't have to grade it at all! We can assume 0%
+    for moduledescriptor in section['xmoduledescriptors']:
+        # some problems have state that is updated independently of interaction
+        # with the LMS, so they need to always be scored. (E.g. foldit.)
+        if moduledescriptor.always_recalculate_grades:
+            should_grade_section = True
+            break
+
+        # Create a fake key to pull out a StudentModule object from the ModelDataCache
+
+        key = LmsKeyValueStore.Key(
+            Scope.user_state,
+            student.id,
+            moduledescriptor.location,
+            None
+        )
+        if model_data_cache.find(key):
+            should_grade_section = True
+            break
+
+    if not should_grade_section:
+        return None
+
+    scores = []
+
+    def create_module(descriptor):
+        '''creates an XModule instance given a descriptor'''
+        # TODO: We need the request to pass into here. If we could forego that, our arguments
+        # would be simpler
+        return get_module_for_descriptor(student, request, descriptor, model_data_cache, course.id)
+
+    for module_descriptor in yield_dynamic_descriptor_descendents(section_descriptor, create_module):
+
+        (correct, total) = get_score(course.id, student, module_descriptor, create_module, model_data_cache)
+        if correct is None and total is None:
+            continue
+
+        if settings.GENERATE_PROFILE_SCORES:  	# for debugging!
+            if total > 1:
+                correct = random.randrange(max(total - 2, 1), total + 1)
+            else:
+                correct = total
+
+        graded = module_descriptor.lms.graded
+        if not total > 0:
+            #We simply cannot grade a problem that is 12/0, because we might need it as a percentage
+            graded = False
+
+        scores.append(Score(correct, total, graded, module_descriptor.display_name_with_default))
+
+    return scores
+
+
+def check_persisted_grade(student, request, course):
+    """
+    Compare the section scores held in the persistent store for `student`
+    against a full recomputation.
+
+    Returns a list of (section location url, persisted Scores, computed Scores)
+    for every section whose stored scores are stale, missing or different.
+    """
+    versions = grade_store.content_versions(course)
+    grade_store.cache_section_map(course, versions)
+    persisted_scores = grade_store.get_section_scores(student, course.id, versions)
+    model_data_cache = ModelDataCache(course.grading_context['all_descriptors'], course.id, student)
+
+    mismatches = []
+    for sections in course.grading_context['graded_sections'].itervalues():
+        for section in sections:
+            section_location = section['section_descriptor'].location.url()
+            computed = _grade_section(student, request, course, section, model_data_cache)
+            if section_location not in persisted_scores:
+                mismatches.append((section_location, None, computed))
+                continue
+
+            persisted = persisted_scores[section_location]
+            if _score_tuples(persisted) != _score_tuples(computed):
+                mismatches.append((section_location, persisted, computed))
+
+    return mismatches
+
+
+def _score_tuples(scores):
+    """
+    Reduce a list of Scores to comparable (earned, possible, graded) tuples,
+    ignoring display names.
+    """
+    if scores is None:
+        return None
+    return [(float(score.earned), float(score.possible), bool(score.graded)) for score in scores]
+
+
 def grade_for_percentage(grade_cutoffs, percentage):
     """
     Returns a letter grade as defined in grading_policy (e.g. 'A' 'B' 'C' for 6.002x) or None.
@@ -0,0 +1,96 @@
+'''
+Rebuild the persistent section scores (courseware.grade_store) for every
+student enrolled in a course, or check the stored scores against a full
+recomputation of each student's grade.
+'''
+
+import logging
+from optparse import make_option
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from courseware import grades, grade_store
+from courseware.courses import get_course_by_id
+
+LOG = logging.getLogger(__name__)
+
+
+class DummyRequest(object):
+    '''Minimal stand-in for the request that grades.grade() passes along to get_module'''
+    META = {}
+    session = {}
+    user = None
+
+    def get_host(self):
+        return 'edx.mit.edu'
+
+    def is_secure(self):
+        return False
+
+
+class Command(BaseCommand):
+    '''
+    Usage: backfill_section_scores course_id [--check]
+
+    Without --check, all stored section scores for the course are deleted and
+    recomputed from StudentModule state.  With --check, nothing is written and
+    every section whose stored scores differ from a full computation is reported.
+    '''
+
+    args = "<course_id>"
+    help = "Rebuild (or, with --check, verify) the persisted section scores for a course."
+
+    option_list = BaseCommand.option_list + (
+        make_option('--check',
+                    action='store_true',
+                    dest='check',
+                    default=False,
+                    help='Compare the stored scores with a full recomputation instead of rebuilding them.'), )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("backfill_section_scores requires one argument: <course_id>")
+
+        if not grade_store.persistent_grades_enabled():
+            raise CommandError("MITX_FEATURES['ENABLE_PERSISTENT_GRADES'] is not set")
+
+        course = get_course_by_id(args[0])
+        enrolled_students = User.objects.filter(courseenrollment__course_id=course.id).order_by('username')
+        request = DummyRequest()
+
+        # The course structure may have changed since the section map was cached
+        grade_store.clear_section_map(course.id)
+
+        if options['check']:
+            self.check_course(course, enrolled_students, request)
+        else:
+            self.rebuild_course(course, enrolled_students, request)
+
+    def rebuild_course(self, course, enrolled_students, request):
+        '''Delete and recompute the stored section scores for every enrolled student'''
+        num_students = 0
+        for student in enrolled_students:
+            grade_store.delete_section_scores(course.id, student)
+            grades.grade(student, request, course)
+            num_students += 1
+
+        LOG.info("Rebuilt section scores for {0} students in {1}".format(num_students, course.id))
+
+    def check_course(self, course, enrolled_students, request):
+        '''Report every section whose stored scores don't match a full computation'''
+        num_students = 0
+        num_mismatches = 0
+        for student in enrolled_students:
+            num_students += 1
+            for section_location, persisted, computed in grades.check_persisted_grade(student, request, course):
+                num_mismatches += 1
+                LOG.warning("Section scores for {student} in {section} don't match: "
+                            "stored {persisted}, computed {computed}".format(
+                                student=student.username,
+                                section=section_location,
+                                persisted=persisted,
+                                computed=computed))
+
+        LOG.info("Checked section scores for {0} students in {1}: {2} mismatches".format(
+            num_students, course.id, num_mismatches))
@@ -3,10 +3,15 @@ Classes to provide the LMS runtime data storage to XBlocks
 """
 
 import json
-from collections import namedtuple, defaultdict
+from collections import namedtuple, defaultdict, OrderedDict
 from itertools import chain
+
+from django.db import IntegrityError, transaction
+
+from . import grade_store
 from .models import (
     StudentModule,
+    StudentModuleHistory,
     XModuleContentField,
     XModuleSettingsField,
     XModuleStudentPrefsField,
@@ -32,12 +37,37 @@ def chunks(items, chunk_size):
     return (items[i:i + chunk_size] for i in xrange(0, len(items), chunk_size))
 
 
+def get_child_descriptors(descriptor, depth=None, descriptor_filter=lambda descriptor: True):
+    """
+    Return a list of all child descriptors down to the specified depth
+    that match the descriptor filter. Includes `descriptor`
+
+    descriptor: The parent to search inside
+    depth: The number of levels to descend, or None for infinite depth
+    descriptor_filter(descriptor): A function that returns True
+        if descriptor should be included in the results
+    """
+    if descriptor_filter(descriptor):
+        descriptors = [descriptor]
+    else:
+        descriptors = []
+
+    if depth is None or depth > 0:
+        new_depth = depth - 1 if depth is not None else depth
+
+        for child in descriptor.get_children() + descriptor.get_required_module_descriptors():
+            descriptors.extend(get_child_descriptors(child, new_depth, descriptor_filter))
+
+    return descriptors
+
+
 class ModelDataCache(object):
     """
     A cache of django model objects needed to supply the data
     for a module and its decendants
     """
-    def __init__(self, descriptors, course_id, user, select_for_update=False):
+    def __init__(self, descriptors, course_id, user, select_for_update=False, cache=None,
+                 defer_writes=False):
         '''
         Find any courseware.models objects that are needed by any descriptor
         in descriptors. Attempts to minimize the number of queries to the database.
@@ -49,14 +79,25 @@ class ModelDataCache(object):
         course_id: The id of the current course
         user: The user for which to cache data
         select_for_update: True if rows should be locked until end of transaction
+        cache: An already populated cache (see MultiUserModelDataCache). If
+            supplied, the database isn't queried.
+        defer_writes: If True, objects are only written to the database when
+            flush() is called (see save())
         '''
         self.cache = {}
         self.descriptors = descriptors
         self.select_for_update = select_for_update
         self.course_id = course_id
         self.user = user
-
-        if user.is_authenticated():
+        self.defer_writes = defer_writes
+        self._dirty = OrderedDict()
+        self._states = {}
+        self._changed_states = set()
+        self._regraded = OrderedDict()
+
+        if cache is not None:
+            self.cache = cache
+        elif user.is_authenticated():
             for scope, fields in self._fields_to_cache().items():
                 for field_object in self._retrieve_fields(scope, fields):
                     self.cache[self._cache_key_from_field_object(scope, field_object)] = field_object
@@ -64,7 +105,7 @@ class ModelDataCache(object):
     @classmethod
     def cache_for_descriptor_descendents(cls, course_id, user, descriptor, depth=None,
                                          descriptor_filter=lambda descriptor: True,
-                                         select_for_update=False):
+                                         select_for_update=False, defer_writes=False):
         """
         course_id: the course in the context of which we want StudentModules.
         user: the django user for whom to load modules.
@@ -74,34 +115,12 @@ class ModelDataCache(object):
         descriptor_filter is a function that accepts a descriptor and return wether the StudentModule
             should be cached
         select_for_update: Flag indicating whether the rows should be locked until end of transaction
+        defer_writes: Flag indicating whether writes should wait for flush()
         """
 
-        def get_child_descriptors(descriptor, depth, descriptor_filter):
-            """
-            Return a list of all child descriptors down to the specified depth
-            that match the descriptor filter. Includes `descriptor`
-
-            descriptor: The parent to search inside
-            depth: The number of levels to descend, or None for infinite depth
-            descriptor_filter(descriptor): A function that returns True
-                if descriptor should be included in the results
-            """
-            if descriptor_filter(descriptor):
-                descriptors = [descriptor]
-            else:
-                descriptors = []
-
-            if depth is None or depth > 0:
-                new_depth = depth - 1 if depth is not None else depth
-
-                for child in descriptor.get_children() + descriptor.get_required_module_descriptors():
-                    descriptors.extend(get_child_descriptors(child, new_depth, descriptor_filter))
-
-            return descriptors
-
         descriptors = get_child_descriptors(descriptor, depth, descriptor_filter)
 
-        return ModelDataCache(descriptors, course_id, user, select_for_update)
+        return ModelDataCache(descriptors, course_id, user, select_for_update, defer_writes=defer_writes)
 
     def _query(self, model_class, **kwargs):
         """
@@ -237,7 +256,17 @@ class ModelDataCache(object):
         if field_object is not None:
             return field_object
 
-        if key.scope == Scope.user_state:
+        if key.scope == Scope.user_state and self.defer_writes:
+            # created by flush(), along with its first state
+            field_object = StudentModule(
+                course_id=self.course_id,
+                student=self.user,
+                module_state_key=key.block_scope_id.url(),
+                state=json.dumps({}),
+                module_type=key.block_scope_id.category,
+            )
+            self._dirty[id(field_object)] = field_object
+        elif key.scope == Scope.user_state:
             field_object, _ = StudentModule.objects.get_or_create(
                 course_id=self.course_id,
                 student=self.user,
@@ -272,6 +301,270 @@ class ModelDataCache(object):
         self.cache[cache_key] = field_object
         return field_object
 
+    def save(self, field_object):
+        '''
+        Save field_object, one of the objects in this cache.  If writes are
+        deferred, it's only marked to be saved by flush(), so it's written
+        once however many times it's changed before then.
+        '''
+        if self.defer_writes:
+            self._dirty[id(field_object)] = field_object
+        else:
+            field_object.save()
+
+    def state_of(self, student_module):
+        '''
+        Returns the state of student_module, one of the StudentModules in this
+        cache, as a dict.  It's only decoded the first time.  Changes made to
+        it are saved by save_state().
+
+        LmsKeyValueStore copies the dict and list values it reads from and sets
+        in the state, so only values that are set reach it.
+        '''
+        entry = self._states.get(id(student_module))
+        if entry is None or entry[0] is not student_module:
+            entry = (student_module, json.loads(student_module.state))
+            self._states[id(student_module)] = entry
+        return entry[1]
+
+    def save_state(self, student_module):
+        '''
+        Save the changes made to state_of(student_module).  If writes are
+        deferred, the state is only encoded when it's flushed.
+        '''
+        if self.defer_writes:
+            self._changed_states.add(id(student_module))
+        else:
+            self._encode_state(student_module)
+        self.save(student_module)
+
+    def _encode_state(self, student_module):
+        student_module.state = json.dumps(self.state_of(student_module))
+
+    def invalidate_grade(self, student_module):
+        '''
+        Mark stale the persisted score of the section containing student_module,
+        whose grade has changed.  If writes are deferred, that waits until
+        flush() has written the new grade, so that the score can't be computed
+        again from the old grade in between.
+        '''
+        if self.defer_writes:
+            key = (student_module.student_id, student_module.module_state_key)
+            self._regraded[key] = student_module.course_id
+        else:
+            grade_store.invalidate_module(student_module.student_id, student_module.course_id,
+                                          student_module.module_state_key)
+
+    def delete(self, field_object):
+        '''
+        Delete field_object, one of the objects in this cache
+        '''
+        self._dirty.pop(id(field_object), None)
+        self._states.pop(id(field_object), None)
+        if field_object.pk is not None:
+            field_object.delete()
+
+    def flush(self):
+        '''
+        Write every object saved since the last flush.  The history entries of
+        the StudentModules among them are inserted together afterwards, and then
+        the persisted scores of the modules regraded since the last flush are
+        marked stale.
+        '''
+        dirty = self._dirty.values()
+        self._dirty.clear()
+
+        history = []
+        for field_object in dirty:
+            if id(field_object) in self._changed_states:
+                self._changed_states.discard(id(field_object))
+                self._encode_state(field_object)
+
+            if isinstance(field_object, StudentModule):
+                field_object.history_deferred = True
+                try:
+                    self._save_student_module(field_object)
+                finally:
+                    field_object.history_deferred = False
+                history_entry = StudentModuleHistory.entry_for(field_object)
+                if history_entry is not None:
+                    history.append(history_entry)
+            else:
+                field_object.save()
+
+        if history:
+            StudentModuleHistory.objects.bulk_create(history)
+
+        regraded = self._regraded.items()
+        self._regraded.clear()
+        for (student_id, module_state_key), course_id in regraded:
+            grade_store.invalidate_module(student_id, course_id, module_state_key)
+
+    def _save_student_module(self, student_module):
+        '''
+        Save student_module, which find_or_create may not have inserted yet.
+        If another request inserted the row first, it's updated instead.
+        '''
+        if student_module.pk is not None:
+            student_module.save(force_update=True)
+            return
+
+        sid = transaction.savepoint()
+        try:
+            student_module.save(force_insert=True)
+            transaction.savepoint_commit(sid)
+        except IntegrityError:
+            transaction.savepoint_rollback(sid)
+            existing = StudentModule.objects.get(
+                course_id=student_module.course_id,
+                student=student_module.student,
+                module_state_key=student_module.module_state_key,
+            )
+            student_module.pk = existing.pk
+            student_module.created = existing.created
+            student_module.save(force_update=True)
+
+
+class MultiUserModelDataCache(ModelDataCache):
+    """
+    A cache of django model objects needed to supply the data for a
+    module and its descendants, for many users at once.
+
+    Per-user rows are queried for chunks of users together, so batch jobs
+    make a few queries per chunk of users rather than several per user.
+    Use for_user() to get a ModelDataCache for one of the users, which is
+    filled from this cache without any further queries.
+    """
+
+    # Scopes whose rows belong to a single user
+    USER_SCOPES = (Scope.user_state, Scope.preferences, Scope.user_info)
+
+    def __init__(self, descriptors, course_id, users, select_for_update=False, user_chunk_size=250):
+        '''
+        Arguments
+        descriptors: A list of XModuleDescriptors.
+        course_id: The id of the current course
+        users: The users for which to cache data
+        select_for_update: True if rows should be locked until end of transaction
+        user_chunk_size: The number of users to query for at once
+        '''
+        self.descriptors = descriptors
+        self.select_for_update = select_for_update
+        self.course_id = course_id
+        self.user_chunk_size = user_chunk_size
+
+        self.users = dict((user.pk, user) for user in users if user.is_authenticated())
+        self.defer_writes = False
+        self._dirty = OrderedDict()
+        self._states = {}
+        self._changed_states = set()
+        self._regraded = OrderedDict()
+        self.shared_cache = {}
+        self.user_caches = dict((user_id, {}) for user_id in self.users)
+        self.user_views = {}
+
+        if self.users:
+            for scope, fields in self._fields_to_cache().items():
+                for field_object in self._retrieve_fields(scope, fields):
+                    cache_key = self._cache_key_from_field_object(scope, field_object)
+                    if scope in self.USER_SCOPES:
+                        self.user_caches[field_object.student_id][cache_key] = field_object
+                    else:
+                        self.shared_cache[cache_key] = field_object
+
+    def _retrieve_fields(self, scope, fields):
+        """
+        Queries the database for all of the fields in the specified scope,
+        for all of the users in this cache
+        """
+        if scope not in self.USER_SCOPES:
+            return super(MultiUserModelDataCache, self)._retrieve_fields(scope, fields)
+
+        user_chunks = list(chunks(self.users.keys(), self.user_chunk_size))
+        field_names = set(field.name for field in fields)
+
+        if scope == Scope.user_state:
+            module_state_keys = [descriptor.location.url() for descriptor in self.descriptors]
+            return chain.from_iterable(
+                self._chunked_query(
+                    StudentModule,
+                    'module_state_key__in',
+                    module_state_keys,
+                    course_id=self.course_id,
+                    student__in=user_chunk,
+                )
+                for user_chunk in user_chunks
+            )
+        elif scope == Scope.preferences:
+            module_types = set(descriptor.module_class.__name__ for descriptor in self.descriptors)
+            return chain.from_iterable(
+                self._chunked_query(
+                    XModuleStudentPrefsField,
+                    'module_type__in',
+                    module_types,
+                    student__in=user_chunk,
+                    field_name__in=field_names,
+                )
+                for user_chunk in user_chunks
+            )
+        elif scope == Scope.user_info:
+            return chain.from_iterable(
+                self._query(
+                    XModuleStudentInfoField,
+                    student__in=user_chunk,
+                    field_name__in=field_names,
+                )
+                for user_chunk in user_chunks
+            )
+
+    def for_user(self, user):
+        """
+        Returns a ModelDataCache holding the data for `user`, who must be one
+        of the users this cache was built for.
+        """
+        if not user.is_authenticated():
+            return ModelDataCache(self.descriptors, self.course_id, user, self.select_for_update)
+
+        if user.pk not in self.user_views:
+            cache = dict(self.shared_cache)
+            cache.update(self.user_caches[user.pk])
+            self.user_views[user.pk] = ModelDataCache(
+                self.descriptors, self.course_id, user, self.select_for_update, cache=cache
+            )
+        return self.user_views[user.pk]
+
+    def has_user_state(self, user):
+        """
+        Returns True if `user` has any StudentModule for the cached descriptors
+        """
+        return any(cache_key[0] == Scope.user_state for cache_key in self.user_caches.get(user.pk, {}))
+
+    def find(self, key):
+        '''
+        Look for a model data object using an LmsKeyValueStore.Key object.
+        Keys for per-user scopes are looked up for the user in the key.
+        '''
+        if key.scope in self.USER_SCOPES:
+            return self.for_user(self.users[key.student_id]).find(key)
+        return self.shared_cache.get(self._cache_key_from_kvs_key(key))
+
+    def find_or_create(self, key):
+        '''
+        Find a model data object in this cache, or create it if it doesn't
+        exist.  Keys for per-user scopes are created for the user in the key.
+        '''
+        if key.scope in self.USER_SCOPES:
+            return self.for_user(self.users[key.student_id]).find_or_create(key)
+
+        field_object = self.find(key)
+        if field_object is None:
+            # Scope.content and Scope.settings objects don't depend on the user
+            field_object = ModelDataCache(
+                self.descriptors, self.course_id, None, self.select_for_update, cache={}
+            ).find_or_create(key)
+            self.shared_cache[self._cache_key_from_kvs_key(key)] = field_object
+        return field_object
+
 
 class LmsKeyValueStore(KeyValueStore):
     """
@@ -323,7 +616,7 @@ class LmsKeyValueStore(KeyValueStore):
             raise KeyError(key.field_name)
 
         if key.scope == Scope.user_state:
-            return json.loads(field_object.state)[key.field_name]
+            return _copy_value(self._model_data_cache.state_of(field_object)[key.field_name])
         else:
             return json.loads(field_object.value)
 
@@ -337,13 +630,12 @@ class LmsKeyValueStore(KeyValueStore):
             raise InvalidScopeError(key.scope)
 
         if key.scope == Scope.user_state:
-            state = json.loads(field_object.state)
-            state[key.field_name] = value
-            field_object.state = json.dumps(state)
+            state = self._model_data_cache.state_of(field_object)
+            state[key.field_name] = _copy_value(value)
+            self._model_data_cache.save_state(field_object)
         else:
             field_object.value = json.dumps(value)
-
-        field_object.save()
+            self._model_data_cache.save(field_object)
 
     def delete(self, key):
         if key.field_name in self._descriptor_model_data:
@@ -357,12 +649,11 @@ class LmsKeyValueStore(KeyValueStore):
             raise KeyError(key.field_name)
 
         if key.scope == Scope.user_state:
-            state = json.loads(field_object.state)
+            state = self._model_data_cache.state_of(field_object)
             del state[key.field_name]
-            field_object.state = json.dumps(state)
-            field_object.save()
+            self._model_data_cache.save_state(field_object)
         else:
-            field_object.delete()
+            self._model_data_cache.delete(field_object)
 
     def has(self, key):
         if key.field_name in self._descriptor_model_data:
@@ -379,9 +670,27 @@ class LmsKeyValueStore(KeyValueStore):
             return False
 
         if key.scope == Scope.user_state:
-            return key.field_name in json.loads(field_object.state)
+            return key.field_name in self._model_data_cache.state_of(field_object)
         else:
             return True
 
 
+def _copy_value(value):
+    """
+    Returns a copy of value, a field value, if it's mutable.  The decoded
+    state is shared by every read, so values are copied going in and out, to
+    keep changes that aren't set from reaching it (as they couldn't when the
+    state was decoded for every read).
+
+    Values are JSON, so only dicts and lists need copying, which is a few
+    times faster than deepcopy.
+    """
+    if isinstance(value, dict):
+        return {key: _copy_value(item) if isinstance(item, (dict, list)) else item
+                for key, item in value.iteritems()}
+    if isinstance(value, list):
+        return [_copy_value(item) if isinstance(item, (dict, list)) else item for item in value]
+    return value
+
+
 LmsUsage = namedtuple('LmsUsage', 'id, def_id')
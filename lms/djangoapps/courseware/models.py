@@ -90,15 +90,29 @@ class StudentModuleHistory(models.Model):
     grade = models.FloatField(null=True, blank=True)
     max_grade = models.FloatField(null=True, blank=True)
 
+    @classmethod
+    def entry_for(cls, instance):
+        """
+        Returns an unsaved history entry for the current state of the
+        StudentModule instance, or None if its history isn't kept
+        """
+        if instance.module_type not in cls.HISTORY_SAVING_TYPES:
+            return None
+        return cls(student_module=instance,
+                   version=None,
+                   created=instance.modified,
+                   state=instance.state,
+                   grade=instance.grade,
+                   max_grade=instance.max_grade)
+
     @receiver(post_save, sender=StudentModule)
     def save_history(sender, instance, **kwargs):
-        if instance.module_type in StudentModuleHistory.HISTORY_SAVING_TYPES:
-            history_entry = StudentModuleHistory(student_module=instance,
-                                                 version=None,
-                                                 created=instance.modified,
-                                                 state=instance.state,
-                                                 grade=instance.grade,
-                                                 max_grade=instance.max_grade)
+        # ModelDataCache.flush() saves the history of the modules it writes
+        # all at once
+        if getattr(instance, 'history_deferred', False):
+            return
+        history_entry = StudentModuleHistory.entry_for(instance)
+        if history_entry is not None:
             history_entry.save()
 
 
@@ -228,6 +242,46 @@ class XModuleStudentInfoField(models.Model):
         return unicode(repr(self))
 
 
+class StudentSectionScore(models.Model):
+    """
+    Persisted scores for one graded section, for one student in one course.
+
+    `scores` holds the JSON-encoded list of (earned, possible, graded, name)
+    tuples for every scored module in the section, or null if the student has
+    not yet seen any problem in it.  Rows are marked `stale` whenever a grade
+    in the section changes, and recomputed the next time the student is graded.
+    `content_version` identifies the version of the section they were computed
+    for (see grade_store.section_content_version).  `invalidations` counts the
+    times the row has been marked stale, so that scores computed before the
+    last of them aren't stored.
+    """
+    student = models.ForeignKey(User, db_index=True)
+    course_id = models.CharField(max_length=255, db_index=True)
+    section_location = models.CharField(max_length=255, db_index=True)
+
+    scores = models.TextField(null=True, blank=True)
+    stale = models.BooleanField(default=False, db_index=True)
+    content_version = models.CharField(max_length=40, blank=True, default='')
+    invalidations = models.IntegerField(default=0)
+
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    modified = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        unique_together = (('student', 'course_id', 'section_location'),)
+
+    def __repr__(self):
+        return 'StudentSectionScore<%r>' % ({
+            'course_id': self.course_id,
+            'student': self.student.username,
+            'section_location': self.section_location,
+            'stale': self.stale,
+        },)
+
+    def __unicode__(self):
+        return unicode(repr(self))
+
+
 class OfflineComputedGrade(models.Model):
     """
     Table of grades computed offline for a given user and course.
@@ -19,6 +19,7 @@ from statsd import statsd
 
 from capa.xqueue_interface import XQueueInterface
 from mitxmako.shortcuts import render_to_string
+from xblock.core import Scope
 from xblock.runtime import DbModel
 from xmodule.error_module import ErrorDescriptor, NonStaffErrorDescriptor
 from xmodule.errortracker import exc_info_to_str
@@ -36,7 +37,6 @@ from student.models import unique_id_for_user
 from courseware.access import has_access
 from courseware.masquerade import setup_masquerade
 from courseware.model_data import LmsKeyValueStore, LmsUsage, ModelDataCache
-from courseware.models import StudentModule
 
 
 log = logging.getLogger(__name__)
@@ -288,16 +288,17 @@ def get_module_for_descriptor_internal(user, descriptor, model_data_cache, cours
         if event.get('event_name') != 'grade':
             return
 
-        student_module, created = StudentModule.objects.get_or_create(
-            course_id=course_id,
-            student=user,
-            module_type=descriptor.location.category,
-            module_state_key=descriptor.location.url(),
-            defaults={'state': '{}'},
-        )
+        # use the same StudentModule as the module's state, so that the two
+        # are written together
+        key = LmsKeyValueStore.Key(Scope.user_state, user.id, descriptor.location, None)
+        student_module = model_data_cache.find_or_create(key)
         student_module.grade = event.get('value')
         student_module.max_grade = event.get('max_value')
-        student_module.save()
+        model_data_cache.save(student_module)
+
+        # The persisted score for the enclosing section is now out of date,
+        # once the new grade has been written
+        model_data_cache.invalidate_grade(student_module)
 
         # Bin score into range and increment stats
         score_bucket = get_score_bucket(student_module.grade, student_module.max_grade)
@@ -423,7 +424,8 @@ def xqueue_callback(request, course_id, userid, mod_id, dispatch):
         user,
         modulestore().get_instance(course_id, mod_id),
         depth=0,
-        select_for_update=True
+        select_for_update=True,
+        defer_writes=True
     )
     instance = get_module(user, request, mod_id, model_data_cache, course_id, grade_bucket_type='xqueue')
     if instance is None:
@@ -443,6 +445,8 @@ def xqueue_callback(request, course_id, userid, mod_id, dispatch):
     except:
         log.exception("error processing ajax call")
         raise
+    finally:
+        model_data_cache.flush()
 
     return HttpResponse("")
 
@@ -494,10 +498,12 @@ def modx_dispatch(request, dispatch, location, course_id):
         )
         raise Http404
 
+    # the module's state is written once, when the call is done
     model_data_cache = ModelDataCache.cache_for_descriptor_descendents(
         course_id,
         request.user,
-        descriptor
+        descriptor,
+        defer_writes=True
     )
 
     instance = get_module(request.user, request, location, model_data_cache, course_id, grade_bucket_type='ajax')
@@ -527,6 +533,10 @@ def modx_dispatch(request, dispatch, location, course_id):
         log.exception("error processing ajax call")
         raise
 
+    # keep whatever state the module saved before any error, as before
+    finally:
+        model_data_cache.flush()
+
     # Return whatever the module wanted to return to the client/caller
     return HttpResponse(ajax_return)
 
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for courseware.grades.answer_distributions
+"""
+import json
+from functools import partial
+
+from django.test import TestCase
+from mock import Mock
+
+from courseware import grades
+from courseware.tests.factories import StudentModuleFactory, UserFactory
+from student.tests.factories import CourseEnrollmentFactory
+from xmodule.modulestore import Location
+
+course_id = 'edX/test_course/test'
+location = partial(Location, 'i4x', 'edX', 'test_course')
+
+
+def mock_descriptor(descriptor_location, display_name):
+    descriptor = Mock()
+    descriptor.location = descriptor_location
+    descriptor.url_name = descriptor_location.name
+    descriptor.display_name_with_default = display_name
+    return descriptor
+
+
+class TestAnswerDistributions(TestCase):
+
+    def setUp(self):
+        self.problem_one = location('problem', 'p1')
+        self.problem_two = location('problem', 'p2')
+        self.course = Mock()
+        self.course.id = course_id
+        self.course.grading_context = {'all_descriptors': [
+            mock_descriptor(location('sequential', 'homework'), 'Homework'),
+            mock_descriptor(self.problem_one, 'Problem One'),
+            mock_descriptor(self.problem_two, 'Problem Two'),
+        ]}
+
+    def answer(self, problem_location, student_answers, enrolled=True, **state):
+        user = UserFactory.create()
+        if enrolled:
+            CourseEnrollmentFactory.create(user=user, course_id=course_id)
+        state['student_answers'] = student_answers
+        StudentModuleFactory.create(student=user, course_id=course_id,
+                                    module_state_key=problem_location.url(), state=json.dumps(state))
+        return user
+
+    def add_answers(self):
+        self.answer(self.problem_one, {'p1_2_1': '3.14', 'p1_3_1': ['choice_1', 'choice_2']}, attempts=1)
+        self.answer(self.problem_one, {'p1_2_1': '3.14'})
+        self.answer(self.problem_one, {'p1_2_1': u'π'})
+        self.answer(self.problem_two, {'p2_2_1': 'yes'})
+
+    def expected(self):
+        return {
+            ('p1', 'Problem One', 'p1_2_1'): {'3.14': 2, u'π': 1},
+            ('p1', 'Problem One', 'p1_3_1'): {"[u'choice_1', u'choice_2']": 1},
+            ('p2', 'Problem Two', 'p2_2_1'): {'yes': 1},
+        }
+
+    def test_counts_answers(self):
+        self.add_answers()
+        self.assertEqual(self.expected(), grades.answer_distributions(self.course))
+
+    def test_counts_across_chunks(self):
+        self.add_answers()
+        self.assertEqual(self.expected(), grades.answer_distributions(self.course, chunk_size=1))
+
+    def test_counts_in_worker_processes(self):
+        self.add_answers()
+        self.assertEqual(self.expected(), grades.answer_distributions(self.course, num_processes=2, chunk_size=1))
+
+    def test_skips_unenrolled_students_and_other_modules(self):
+        self.answer(self.problem_one, {'p1_2_1': '3.14'}, enrolled=False)
+        self.answer(location('problem', 'not_graded'), {'ng_2_1': '3.14'})
+        self.answer(location('sequential', 'homework'), {'p1_2_1': '3.14'})
+        self.assertEqual({}, grades.answer_distributions(self.course))
+
+    def test_skips_unanswered_and_unreadable_state(self):
+        user = self.answer(self.problem_one, {})
+        StudentModuleFactory.create(student=user, course_id=course_id,
+                                    module_state_key=self.problem_two.url(), state='{not json')
+        self.answer(self.problem_two, {'p2_2_1': 'yes'})
+        self.assertEqual({('p2', 'Problem Two', 'p2_2_1'): {'yes': 1}}, grades.answer_distributions(self.course))
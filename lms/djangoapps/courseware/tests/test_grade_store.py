@@ -0,0 +1,247 @@
+"""
+Tests for the persistent section score store in courseware.grade_store
+"""
+from functools import partial
+
+from django.core.cache import cache
+from django.test import TestCase
+from mock import Mock, patch
+
+from courseware import grade_store, grades
+from courseware.models import StudentModule, StudentSectionScore
+from courseware.tests.factories import StudentModuleFactory, UserFactory
+from xblock.core import Scope
+from xmodule.graders import Score
+from xmodule.modulestore import Location
+
+course_id = 'edX/test_course/test'
+location = partial(Location, 'i4x', 'edX', 'test_course')
+
+
+def mock_problem(problem_location, weight=None):
+    problem = Mock()
+    problem.location = problem_location
+    problem.display_name_with_default = problem_location.name
+    problem.lms.graded = True
+    problem.weight = weight
+    problem.data = '<problem/>'
+    problem.always_recalculate_grades = False
+    return problem
+
+
+def mock_course(sections):
+    """
+    Build a mock course whose grading context holds the given
+    {section location: [problem locations or mock problems]} sections.
+    """
+    graded_sections = []
+    for section_location, problems in sections.items():
+        problems = [problem if isinstance(problem, Mock) else mock_problem(problem) for problem in problems]
+        section_descriptor = Mock()
+        section_descriptor.location = section_location
+        section_descriptor.display_name_with_default = section_location.name
+        graded_sections.append({'section_descriptor': section_descriptor, 'xmoduledescriptors': problems})
+
+    course = Mock()
+    course.id = course_id
+    course.grading_context = {'graded_sections': {'Homework': graded_sections}, 'all_descriptors': []}
+    course.grader.grade.return_value = {'percent': 0.5}
+    course.grade_cutoffs = {'Pass': 0.5}
+    return course
+
+
+@patch.dict("django.conf.settings.MITX_FEATURES", {"ENABLE_PERSISTENT_GRADES": True})
+class TestGradeStore(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = UserFactory.create()
+        self.section_one = location('sequential', 'one')
+        self.section_two = location('sequential', 'two')
+        self.problem_one = location('problem', 'p1')
+        self.problem_two = location('problem', 'p2')
+        self.course = mock_course({
+            self.section_one: [self.problem_one],
+            self.section_two: [self.problem_two],
+        })
+        self.scores = [Score(1.0, 2.0, True, 'Problem 1')]
+
+    def store_both_sections(self):
+        grade_store.set_section_scores(self.user, course_id, self.section_one.url(), self.scores)
+        grade_store.set_section_scores(self.user, course_id, self.section_two.url(), None)
+
+    def test_round_trip(self):
+        self.store_both_sections()
+        stored = grade_store.get_section_scores(self.user, course_id)
+        self.assertEquals(self.scores, stored[self.section_one.url()])
+        self.assertIsNone(stored[self.section_two.url()])
+
+    def test_overwrite_clears_stale(self):
+        self.store_both_sections()
+        StudentSectionScore.objects.update(stale=True)
+        self.assertEquals({}, grade_store.get_section_scores(self.user, course_id))
+
+        grade_store.set_section_scores(self.user, course_id, self.section_one.url(), self.scores)
+        self.assertEquals([self.section_one.url()], grade_store.get_section_scores(self.user, course_id).keys())
+
+    def test_invalidate_only_enclosing_section(self):
+        self.store_both_sections()
+        grade_store.cache_section_map(self.course)
+        grade_store.invalidate_module(self.user.id, course_id, self.problem_one.url())
+
+        self.assertEquals([self.section_two.url()], grade_store.get_section_scores(self.user, course_id).keys())
+
+    def test_invalidate_ungraded_module(self):
+        self.store_both_sections()
+        grade_store.cache_section_map(self.course)
+        grade_store.invalidate_module(self.user.id, course_id, location('html', 'intro').url())
+
+        self.assertEquals(2, len(grade_store.get_section_scores(self.user, course_id)))
+
+    def test_invalidate_without_section_map(self):
+        self.store_both_sections()
+        grade_store.invalidate_module(self.user.id, course_id, self.problem_one.url())
+
+        self.assertEquals({}, grade_store.get_section_scores(self.user, course_id))
+
+    def test_studentmodule_create_and_delete_invalidate(self):
+        self.store_both_sections()
+        grade_store.cache_section_map(self.course)
+
+        module = StudentModuleFactory.create(student=self.user, course_id=course_id,
+                                             module_state_key=self.problem_two.url())
+        self.assertEquals([self.section_one.url()], grade_store.get_section_scores(self.user, course_id).keys())
+
+        grade_store.set_section_scores(self.user, course_id, self.section_two.url(), self.scores)
+        StudentModule.objects.get(id=module.id).delete()
+        self.assertEquals([self.section_one.url()], grade_store.get_section_scores(self.user, course_id).keys())
+
+    @patch.dict("django.conf.settings.MITX_FEATURES", {"ENABLE_PERSISTENT_GRADES": False})
+    def test_disabled(self):
+        self.store_both_sections()
+        grade_store.invalidate_module(self.user.id, course_id, self.problem_one.url())
+
+        self.assertEquals(2, len(grade_store.get_section_scores(self.user, course_id)))
+
+    def test_content_version(self):
+        version = grade_store.section_content_version
+        section = {'xmoduledescriptors': [mock_problem(self.problem_one)]}
+        self.assertEquals(version(section), version({'xmoduledescriptors': [mock_problem(self.problem_one)]}))
+        self.assertNotEquals(version(section), version({'xmoduledescriptors': [mock_problem(self.problem_one, weight=2)]}))
+        self.assertNotEquals(version(section), version({'xmoduledescriptors': [mock_problem(self.problem_one),
+                                                                               mock_problem(self.problem_two)]}))
+
+    def test_other_versions_ignored(self):
+        grade_store.set_section_scores(self.user, course_id, self.section_one.url(), self.scores, 'v1')
+        grade_store.set_section_scores(self.user, course_id, self.section_two.url(), None, 'v1')
+        versions = {self.section_one.url(): 'v1', self.section_two.url(): 'v2'}
+        self.assertEquals([self.section_one.url()], grade_store.get_section_scores(self.user, course_id, versions).keys())
+
+    def test_section_map_follows_course_changes(self):
+        self.store_both_sections()
+        grade_store.cache_section_map(self.course)
+
+        # problem one moves to section two
+        moved = mock_course({self.section_one: [], self.section_two: [self.problem_one, self.problem_two]})
+        grade_store.cache_section_map(moved)
+        grade_store.invalidate_module(self.user.id, course_id, self.problem_one.url())
+
+        self.assertEquals([self.section_one.url()], grade_store.get_section_scores(self.user, course_id).keys())
+
+
+@patch.dict("django.conf.settings.MITX_FEATURES", {"ENABLE_PERSISTENT_GRADES": True})
+@patch('courseware.grades.ModelDataCache', Mock())
+@patch('courseware.grades._grade_section')
+class TestPersistedGrades(TestCase):
+    """
+    Tests of grades.grade() reading and writing the persistent store
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = UserFactory.create()
+        self.section_one = location('sequential', 'one')
+        self.section_two = location('sequential', 'two')
+        self.problem_one = location('problem', 'p1')
+        self.problem_two = location('problem', 'p2')
+
+    def course(self, problem_one_weight=None):
+        return mock_course({
+            self.section_one: [mock_problem(self.problem_one, problem_one_weight)],
+            self.section_two: [mock_problem(self.problem_two)],
+        })
+
+    def grade(self, mock_grade_section, course):
+        """
+        Grades self.user in course, with a score of 1/2 in every section,
+        returning the locations of the sections that were computed rather
+        than read from the store, and the scores given to the grader.
+        """
+        mock_grade_section.reset_mock()
+        mock_grade_section.side_effect = lambda student, request, course, section, model_data_cache: [
+            Score(1.0, 2.0, True, section['section_descriptor'].location.name)
+        ]
+        grades.grade(self.user, None, course)
+        computed = sorted(call[0][3]['section_descriptor'].location.url() for call in mock_grade_section.call_args_list)
+        totaled_scores = course.grader.grade.call_args[0][0]
+        return computed, sorted(totaled_scores['Homework'])
+
+    def test_persisted_sections_not_recomputed(self, mock_grade_section):
+        computed, first_scores = self.grade(mock_grade_section, self.course())
+        self.assertEquals(sorted([self.section_one.url(), self.section_two.url()]), computed)
+
+        computed, scores = self.grade(mock_grade_section, self.course())
+        self.assertEquals([], computed)
+        self.assertEquals(first_scores, scores)
+
+    def test_stale_section_recomputed(self, mock_grade_section):
+        _, first_scores = self.grade(mock_grade_section, self.course())
+        grade_store.invalidate_module(self.user.id, course_id, self.problem_one.url())
+
+        computed, scores = self.grade(mock_grade_section, self.course())
+        self.assertEquals([self.section_one.url()], computed)
+        self.assertEquals(first_scores, scores)
+
+    def test_changed_section_recomputed(self, mock_grade_section):
+        _, first_scores = self.grade(mock_grade_section, self.course())
+
+        computed, scores = self.grade(mock_grade_section, self.course(problem_one_weight=5))
+        self.assertEquals([self.section_one.url()], computed)
+        self.assertEquals(first_scores, scores)
+
+        # the recomputed scores were stored for the new version
+        computed, _ = self.grade(mock_grade_section, self.course(problem_one_weight=5))
+        self.assertEquals([], computed)
+
+    def test_section_invalidated_while_grading_not_stored(self, mock_grade_section):
+        self.grade(mock_grade_section, self.course())
+        grade_store.invalidate_module(self.user.id, course_id, self.problem_one.url())
+
+        def grade_section(student, request, course, section, model_data_cache):
+            # a new grade is published after the state has been read
+            grade_store.invalidate_module(self.user.id, course_id, self.problem_one.url())
+            return [Score(0.0, 2.0, True, 'outdated')]
+
+        mock_grade_section.side_effect = grade_section
+        grades.grade(self.user, None, self.course())
+        self.assertTrue(StudentSectionScore.objects.get(section_location=self.section_one.url()).stale)
+
+        computed, _ = self.grade(mock_grade_section, self.course())
+        self.assertEquals([self.section_one.url()], computed)
+
+    def test_sections_regraded_since_cache_was_read_not_stored(self, mock_grade_section):
+        # the cache was read before problem one was given its current grade
+        StudentModuleFactory.create(student=self.user, course_id=course_id, module_state_key=self.problem_one.url(),
+                                    grade=1, max_grade=2)
+        model_data_cache = Mock()
+        model_data_cache.cache = {(Scope.user_state, self.problem_one.url()): Mock(grade=0, max_grade=2)}
+        mock_grade_section.return_value = [Score(0.0, 2.0, True, 'outdated')]
+        grades.grade(self.user, None, self.course(), model_data_cache)
+
+        computed, _ = self.grade(mock_grade_section, self.course())
+        self.assertEquals([self.section_one.url()], computed)
+
+    def test_use_persisted_false(self, mock_grade_section):
+        self.grade(mock_grade_section, self.course())
+        mock_grade_section.reset_mock()
+        grades.grade(self.user, None, self.course(), use_persisted=False)
+        self.assertEquals(2, mock_grade_section.call_count)
@@ -1,10 +1,10 @@
 import json
-from mock import Mock
+from mock import Mock, patch
 from functools import partial
 
 from courseware.model_data import LmsKeyValueStore, InvalidWriteError
-from courseware.model_data import InvalidScopeError, ModelDataCache
-from courseware.models import StudentModule, XModuleContentField, XModuleSettingsField
+from courseware.model_data import InvalidScopeError, ModelDataCache, MultiUserModelDataCache
+from courseware.models import StudentModule, StudentModuleHistory, XModuleContentField, XModuleSettingsField
 from courseware.models import XModuleStudentInfoField, XModuleStudentPrefsField
 
 from student.tests.factories import UserFactory
@@ -14,6 +14,7 @@ from courseware.tests.factories import StudentPrefsFactory, StudentInfoFactory
 
 from xblock.core import Scope, BlockScope
 from xmodule.modulestore import Location
+from django.db import connection, reset_queries
 from django.test import TestCase
 
 
@@ -261,3 +262,194 @@ class TestStudentInfoStorage(StorageTestBase, TestCase):
     scope = Scope.user_info
     key_factory = user_info_key
     storage_class = XModuleStudentInfoField
+
+
+class TestMultiUserModelDataCache(TestCase):
+
+    def setUp(self):
+        self.users = [UserFactory.create(username='user{0}'.format(index)) for index in range(3)]
+        for index, user in enumerate(self.users[:2]):
+            StudentModuleFactory(student=user, state=json.dumps({'a_field': index}))
+            StudentPrefsFactory(student=user, value=json.dumps(index))
+        self.descriptors = [mock_descriptor([mock_field(Scope.user_state, 'a_field'),
+                                             mock_field(Scope.preferences, 'existing_field')])]
+
+    def test_queries_independent_of_users(self):
+        # one query for each of the user_state and preferences scopes
+        with self.assertNumQueries(2):
+            mdc = MultiUserModelDataCache(self.descriptors, course_id, self.users)
+
+        with self.assertNumQueries(0):
+            for index, user in enumerate(self.users[:2]):
+                kvs = LmsKeyValueStore({}, mdc.for_user(user))
+                self.assertEquals(index, kvs.get(user_state_key('a_field')))
+                self.assertEquals(index, kvs.get(prefs_key('existing_field')))
+
+    def test_user_without_state(self):
+        mdc = MultiUserModelDataCache(self.descriptors, course_id, self.users)
+        self.assertTrue(mdc.has_user_state(self.users[0]))
+        self.assertFalse(mdc.has_user_state(self.users[2]))
+
+        kvs = LmsKeyValueStore({}, mdc.for_user(self.users[2]))
+        self.assertRaises(KeyError, kvs.get, user_state_key('a_field'))
+
+        kvs.set(user_state_key('a_field'), 'new_value')
+        student_module = StudentModule.objects.get(student=self.users[2])
+        self.assertEquals({'a_field': 'new_value'}, json.loads(student_module.state))
+        self.assertEquals('new_value', kvs.get(user_state_key('a_field')))
+
+    def test_find_by_student_id(self):
+        mdc = MultiUserModelDataCache(self.descriptors, course_id, self.users)
+        for user in self.users[:2]:
+            key = LmsKeyValueStore.Key(Scope.user_state, user.id, location('def_id'), None)
+            self.assertEquals(user, mdc.find(key).student)
+
+        key = LmsKeyValueStore.Key(Scope.user_state, self.users[2].id, location('def_id'), None)
+        self.assertIsNone(mdc.find(key))
+
+
+class TestDeferredWrites(TestCase):
+
+    def setUp(self):
+        self.user = UserFactory.create(username='user')
+        self.descriptors = [mock_descriptor([mock_field(Scope.user_state, 'a_field'),
+                                             mock_field(Scope.user_state, 'b_field')])]
+
+    def writes(self, func):
+        """
+        Calls func, returning the tables of the rows it inserted or updated
+        """
+        connection.use_debug_cursor = True
+        try:
+            reset_queries()
+            func()
+            return [query['sql'].split('"')[1] for query in connection.queries
+                    if query['sql'].startswith(('INSERT', 'UPDATE'))]
+        finally:
+            connection.use_debug_cursor = False
+
+    def set_fields(self, mdc):
+        kvs = LmsKeyValueStore({}, mdc)
+        kvs.set(user_state_key('a_field'), 'a_value')
+        kvs.set(user_state_key('b_field'), 'b_value')
+        kvs.set(user_state_key('a_field'), 'new_value')
+        student_module = mdc.find(user_state_key('a_field'))
+        student_module.grade = 1
+        student_module.max_grade = 2
+        mdc.save(student_module)
+
+    def assert_saved(self):
+        student_module = StudentModule.objects.get(student=self.user)
+        self.assertEquals({'a_field': 'new_value', 'b_field': 'b_value'}, json.loads(student_module.state))
+        self.assertEquals(1, student_module.grade)
+        history = StudentModuleHistory.objects.get(student_module=student_module)
+        self.assertEquals(student_module.state, history.state)
+        self.assertEquals(2, history.max_grade)
+
+    def test_new_student_module_is_inserted_once(self):
+        mdc = ModelDataCache(self.descriptors, course_id, self.user, defer_writes=True)
+        self.assertEquals([], self.writes(lambda: self.set_fields(mdc)))
+        self.assertEquals(0, StudentModule.objects.count())
+
+        writes = self.writes(mdc.flush)
+        self.assertEquals(1, writes.count('courseware_studentmodule'))
+        self.assertEquals(1, writes.count('courseware_studentmodulehistory'))
+        self.assert_saved()
+
+        # nothing is left to write
+        self.assertEquals([], self.writes(mdc.flush))
+
+    def test_existing_student_module_is_updated_once(self):
+        StudentModuleFactory(student=self.user, state=json.dumps({'a_field': 'old_value'}))
+        StudentModuleHistory.objects.all().delete()
+        mdc = ModelDataCache(self.descriptors, course_id, self.user, defer_writes=True)
+        self.set_fields(mdc)
+
+        writes = self.writes(mdc.flush)
+        self.assertEquals(1, writes.count('courseware_studentmodule'))
+        self.assertEquals(1, writes.count('courseware_studentmodulehistory'))
+        self.assert_saved()
+
+    def test_row_inserted_by_another_request_is_updated(self):
+        mdc = ModelDataCache(self.descriptors, course_id, self.user, defer_writes=True)
+        self.set_fields(mdc)
+        StudentModuleFactory(student=self.user, state=json.dumps({'a_field': 'old_value'}))
+        StudentModuleHistory.objects.all().delete()
+
+        mdc.flush()
+        self.assertEquals(1, StudentModule.objects.count())
+        self.assert_saved()
+
+    def test_grade_invalidated_after_it_is_written(self):
+        StudentModuleFactory(student=self.user, state=json.dumps({'a_field': 'old_value'}))
+        mdc = ModelDataCache(self.descriptors, course_id, self.user, defer_writes=True)
+        self.set_fields(mdc)
+        grades_when_invalidated = []
+
+        def invalidate_module(student_id, invalidated_course_id, module_state_key):
+            grades_when_invalidated.append(StudentModule.objects.get(student=self.user).grade)
+            self.assertEquals((self.user.id, course_id, location('def_id').url()),
+                              (student_id, invalidated_course_id, module_state_key))
+
+        with patch('courseware.model_data.grade_store.invalidate_module', side_effect=invalidate_module):
+            mdc.invalidate_grade(mdc.find(user_state_key('a_field')))
+            self.assertEquals([], grades_when_invalidated)
+            mdc.flush()
+            self.assertEquals([1], grades_when_invalidated)
+            mdc.flush()
+            self.assertEquals([1], grades_when_invalidated)
+
+    def test_writes_without_deferral(self):
+        mdc = ModelDataCache(self.descriptors, course_id, self.user)
+        writes = self.writes(lambda: self.set_fields(mdc))
+        self.assertEquals(4, writes.count('courseware_studentmodulehistory'))
+        self.assertEquals([], self.writes(mdc.flush))
+
+
+class TestDecodedState(TestCase):
+
+    def setUp(self):
+        student_module = StudentModuleFactory(state=json.dumps({'a_field': {'answers': [1]}, 'b_field': 'b_value'}))
+        self.user = student_module.student
+        self.descriptors = [mock_descriptor([mock_field(Scope.user_state, 'a_field'),
+                                             mock_field(Scope.user_state, 'b_field')])]
+
+    def test_state_is_decoded_once(self):
+        mdc = ModelDataCache(self.descriptors, course_id, self.user, defer_writes=True)
+        kvs = LmsKeyValueStore({}, mdc)
+        with patch('courseware.model_data.json.loads', wraps=json.loads) as loads:
+            with patch('courseware.model_data.json.dumps', wraps=json.dumps) as dumps:
+                for _ in range(5):
+                    kvs.get(user_state_key('a_field'))
+                    kvs.has(user_state_key('b_field'))
+                    kvs.set(user_state_key('b_field'), 'new_value')
+                self.assertEquals(1, loads.call_count)
+                self.assertEquals(0, dumps.call_count)
+
+                mdc.flush()
+                self.assertEquals(1, dumps.call_count)
+
+        self.assertEquals({'a_field': {'answers': [1]}, 'b_field': 'new_value'},
+                          json.loads(StudentModule.objects.get(student=self.user).state))
+
+    def test_values_are_copied(self):
+        mdc = ModelDataCache(self.descriptors, course_id, self.user, defer_writes=True)
+        kvs = LmsKeyValueStore({}, mdc)
+
+        # changes that aren't set don't reach the state
+        value = kvs.get(user_state_key('a_field'))
+        value['answers'].append(2)
+        self.assertEquals({'answers': [1]}, kvs.get(user_state_key('a_field')))
+
+        # not even when another field is set on the module
+        kvs.set(user_state_key('b_field'), 'new_value')
+        mdc.flush()
+        self.assertEquals({'a_field': {'answers': [1]}, 'b_field': 'new_value'},
+                          json.loads(StudentModule.objects.get(student=self.user).state))
+
+        kvs.set(user_state_key('a_field'), value)
+        value['answers'].append(3)
+        self.assertEquals({'answers': [1, 2]}, kvs.get(user_state_key('a_field')))
+        mdc.flush()
+        self.assertEquals({'answers': [1, 2]},
+                          json.loads(StudentModule.objects.get(student=self.user).state)['a_field'])
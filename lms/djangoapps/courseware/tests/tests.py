@@ -13,6 +13,7 @@ from django.test import TestCase
 from django.test.client import RequestFactory
 from django.conf import settings
 from django.core.urlresolvers import reverse
+from django.db import connection, reset_queries
 from django.test.utils import override_settings
 
 import xmodule.modulestore.django
@@ -390,6 +391,7 @@ class TestCoursesLoadTestCase_MongoModulestore(PageLoaderTestCase):
         self.setup_viewtest_user()
         xmodule.modulestore.django._MODULESTORES = {}
         modulestore().collection.drop()
+        modulestore().structure_collection.drop()
 
     def test_toy_course_loads(self):
         module_store = modulestore()
@@ -466,6 +468,43 @@ class TestNavigation(LoginEnrollmentTestCase):
                                              'chapter': 'secret:magic'}))
 
 
+@override_settings(MODULESTORE=TEST_DATA_XML_MODULESTORE)
+class TestAccessQueries(LoginEnrollmentTestCase):
+    """Check that access checks don't look up the user's groups over and over"""
+
+    def setUp(self):
+        xmodule.modulestore.django._MODULESTORES = {}
+        self.toy = modulestore().get_course("edX/toy/2012_Fall")
+
+        self.student = 'view@test.com'
+        self.password = 'foo'
+        self.create_account('u1', self.student, self.password)
+        self.activate_user(self.student)
+        self.login(self.student, self.password)
+        self.enroll(self.toy)
+
+        # course staff get the most access checks (e.g. for histograms)
+        group = Group.objects.create(name=_course_staff_group_name(self.toy.location))
+        get_user(self.student).groups.add(group)
+
+    def test_courseware_index_looks_up_groups_once(self):
+        url = reverse('courseware_section', kwargs={'course_id': self.toy.id,
+                                                    'chapter': 'Overview',
+                                                    'section': 'Toy_Videos'})
+        self.check_for_get_code(200, url)
+
+        connection.use_debug_cursor = True
+        try:
+            reset_queries()
+            self.check_for_get_code(200, url)
+            # user.groups.all(), not permission lookups that join through the groups
+            group_queries = [query for query in connection.queries
+                             if 'FROM "auth_group" INNER JOIN "auth_user_groups"' in query['sql']]
+        finally:
+            connection.use_debug_cursor = False
+        self.assertEqual(1, len(group_queries))
+
+
 @override_settings(MODULESTORE=TEST_DATA_DRAFT_MONGO_MODULESTORE)
 class TestDraftModuleStore(TestCase):
     def test_get_items_with_course_items(self):
@@ -19,7 +19,7 @@ log = logging.getLogger(__name__)
 
 
 @override_settings(MODULESTORE=TEST_DATA_MONGO_MODULESTORE)
-@patch('comment_client.utils.requests.request')
+@patch('comment_client.utils.requests.Session.request')
 class ViewsTestCase(UrlResetMixin, ModuleStoreTestCase):
     def setUp(self):
 
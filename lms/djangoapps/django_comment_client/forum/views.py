@@ -242,8 +242,13 @@ def single_thread(request, course_id, discussion_id, thread_id):
     cc_user = cc.User.from_django_user(request.user)
     user_info = cc_user.to_dict()
 
+    # fetch the thread while the list of threads is being fetched
+    thread_result = cc.utils.call_in_background(cc.Thread.find(thread_id).retrieve,
+                                                recursive=True, user_id=request.user.id)
     try:
-        thread = cc.Thread.find(thread_id).retrieve(recursive=True, user_id=request.user.id)
+        if not request.is_ajax():
+            threads, query_params = get_threads(request, course_id)
+        thread = thread_result.get()
     except (cc.utils.CommentClientError, cc.utils.CommentClientUnknownError) as err:
         log.error("Error loading single thread.")
         raise Http404
@@ -266,12 +271,7 @@ def single_thread(request, course_id, discussion_id, thread_id):
     else:
         category_map = utils.get_discussion_category_map(course)
 
-        try:
-            threads, query_params = get_threads(request, course_id)
-            threads.append(thread.to_dict())
-        except (cc.utils.CommentClientError, cc.utils.CommentClientUnknownError) as err:
-            log.error("Error loading single thread.")
-            raise Http404
+        threads.append(thread.to_dict())
 
         course = get_course_with_access(request.user, course_id, 'load')
 
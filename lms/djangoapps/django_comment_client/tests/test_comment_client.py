@@ -0,0 +1,116 @@
+import threading
+
+from django.core.cache import cache
+from django.test import TestCase
+from mock import patch
+
+import comment_client as cc
+
+
+@patch('comment_client.utils.requests.Session.request')
+class PerformRequestTestCase(TestCase):
+    def test_requests_share_a_session(self, mock_request):
+        mock_request.return_value.status_code = 200
+        mock_request.return_value.text = u'{"id": "1"}'
+        cc.utils.perform_request('get', 'http://localhost:4567/api/v1/users/1')
+        cc.utils.perform_request('put', 'http://localhost:4567/api/v1/users/1', {'username': 'robot'})
+        self.assertEqual(2, mock_request.call_count)
+
+    def test_a_session_per_thread(self, mock_request):
+        session = cc.utils.get_session()
+        self.assertIs(session, cc.utils.get_session())
+        self.assertIsNot(session, cc.utils.call_in_background(cc.utils.get_session).get())
+
+    def test_error_status(self, mock_request):
+        mock_request.return_value.status_code = 503
+        mock_request.return_value.text = u'down for maintenance'
+        with self.assertRaises(cc.utils.CommentClientMaintenanceError):
+            cc.utils.perform_request('get', 'http://localhost:4567/api/v1/users/1')
+
+
+class CallInBackgroundTestCase(TestCase):
+    def test_calls_run_at_the_same_time(self):
+        # each call waits for the other to start, so this would hang if they
+        # ran one after the other
+        started = [threading.Event(), threading.Event()]
+
+        def call(mine, other):
+            started[mine].set()
+            return started[other].wait(5)
+
+        first = cc.utils.call_in_background(call, 0, 1)
+        second = cc.utils.call_in_background(call, 1, 0)
+        self.assertTrue(first.get())
+        self.assertTrue(second.get())
+
+    def test_exceptions_are_raised_by_get(self):
+        def call():
+            raise cc.utils.CommentClientError('no such thread')
+
+        result = cc.utils.call_in_background(call)
+        with self.assertRaises(cc.utils.CommentClientError):
+            result.get()
+
+
+@patch('comment_client.settings.CACHE_TTLS', {'thread': 30, 'user': 30, 'course': 10})
+@patch('comment_client.utils.requests.Session.request')
+class ResponseCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = cc.User(id='1')
+
+    def respond_with(self, mock_request, text):
+        mock_request.return_value.status_code = 200
+        mock_request.return_value.text = text
+
+    def retrieve_thread(self, thread_id='518d4237b023791dca00000d'):
+        return cc.Thread.find(thread_id).retrieve(recursive=True, user_id='1', mark_as_read=False)
+
+    def test_retrieve_is_cached(self, mock_request):
+        self.respond_with(mock_request, u'{"id": "518d4237b023791dca00000d", "title": "Hello"}')
+        self.retrieve_thread()
+        self.assertEqual('Hello', self.retrieve_thread().title)
+        self.assertEqual(1, mock_request.call_count)
+
+        # other params are another request
+        cc.Thread.find('518d4237b023791dca00000d').retrieve(recursive=False, user_id='1', mark_as_read=False)
+        self.assertEqual(2, mock_request.call_count)
+
+    def test_mark_as_read_is_always_sent(self, mock_request):
+        self.respond_with(mock_request, u'{"id": "518d4237b023791dca00000d", "title": "Hello"}')
+        for _ in range(2):
+            cc.Thread.find('518d4237b023791dca00000d').retrieve(recursive=True, user_id='1', mark_as_read=True)
+        self.assertEqual(2, mock_request.call_count)
+        self.assertTrue(mock_request.call_args[1]['params']['mark_as_read'])
+
+    def test_writes_invalidate(self, mock_request):
+        self.respond_with(mock_request, u'{"id": "518d4237b023791dca00000d", "title": "Hello", "course_id": "MITx/999/Robot_Super_Course"}')
+        thread = self.retrieve_thread()
+        thread.flagAbuse(self.user, thread)
+        self.retrieve_thread()
+        self.assertEqual(3, mock_request.call_count)
+
+        thread.pin(self.user, thread.id)
+        self.retrieve_thread()
+        self.assertEqual(5, mock_request.call_count)
+
+    def test_comment_writes_invalidate_their_thread(self, mock_request):
+        self.respond_with(mock_request, u'{"id": "518d4237b023791dca00000d", "title": "Hello"}')
+        self.retrieve_thread()
+        self.respond_with(mock_request, u'{"id": "518d4237b023791dca00000e", "thread_id": "518d4237b023791dca00000d"}')
+        self.user.vote(cc.Comment.find('518d4237b023791dca00000e'), 'up')
+        self.respond_with(mock_request, u'{"id": "518d4237b023791dca00000d", "title": "Hello"}')
+        self.retrieve_thread()
+        self.assertEqual(3, mock_request.call_count)
+
+    def test_new_threads_invalidate_listings(self, mock_request):
+        self.respond_with(mock_request, u'{"collection": [], "page": 1, "num_pages": 1}')
+        cc.Thread.search({'course_id': 'MITx/999/Robot_Super_Course'})
+        cc.Thread.search({'course_id': 'MITx/999/Robot_Super_Course'})
+        self.assertEqual(1, mock_request.call_count)
+
+        self.respond_with(mock_request, u'{"id": "518d4237b023791dca00000d", "course_id": "MITx/999/Robot_Super_Course"}')
+        cc.Thread(title='Hello', course_id='MITx/999/Robot_Super_Course', commentable_id='general').save()
+        self.respond_with(mock_request, u'{"collection": [], "page": 1, "num_pages": 1}')
+        cc.Thread.search({'course_id': 'MITx/999/Robot_Super_Course'})
+        self.assertEqual(3, mock_request.call_count)
@@ -3,7 +3,9 @@
 # django management command: dump grades to csv files
 # for use by batch processes
 
-from instructor.offline_gradecalc import offline_grade_calculation
+from optparse import make_option
+
+from instructor.offline_gradecalc import offline_grade_calculation, GRADE_CHUNK_SIZE
 from courseware.courses import get_course_by_id
 from xmodule.modulestore.django import modulestore
 
@@ -12,10 +14,25 @@ from django.core.management.base import BaseCommand
 
 class Command(BaseCommand):
     help = "Compute grades for all students in a course, and store result in DB.\n"
-    help += "Usage: compute_grades course_id_or_dir \n"
+    help += "Usage: compute_grades course_id_or_dir [--processes N] [--chunk-size N]\n"
     help += "   course_id_or_dir: either course_id or course_dir\n"
     help += 'Example course_id: MITx/8.01rq_MW/Classical_Mechanics_Reading_Questions_Fall_2012_MW_Section'
 
+    option_list = BaseCommand.option_list + (
+        make_option('--processes',
+                    action='store',
+                    type='int',
+                    dest='processes',
+                    default=1,
+                    help='Number of worker processes to grade students with.'),
+        make_option('--chunk-size',
+                    action='store',
+                    type='int',
+                    dest='chunk_size',
+                    default=GRADE_CHUNK_SIZE,
+                    help='Number of students graded and stored together.'),
+    )
+
     def handle(self, *args, **options):
 
         print "args = ", args
@@ -40,4 +57,4 @@ class Command(BaseCommand):
         print "-----------------------------------------------------------------------------"
         print "Computing grades for %s" % (course.id)
 
-        offline_grade_calculation(course.id)
+        offline_grade_calculation(course.id, num_processes=options['processes'], chunk_size=options['chunk_size'])
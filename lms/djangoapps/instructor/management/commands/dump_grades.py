@@ -5,7 +5,7 @@
 
 import csv
 
-from instructor.views import get_student_grade_summary_data
+from instructor.views import get_student_grade_summary_rows
 from courseware.courses import get_course_by_id
 from xmodule.modulestore.django import modulestore
 
@@ -51,18 +51,20 @@ class Command(BaseCommand):
 
         print "-----------------------------------------------------------------------------"
         print "Dumping grades from %s to file %s (get_raw_scores=%s)" % (course.id, fn, get_raw_scores)
-        datatable = get_student_grade_summary_data(request, course, course.id, get_raw_scores=get_raw_scores)
+        header, _, student_rows = get_student_grade_summary_rows(request, course, course.id, get_raw_scores=get_raw_scores)
 
         fp = open(fn, 'w')
 
         writer = csv.writer(fp, dialect='excel', quotechar='"', quoting=csv.QUOTE_ALL)
-        writer.writerow(datatable['header'])
-        for datarow in datatable['data']:
+        writer.writerow(header)
+        num_dumped = 0
+        for _, datarow in student_rows:
             encoded_row = [unicode(s).encode('utf-8') for s in datarow]
             writer.writerow(encoded_row)
+            num_dumped += 1
 
         fp.close()
-        print "Done: %d records dumped" % len(datatable['data'])
+        print "Done: %d records dumped" % num_dumped
 
     class DummyRequest(object):
         META = {}
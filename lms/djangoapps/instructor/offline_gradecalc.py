@@ -6,12 +6,19 @@
 # The grades are stored in the OfflineComputedGrade table of the courseware model.
 
 import json
+import multiprocessing
 import time
 
 from json import JSONEncoder
 from courseware import grades, models
 from courseware.courses import get_course_by_id
+from courseware.model_data import MultiUserModelDataCache
 from django.contrib.auth.models import User
+from django.core.cache import cache, get_cache
+from django.db import connection, transaction
+from util.cache import cache as general_cache
+from xmodule.modulestore import django as modulestore_django
+from xmodule.modulestore.xml import XMLModuleStore
 
 
 class MyEncoder(JSONEncoder):
@@ -25,42 +32,179 @@ class MyEncoder(JSONEncoder):
             yield chunk
 
 
-def offline_grade_calculation(course_id):
-    '''
-    Compute grades for all students for a specified course, and save results to the DB.
-    '''
+class DummyRequest(object):
+    """
+    Stand-in for the request object that grades.grade() passes along to
+    get_module, for grading outside of a web request.
+    """
+    META = {}
 
-    tstart = time.time()
-    enrolled_students = User.objects.filter(courseenrollment__course_id=course_id).prefetch_related("groups").order_by('username')
+    def __init__(self):
+        return
+
+    def get_host(self):
+        return 'edx.mit.edu'
+
+    def is_secure(self):
+        return False
+
+
+# Number of students graded, and written to OfflineComputedGrade, as one unit
+GRADE_CHUNK_SIZE = 100
+
+
+def chunk_student_ids(student_ids, chunk_size=GRADE_CHUNK_SIZE):
+    """
+    Split a list of student ids into lists of at most `chunk_size` ids.
+    """
+    return [student_ids[i:i + chunk_size] for i in xrange(0, len(student_ids), chunk_size)]
 
-    enc = MyEncoder()
 
-    class DummyRequest(object):
-        META = {}
-        def __init__(self):
-            return
-        def get_host(self):
-            return 'edx.mit.edu'
-        def is_secure(self):
-            return False
+def enrolled_student_ids(course_id):
+    """
+    Returns the ids of all students enrolled in `course_id`, in id order.
+    """
+    return list(User.objects.filter(
+        courseenrollment__course_id=course_id
+    ).order_by('id').values_list('id', flat=True))
 
-    request = DummyRequest()
 
-    print "%d enrolled students" % len(enrolled_students)
-    course = get_course_by_id(course_id)
+def grade_students(course, student_ids, request):
+    """
+    Grade a chunk of students, yielding (student, gradeset) pairs.
 
-    for student in enrolled_students:
-        gradeset = grades.grade(student, request, course, keep_raw_scores=True)
-        gs = enc.encode(gradeset)
-        ocg, created = models.OfflineComputedGrade.objects.get_or_create(user=student, course_id=course_id)
-        ocg.gradeset = gs
-        ocg.save()
-        print "%s done" % student  	# print statement used because this is run by a management command
+    The state needed to grade the whole chunk is loaded with a few queries
+    through a MultiUserModelDataCache.  Students without any state in the
+    course all get the same grade, so it is only computed once per chunk
+    (unless the course has modules, like foldit, whose score doesn't come
+    from StudentModule).
+    """
+    students = list(User.objects.filter(id__in=student_ids).prefetch_related("groups").order_by('id'))
+    model_data_cache = MultiUserModelDataCache(course.grading_context['all_descriptors'], course.id, students)
+
+    share_empty_grade = not any(
+        descriptor.always_recalculate_grades for descriptor in course.grading_context['all_descriptors']
+    )
+    empty_gradeset = None
+
+    for student in students:
+        student_cache = model_data_cache.for_user(student)
+        if share_empty_grade and not model_data_cache.has_user_state(student):
+            if empty_gradeset is None:
+                empty_gradeset = grades.grade(student, request, course, student_cache, keep_raw_scores=True)
+            yield student, empty_gradeset
+        else:
+            yield student, grades.grade(student, request, course, student_cache, keep_raw_scores=True)
+
+
+@transaction.commit_on_success
+def save_offline_grades(course_id, graded_students):
+    """
+    Store the (student, gradeset) pairs in OfflineComputedGrade, replacing
+    any previously computed grades for those students with one bulk insert.
+    """
+    enc = MyEncoder()
+    offline_grades = [
+        models.OfflineComputedGrade(user=student, course_id=course_id, gradeset=enc.encode(gradeset))
+        for student, gradeset in graded_students
+    ]
+    models.OfflineComputedGrade.objects.filter(
+        course_id=course_id,
+        user__in=[ocg.user_id for ocg in offline_grades],
+    ).delete()
+    models.OfflineComputedGrade.objects.bulk_create(offline_grades)
+    return len(offline_grades)
+
+
+def grade_student_chunk(course_id, student_ids, course=None):
+    """
+    Compute and store offline grades for one chunk of students.
+
+    Returns the number of students graded.
+    """
+    if course is None:
+        course = get_course_by_id(course_id)
+    return save_offline_grades(course_id, list(grade_students(course, student_ids, DummyRequest())))
+
+
+def _init_grading_worker():
+    """
+    Initializer of the worker processes used by offline_grade_calculation.
+    They're forked with the parent's database, modulestore and cache clients,
+    whose sockets are still open, so those are closed and the modulestores
+    made again, for each worker to open connections of its own.  An
+    XMLModuleStore has no connections, and would load every course again,
+    so it's kept.
+    """
+    connection.close()
+    for cache_client in (cache, general_cache):
+        # only the memcached backends hold a connection to close
+        if hasattr(cache_client, 'close'):
+            cache_client.close()
+
+    old_stores = dict(modulestore_django._MODULESTORES)
+    for name, old_store in old_stores.items():
+        if isinstance(old_store, XMLModuleStore):
+            continue
+        del modulestore_django._MODULESTORES[name]
+        store = modulestore_django.modulestore(name)
+        metadata_cache = getattr(old_store, 'metadata_inheritance_cache_subsystem', None)
+        if metadata_cache is not None:
+            if hasattr(metadata_cache, 'close'):
+                metadata_cache.close()
+            store.metadata_inheritance_cache_subsystem = get_cache('mongo_metadata_inheritance')
+        store.request_cache = getattr(old_store, 'request_cache', None)
+
+
+def _grade_student_chunk_worker(args):
+    """
+    Entry point for the process pool used by offline_grade_calculation.
+    """
+    course_id, student_ids = args
+    return grade_student_chunk(course_id, student_ids)
+
+
+def offline_grade_calculation(course_id, num_processes=1, chunk_size=GRADE_CHUNK_SIZE):
+    '''
+    Compute grades for all students for a specified course, and save results to the DB.
+
+    Students are graded in chunks of `chunk_size`.  If `num_processes` is more
+    than one, the chunks are spread over a pool of that many worker processes.
+    '''
+
+    tstart = time.time()
+    student_ids = enrolled_student_ids(course_id)
+    student_chunks = chunk_student_ids(student_ids, chunk_size)
+
+    print "%d enrolled students" % len(student_ids)
+
+    if num_processes > 1:
+        # Each worker opens its own database connection; don't share ours across the fork
+        connection.close()
+        pool = multiprocessing.Pool(num_processes, initializer=_init_grading_worker)
+        try:
+            chunk_results = pool.imap_unordered(
+                _grade_student_chunk_worker,
+                [(course_id, student_chunk) for student_chunk in student_chunks],
+            )
+            num_graded = 0
+            for num_chunk_graded in chunk_results:
+                num_graded += num_chunk_graded
+                print "%d of %d students done" % (num_graded, len(student_ids))  	# print statement used because this is run by a management command
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        course = get_course_by_id(course_id)
+        num_graded = 0
+        for student_chunk in student_chunks:
+            num_graded += grade_student_chunk(course_id, student_chunk, course)
+            print "%d of %d students done" % (num_graded, len(student_ids))
 
     tend = time.time()
     dt = tend - tstart
 
-    ocgl = models.OfflineComputedGradeLog(course_id=course_id, seconds=dt, nstudents=len(enrolled_students))
+    ocgl = models.OfflineComputedGradeLog(course_id=course_id, seconds=dt, nstudents=len(student_ids))
     ocgl.save()
     print ocgl
     print "All Done!"
@@ -77,14 +221,14 @@ def offline_grades_available(course_id):
     return ocgl.latest('created')
 
 
-def student_grades(student, request, course, keep_raw_scores=False, use_offline=False):
+def student_grades(student, request, course, keep_raw_scores=False, use_offline=False, model_data_cache=None):
     '''
     This is the main interface to get grades.  It has the same parameters as grades.grade, as well
     as use_offline.  If use_offline is True then this will look for an offline computed gradeset in the DB.
     '''
 
     if not use_offline:
-        return grades.grade(student, request, course, keep_raw_scores=keep_raw_scores)
+        return grades.grade(student, request, course, model_data_cache, keep_raw_scores=keep_raw_scores)
 
     try:
         ocg = models.OfflineComputedGrade.objects.get(user=student, course_id=course.id)
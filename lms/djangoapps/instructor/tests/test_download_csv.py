@@ -8,6 +8,9 @@ Notes for running by hand:
 django-admin.py test --settings=lms.envs.test --pythonpath=. lms/djangoapps/instructor
 """
 
+from mock import patch
+
+from django.test import TestCase
 from django.test.utils import override_settings
 
 # Need access to internal func to put users in the right group
@@ -15,8 +18,12 @@ from django.contrib.auth.models import Group
 
 from django.core.urlresolvers import reverse
 
+from django.contrib.auth.models import User
+
 from courseware.access import _course_staff_group_name
 from courseware.tests.tests import LoginEnrollmentTestCase, TEST_DATA_XML_MODULESTORE, get_user
+from instructor import views
+from student.tests.factories import CourseEnrollmentFactory
 from xmodule.modulestore.django import modulestore
 import xmodule.modulestore.django
 
@@ -76,3 +83,98 @@ class TestInstructorDashboardGradeDownloadCSV(LoginEnrollmentTestCase):
 '''
 
         self.assertEqual(body, expected_body, msg)
+
+    def test_download_profile_csv(self):
+        course = self.toy
+        url = reverse('instructor_dashboard', kwargs={'course_id': course.id})
+        response = self.client.post(url, {'action': 'Download CSV of all student profile data'})
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename=profiledata_{0}.csv'.format(course.id))
+
+        lines = response.content.replace('\r', '').splitlines()
+        self.assertEqual(lines[0], '"username","email","name","language","location","year_of_birth",'
+                                   '"gender","level_of_education","mailing_address","goals"')
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith('"u2","view2@test.com","Fred Weasley"'))
+
+
+class TestCSVStreaming(TestCase):
+    """
+    Check that CSV exports load and write their rows a chunk at a time
+    """
+    course_id = 'edX/toy/2012_Fall'
+
+    def enroll_students(self, count):
+        """
+        Enroll more students, so that `count` are enrolled
+        """
+        for _ in range(count - User.objects.filter(courseenrollment__course_id=self.course_id).count()):
+            CourseEnrollmentFactory.create(course_id=self.course_id)
+
+    def enrolled_students(self):
+        return User.objects.filter(courseenrollment__course_id=self.course_id)
+
+    def test_chunks_stay_bounded_as_enrollment_grows(self):
+        for num_students in (5, 20, 50):
+            self.enroll_students(num_students)
+            chunks = list(views.queryset_chunks(self.enrolled_students(), 'username', chunk_size=4))
+
+            # no more than a chunk of students is ever loaded at once...
+            self.assertEqual(max(len(chunk) for chunk in chunks), 4)
+            # ...and every student is loaded exactly once, in order
+            usernames = [student.username for chunk in chunks for student in chunk]
+            self.assertEqual(usernames, sorted(self.enrolled_students().values_list('username', flat=True)))
+
+    def test_one_query_per_chunk(self):
+        self.enroll_students(10)
+        students = views.iterate_in_chunks(self.enrolled_students(), chunk_size=4)
+        with self.assertNumQueries(1):
+            next(students)
+        # the rest of the first chunk is already loaded
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                next(students)
+        # and the other two chunks take a query each
+        with self.assertNumQueries(2):
+            self.assertEqual(len(list(students)), 6)
+
+    def test_csv_is_generated_as_rows_arrive(self):
+        consumed = []
+
+        def rows():
+            for index in range(1000):
+                consumed.append(index)
+                yield [index, 'x' * 100]
+
+        csv_chunks = views.generate_csv(['index', 'data'], rows())
+        first_chunk = next(csv_chunks)
+        self.assertTrue(first_chunk.startswith('"index","data"'))
+        # only enough rows for one buffer of CSV have been generated so far
+        self.assertLess(len(consumed), 1000)
+        self.assertLessEqual(len(first_chunk), views.CSV_EXPORT_BUFFER_SIZE + 200)
+
+        rest = ''.join(csv_chunks)
+        self.assertEqual(len(consumed), 1000)
+        self.assertEqual((first_chunk + rest).count('\n'), 1001)
+
+    def rows_failing_at(self, failing_index):
+        """
+        Returns a generator of rows that raises when it gets to failing_index
+        """
+        for index in range(1000):
+            if index == failing_index:
+                raise ValueError('cannot compute row {0}'.format(index))
+            yield [index, 'x' * 100]
+
+    def test_failure_before_streaming_raises(self):
+        with self.assertRaises(ValueError):
+            views.stream_csv('export.csv', ['index', 'data'], self.rows_failing_at(0))
+
+    def test_failure_while_streaming_ends_with_error_row(self):
+        response = views.stream_csv('export.csv', ['index', 'data'], self.rows_failing_at(500))
+        with patch.object(views.log, 'exception') as log_exception:
+            content = ''.join(response)
+        self.assertTrue(content.startswith('"index","data"'))
+        self.assertTrue(content.endswith(views.CSV_EXPORT_ERROR_ROW))
+        self.assertEqual(1, log_exception.call_count)
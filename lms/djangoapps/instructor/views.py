@@ -30,6 +30,7 @@ from courseware import grades
 from courseware.access import (has_access, get_access_group_name,
                                course_beta_test_group_name)
 from courseware.courses import get_course_with_access
+from courseware.model_data import MultiUserModelDataCache
 from courseware.models import StudentModule
 from django_comment_common.models import (Role,
                                           FORUM_ROLE_ADMINISTRATOR,
@@ -41,7 +42,8 @@ from instructor_task.api import (get_running_instructor_tasks,
                                  get_instructor_task_history,
                                  submit_rescore_problem_for_all_students,
                                  submit_rescore_problem_for_student,
-                                 submit_reset_problem_attempts_for_all_students)
+                                 submit_reset_problem_attempts_for_all_students,
+                                 submit_calculate_grades_for_all_students)
 from instructor_task.views import get_task_completion_info
 from mitxmako.shortcuts import render_to_response
 from psychometrics import psychoanalyze
@@ -56,6 +58,15 @@ log = logging.getLogger(__name__)
 FORUM_ROLE_ADD = 'add'
 FORUM_ROLE_REMOVE = 'remove'
 
+# how many rows to load from the database at once when exporting CSV files
+CSV_EXPORT_CHUNK_SIZE = 250
+
+# how many bytes of CSV to collect before sending them on to the browser
+CSV_EXPORT_BUFFER_SIZE = 16 * 1024
+
+# the last row of a streamed CSV file whose export failed partway through
+CSV_EXPORT_ERROR_ROW = '"ERROR: this export failed before it was complete. Please try again."\r\n'
+
 
 def split_by_comma_and_whitespace(s):
     """
@@ -112,16 +123,10 @@ def instructor_dashboard(request, course_id):
     def return_csv(fn, datatable, fp=None):
         """Outputs a CSV file from the contents of a datatable."""
         if fp is None:
-            response = HttpResponse(mimetype='text/csv')
-            response['Content-Disposition'] = 'attachment; filename={0}'.format(fn)
-        else:
-            response = fp
-        writer = csv.writer(response, dialect='excel', quotechar='"', quoting=csv.QUOTE_ALL)
-        writer.writerow(datatable['header'])
-        for datarow in datatable['data']:
-            encoded_row = [unicode(s).encode('utf-8') for s in datarow]
-            writer.writerow(encoded_row)
-        return response
+            return stream_csv(fn, datatable['header'], datatable['data'])
+        for csv_chunk in generate_csv(datatable['header'], datatable['data']):
+            fp.write(csv_chunk)
+        return fp
 
     def get_staff_group(course):
         """Get or create the staff access group"""
@@ -238,18 +243,32 @@ def instructor_dashboard(request, course_id):
 
     elif 'Download CSV of all student grades' in action:
         track.views.server_track(request, 'dump-grades-csv', {}, page='idashboard')
-        return return_csv('grades_{0}.csv'.format(course_id),
-                          get_student_grade_summary_data(request, course, course_id, use_offline=use_offline))
+        header, _, student_rows = get_student_grade_summary_rows(request, course, course_id, use_offline=use_offline)
+        rows = (datarow for _, datarow in student_rows)
+        return stream_csv('grades_{0}.csv'.format(course_id), header, rows)
 
     elif 'Download CSV of all RAW grades' in action:
         track.views.server_track(request, 'dump-grades-csv-raw', {}, page='idashboard')
-        return return_csv('grades_{0}_raw.csv'.format(course_id),
-                          get_student_grade_summary_data(request, course, course_id, get_raw_scores=True, use_offline=use_offline))
+        header, _, student_rows = get_student_grade_summary_rows(request, course, course_id, get_raw_scores=True,
+                                                                 use_offline=use_offline)
+        rows = (datarow for _, datarow in student_rows)
+        return stream_csv('grades_{0}_raw.csv'.format(course_id), header, rows)
 
     elif 'Download CSV of answer distributions' in action:
         track.views.server_track(request, 'dump-answer-dist-csv', {}, page='idashboard')
         return return_csv('answer_dist_{0}.csv'.format(course_id), get_answers_distribution(request, course_id))
 
+    elif 'Calculate grades for all students in the background' in action:
+        try:
+            instructor_task = submit_calculate_grades_for_all_students(request, course_id)
+            if instructor_task is None:
+                msg += '<font color="red">Failed to create a background task for calculating grades.</font>'
+            else:
+                track.views.server_track(request, 'calculate grades for all students in {course}'.format(course=course_id), {}, page='idashboard')
+        except Exception as e:
+            log.error("Encountered exception from calculating grades: {0}".format(e))
+            msg += '<font color="red">Failed to create a background task for calculating grades: {0}.</font>'.format(e.message)
+
     elif 'Dump description of graded assignments configuration' in action:
         track.views.server_track(request, action, {}, page='idashboard')
         msg += dump_grading_context(course)
@@ -507,18 +526,17 @@ def instructor_dashboard(request, course_id):
     # DataDump
 
     elif 'Download CSV of all student profile data' in action:
-        enrolled_students = User.objects.filter(courseenrollment__course_id=course_id).order_by('username').select_related("profile")
+        enrolled_students = User.objects.filter(courseenrollment__course_id=course_id).select_related("profile")
         profkeys = ['name', 'language', 'location', 'year_of_birth', 'gender', 'level_of_education',
                     'mailing_address', 'goals']
-        datatable = {'header': ['username', 'email'] + profkeys}
+        header = ['username', 'email'] + profkeys
 
         def getdat(u):
             p = u.profile
             return [u.username, u.email] + [getattr(p, x, '') for x in profkeys]
 
-        datatable['data'] = [getdat(u) for u in enrolled_students]
-        datatable['title'] = 'Student profile data for course %s' % course_id
-        return return_csv('profiledata_%s.csv' % course_id, datatable)
+        rows = (getdat(u) for u in iterate_in_chunks(enrolled_students, 'username'))
+        return stream_csv('profiledata_%s.csv' % course_id, header, rows)
 
     elif 'Download CSV of all responses to problem' in action:
         problem_to_dump = request.POST.get('problem_to_dump', '')
@@ -530,18 +548,19 @@ def instructor_dashboard(request, course_id):
             module_state_key = "i4x://" + org + "/" + course_name + "/problem/" + problem_to_dump
             smdat = StudentModule.objects.filter(course_id=course_id,
                                                  module_state_key=module_state_key)
-            smdat = smdat.order_by('student')
-            msg += "Found %d records to dump " % len(smdat)
+            smdat = smdat.select_related('student')
+            smcount = smdat.count()
+            msg += "Found %d records to dump " % smcount
         except Exception as err:
             msg += "<font color='red'>Couldn't find module with that urlname.  </font>"
             msg += "<pre>%s</pre>" % escape(err)
-            smdat = []
+            smcount = 0
 
-        if smdat:
-            datatable = {'header': ['username', 'state']}
-            datatable['data'] = [[x.student.username, x.state] for x in smdat]
-            datatable['title'] = 'Student state for problem %s' % problem_to_dump
-            return return_csv('student_state_from_%s.csv' % problem_to_dump, datatable)
+        if smcount:
+            # there is one StudentModule per student for the problem, so
+            # they can be ordered (and chunked) by student
+            rows = ([x.student.username, x.state] for x in iterate_in_chunks(smdat, 'student'))
+            return stream_csv('student_state_from_%s.csv' % problem_to_dump, ['username', 'state'], rows)
 
     #----------------------------------------
     # Group management
@@ -967,6 +986,149 @@ def remove_user_from_group(request, username_or_email, group, group_title, event
     return _add_or_remove_user_group(request, username_or_email, group, group_title, event_name, False)
 
 
+def iterate_in_chunks(queryset, key='pk', chunk_size=None):
+    """
+    Iterate over the objects of queryset, ordered by key, loading at most
+    chunk_size (by default CSV_EXPORT_CHUNK_SIZE) of them at a time.
+
+    key must be unique within the queryset.  Each chunk is queried for the
+    objects after the last one of the previous chunk, so that memory use
+    doesn't grow with the size of the queryset (unlike iterating over the
+    queryset, which caches every object).
+    """
+    for chunk in queryset_chunks(queryset, key, chunk_size):
+        for obj in chunk:
+            yield obj
+
+
+def queryset_chunks(queryset, key='pk', chunk_size=None):
+    """
+    Yield lists of at most chunk_size objects of queryset, ordered by key.
+    See iterate_in_chunks.
+    """
+    chunk_size = chunk_size or CSV_EXPORT_CHUNK_SIZE
+    meta = queryset.model._meta
+    if key == 'pk':
+        attname = meta.pk.attname
+    else:
+        attname = meta.get_field(key).attname
+
+    queryset = queryset.order_by(key)
+    last_value = None
+    while True:
+        chunk_queryset = queryset
+        if last_value is not None:
+            chunk_queryset = chunk_queryset.filter(**{key + '__gt': last_value})
+        chunk = list(chunk_queryset[:chunk_size])
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_value = getattr(chunk[-1], attname)
+
+
+def generate_csv(header, rows):
+    """
+    Generate a CSV file of header and rows, a few kilobytes at a time.
+
+    rows can be any iterable (including a generator), and is only consumed
+    as the file is generated.
+    """
+    csv_buffer = StringIO()
+    writer = csv.writer(csv_buffer, dialect='excel', quotechar='"', quoting=csv.QUOTE_ALL)
+    writer.writerow(header)
+    for datarow in rows:
+        encoded_row = [unicode(s).encode('utf-8') for s in datarow]
+        writer.writerow(encoded_row)
+        if csv_buffer.tell() >= CSV_EXPORT_BUFFER_SIZE:
+            yield csv_buffer.getvalue()
+            csv_buffer.seek(0)
+            csv_buffer.truncate()
+    yield csv_buffer.getvalue()
+
+
+def stream_csv(filename, header, rows):
+    """
+    Returns an HttpResponse for downloading a CSV file of header and rows,
+    which generates the file while it is being sent.
+
+    The first chunk is generated before returning, so an export that fails
+    from the start raises here.  Once the response has started it's too late
+    for an error status, so a later failure is logged and ends the file with
+    CSV_EXPORT_ERROR_ROW instead.
+    """
+    csv_chunks = generate_csv(header, rows)
+    first_chunk = next(csv_chunks)
+
+    def stream():
+        yield first_chunk
+        try:
+            for csv_chunk in csv_chunks:
+                yield csv_chunk
+        except Exception:
+            log.exception("Failed to generate %s", filename)
+            yield CSV_EXPORT_ERROR_ROW
+
+    response = HttpResponse(stream(), mimetype='text/csv')
+    response['Content-Disposition'] = 'attachment; filename={0}'.format(filename)
+    return response
+
+
+def get_student_grade_summary_rows(request, course, course_id, get_grades=True, get_raw_scores=False, use_offline=False):
+    '''
+    Return the header, the assignments and a generator of (student, datarow)
+    for the rows of get_student_grade_summary_data.
+
+    Students are loaded, and graded, a chunk at a time as the rows are
+    generated, so this can be used to stream the grades of a large course.
+    '''
+    enrolled_students = User.objects.filter(courseenrollment__course_id=course_id).prefetch_related("groups").select_related("profile")
+
+    header = ['ID', 'Username', 'Full Name', 'edX email', 'External email']
+    assignments = []
+    if get_grades:
+        first_students = enrolled_students.order_by('username')[:1]
+        if first_students:
+            # just to construct the header
+            gradeset = student_grades(first_students[0], request, course, keep_raw_scores=get_raw_scores, use_offline=use_offline)
+            # log.debug('student {0} gradeset {1}'.format(enrolled_students[0], gradeset))
+            if get_raw_scores:
+                assignments += [score.section for score in gradeset['raw_scores']]
+            else:
+                assignments += [x['label'] for x in gradeset['section_breakdown']]
+    header += assignments
+
+    def rows():
+        for students in queryset_chunks(enrolled_students, 'username'):
+            model_data_cache = None
+            if get_grades and not use_offline:
+                # load the state of the whole chunk of students at once
+                model_data_cache = MultiUserModelDataCache(course.grading_context['all_descriptors'], course_id, students)
+
+            for student in students:
+                datarow = [student.id, student.username, student.profile.name, student.email]
+                try:
+                    datarow.append(student.externalauthmap.external_email)
+                except:  # ExternalAuthMap.DoesNotExist
+                    datarow.append('')
+
+                if get_grades:
+                    gradeset = student_grades(student, request, course, keep_raw_scores=get_raw_scores, use_offline=use_offline,
+                                              model_data_cache=model_data_cache.for_user(student) if model_data_cache else None)
+                    log.debug('student={0}, gradeset={1}'.format(student, gradeset))
+                    if get_raw_scores:
+                        # TODO (ichuang) encode Score as dict instead of as list, so score[0] -> score['earned']
+                        sgrades = [(getattr(score, 'earned', '') or score[0]) for score in gradeset['raw_scores']]
+                    else:
+                        sgrades = [x['percent'] for x in gradeset['section_breakdown']]
+                    datarow += sgrades
+                    student.grades = sgrades  	# store in student object
+
+                yield student, datarow
+
+    return header, assignments, rows()
+
+
 def get_student_grade_summary_data(request, course, course_id, get_grades=True, get_raw_scores=False, use_offline=False):
     '''
     Return data arrays with student identity and grades for specified course.
@@ -984,44 +1146,15 @@ def get_student_grade_summary_data(request, course, course_id, get_grades=True,
 
     If get_raw_scores=True, then instead of grade summaries, the raw grades for all graded modules are returned.
 
+    This holds every student's grades in memory; use get_student_grade_summary_rows
+    to generate them a chunk of students at a time instead.
     '''
-    enrolled_students = User.objects.filter(courseenrollment__course_id=course_id).prefetch_related("groups").order_by('username')
-
-    header = ['ID', 'Username', 'Full Name', 'edX email', 'External email']
-    assignments = []
-    if get_grades and enrolled_students.count() > 0:
-        # just to construct the header
-        gradeset = student_grades(enrolled_students[0], request, course, keep_raw_scores=get_raw_scores, use_offline=use_offline)
-        # log.debug('student {0} gradeset {1}'.format(enrolled_students[0], gradeset))
-        if get_raw_scores:
-            assignments += [score.section for score in gradeset['raw_scores']]
-        else:
-            assignments += [x['label'] for x in gradeset['section_breakdown']]
-    header += assignments
-
-    datatable = {'header': header, 'assignments': assignments, 'students': enrolled_students}
-    data = []
-
-    for student in enrolled_students:
-        datarow = [student.id, student.username, student.profile.name, student.email]
-        try:
-            datarow.append(student.externalauthmap.external_email)
-        except:  # ExternalAuthMap.DoesNotExist
-            datarow.append('')
-
-        if get_grades:
-            gradeset = student_grades(student, request, course, keep_raw_scores=get_raw_scores, use_offline=use_offline)
-            log.debug('student={0}, gradeset={1}'.format(student, gradeset))
-            if get_raw_scores:
-                # TODO (ichuang) encode Score as dict instead of as list, so score[0] -> score['earned']
-                sgrades = [(getattr(score, 'earned', '') or score[0]) for score in gradeset['raw_scores']]
-            else:
-                sgrades = [x['percent'] for x in gradeset['section_breakdown']]
-            datarow += sgrades
-            student.grades = sgrades  	# store in student object
-
-        data.append(datarow)
-    datatable['data'] = data
+    header, assignments, student_rows = get_student_grade_summary_rows(request, course, course_id, get_grades=get_grades,
+                                                                       get_raw_scores=get_raw_scores, use_offline=use_offline)
+    datatable = {'header': header, 'assignments': assignments, 'students': [], 'data': []}
+    for student, datarow in student_rows:
+        datatable['students'].append(student)
+        datatable['data'].append(datarow)
     return datatable
 
 #-----------------------------------------------------------------------------
@@ -1039,12 +1172,16 @@ def gradebook(request, course_id):
     enrolled_students = User.objects.filter(courseenrollment__course_id=course_id).order_by('username').select_related("profile")
 
     # TODO (vshnayder): implement pagination.
-    enrolled_students = enrolled_students[:1000]   # HACK!
+    enrolled_students = list(enrolled_students[:1000])   # HACK!
+
+    # load the state of all the students at once, rather than student by student
+    model_data_cache = MultiUserModelDataCache(course.grading_context['all_descriptors'], course_id, enrolled_students)
 
     student_info = [{'username': student.username,
                      'id': student.id,
                      'email': student.email,
-                     'grade_summary': student_grades(student, request, course),
+                     'grade_summary': student_grades(student, request, course,
+                                                     model_data_cache=model_data_cache.for_user(student)),
                      'realname': student.profile.name,
                      }
                     for student in enrolled_students]
@@ -1314,7 +1451,7 @@ def get_answers_distribution(request, course_id):
     """
     course = get_course_with_access(request.user, course_id, 'staff')
 
-    dist = grades.answer_distributions(request, course)
+    dist = grades.answer_distributions(course, num_processes=settings.ANSWER_DISTRIBUTION_PROCESSES)
 
     d = {}
     d['header'] = ['url_name', 'display name', 'answer id', 'answer', 'count']
@@ -14,10 +14,12 @@ from xmodule.modulestore.django import modulestore
 from instructor_task.models import InstructorTask
 from instructor_task.tasks import (rescore_problem,
                                    reset_problem_attempts,
-                                   delete_problem_state)
+                                   delete_problem_state,
+                                   calculate_grades)
 
 from instructor_task.api_helper import (check_arguments_for_rescoring,
                                         encode_problem_and_student_input,
+                                        encode_course_input,
                                         submit_task)
 
 
@@ -162,3 +164,26 @@ def submit_delete_problem_state_for_all_students(request, course_id, problem_url
     task_class = delete_problem_state
     task_input, task_key = encode_problem_and_student_input(problem_url)
     return submit_task(request, task_type, task_class, course_id, task_input, task_key)
+
+
+def submit_calculate_grades_for_all_students(request, course_id):
+    """
+    Request grades to be computed for all students in a course as a background task.
+
+    The grades are stored as offline computed grades, which the instructor dashboard
+    can then use for grade dumps and downloads.  The work is split into chunks of
+    students that are graded in parallel by subtasks.
+
+    AlreadyRunningError is raised if grades are already being computed for the course.
+
+    This method makes sure the InstructorTask entry is committed.
+    When called from any view that is wrapped by TransactionMiddleware,
+    and thus in a "commit-on-success" transaction, an autocommit buried within here
+    will cause any pending transaction to be committed by a successful
+    save here.  Any future database operations will take place in a
+    separate transaction.
+    """
+    task_type = 'calculate_grades'
+    task_class = calculate_grades
+    task_input, task_key = encode_course_input(task_type)
+    return submit_task(request, task_type, task_class, course_id, task_input, task_key)
@@ -142,6 +142,20 @@ def _update_instructor_task(instructor_task, task_result):
         instructor_task.save()
 
 
+def _has_subtasks(instructor_task):
+    """
+    Returns True if the work of `instructor_task` is divided among subtasks,
+    which record their progress in the entry's task_output.
+    """
+    if instructor_task.task_output is None:
+        return False
+    try:
+        task_output = json.loads(instructor_task.task_output)
+    except ValueError:
+        return False
+    return isinstance(task_output, dict) and 'subtasks' in task_output
+
+
 def get_updated_instructor_task(task_id):
     """
     Returns InstructorTask object corresponding to a given `task_id`.
@@ -157,8 +171,9 @@ def get_updated_instructor_task(task_id):
         return None
 
     # if the task is not already known to be done, then we need to query
-    # the underlying task's result object:
-    if instructor_task.task_state not in READY_STATES:
+    # the underlying task's result object.  Tasks whose work is done by
+    # subtasks keep their entry up to date themselves.
+    if instructor_task.task_state not in READY_STATES and not _has_subtasks(instructor_task):
         result = AsyncResult(task_id)
         _update_instructor_task(instructor_task, result)
 
@@ -232,6 +247,17 @@ def encode_problem_and_student_input(problem_url, student=None):
     return task_input, task_key
 
 
+def encode_course_input(task_type):
+    """
+    Encode task_key and task_input values for a task that applies to a whole
+    course, and so takes no further input.  Only one such task of each
+    `task_type` can run at a time in a course.
+    """
+    task_input = {}
+    task_key = hashlib.md5(task_type).hexdigest()
+    return task_input, task_key
+
+
 def submit_task(request, task_type, task_class, course_id, task_input, task_key):
     """
     Helper method to submit a task.
@@ -5,6 +5,8 @@ running state of a course.
 At present, these tasks all operate on StudentModule objects in one way or another,
 so they share a visitor architecture.  Each task defines an "update function" that
 takes a module_descriptor, a particular StudentModule object, and xmodule_instance_args.
+Tasks whose updates don't need an xmodule instance use a "bulk" update function instead,
+which is passed a list of thousands of StudentModule objects at a time.
 
 A task may optionally specify a "filter function" that takes a query for StudentModule
 objects, and adds additional filter clauses.
@@ -22,8 +24,16 @@ of the query for traversing StudentModule objects.
 from celery import task
 from instructor_task.tasks_helper import (update_problem_module_state,
                                           rescore_problem_module_state,
-                                          reset_attempts_module_state,
-                                          delete_problem_module_state)
+                                          reset_attempts_module_states,
+                                          delete_problem_module_states,
+                                          perform_module_state_update_chunk,
+                                          start_grade_calculation,
+                                          perform_grade_calculation_chunk)
+
+
+def _filter_done_modules(modules_to_update):
+    """Limits rescoring to the problems that students have submitted."""
+    return modules_to_update.filter(state__contains='"done": true')
 
 
 @task
@@ -44,13 +54,28 @@ def rescore_problem(entry_id, xmodule_instance_args):
 
     `xmodule_instance_args` provides information needed by _get_module_instance_for_task()
     to instantiate an xmodule instance.
+
+    When all students' submissions are rescored, they are split into chunks, and a
+    rescore_problem_chunk subtask is submitted for each chunk, so the rescoring is
+    spread over all available workers.
     """
     action_name = 'rescored'
     update_fcn = rescore_problem_module_state
-    filter_fcn = lambda(modules_to_update): modules_to_update.filter(state__contains='"done": true')
+    filter_fcn = _filter_done_modules
     return update_problem_module_state(entry_id,
                                        update_fcn, action_name, filter_fcn=filter_fcn,
-                                       xmodule_instance_args=xmodule_instance_args)
+                                       xmodule_instance_args=xmodule_instance_args,
+                                       chunk_task=rescore_problem_chunk)
+
+
+@task
+def rescore_problem_chunk(entry_id, first_id, last_id, xmodule_instance_args):
+    """Rescores the submitted problems whose StudentModule ids run from `first_id` to
+    `last_id`, as part of the rescore_problem task for InstructorTask `entry_id`.
+    """
+    return perform_module_state_update_chunk(entry_id, first_id, last_id,
+                                             rescore_problem_module_state, 'rescored', _filter_done_modules,
+                                             xmodule_instance_args)
 
 
 @task
@@ -69,10 +94,11 @@ def reset_problem_attempts(entry_id, xmodule_instance_args):
     to instantiate an xmodule instance.
     """
     action_name = 'reset'
-    update_fcn = reset_attempts_module_state
+    update_fcn = reset_attempts_module_states
     return update_problem_module_state(entry_id,
                                        update_fcn, action_name, filter_fcn=None,
-                                       xmodule_instance_args=xmodule_instance_args)
+                                       xmodule_instance_args=xmodule_instance_args,
+                                       bulk=True)
 
 
 @task
@@ -91,7 +117,34 @@ def delete_problem_state(entry_id, xmodule_instance_args):
     to instantiate an xmodule instance.
     """
     action_name = 'deleted'
-    update_fcn = delete_problem_module_state
+    update_fcn = delete_problem_module_states
     return update_problem_module_state(entry_id,
                                        update_fcn, action_name, filter_fcn=None,
-                                       xmodule_instance_args=xmodule_instance_args)
+                                       xmodule_instance_args=xmodule_instance_args,
+                                       bulk=True)
+
+
+@task
+def calculate_grades(entry_id, xmodule_instance_args):
+    """Computes grades for all students enrolled in a course, and stores them in OfflineComputedGrade.
+
+    `entry_id` is the id value of the InstructorTask entry that corresponds to this task.
+    The entry contains the `course_id` that identifies the course.  No other task_input is needed.
+
+    The enrolled students are split into chunks, and a calculate_grades_chunk subtask is
+    submitted for each chunk, so the grading is spread over all available workers.  The
+    subtasks add their progress into the InstructorTask entry, and the last one to finish
+    marks it as complete.
+
+    `xmodule_instance_args` is accepted for consistency with the other instructor tasks,
+    but is not used: grades are computed without tracking.
+    """
+    return start_grade_calculation(entry_id, calculate_grades_chunk)
+
+
+@task
+def calculate_grades_chunk(entry_id, student_ids):
+    """Computes and stores grades for the students with ids `student_ids`, as part of
+    the calculate_grades task for InstructorTask `entry_id`.
+    """
+    return perform_grade_calculation_chunk(entry_id, student_ids)
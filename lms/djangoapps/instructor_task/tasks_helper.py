@@ -5,6 +5,8 @@ running state of a course.
 """
 
 import json
+from itertools import groupby
+from operator import attrgetter
 from time import time
 from sys import exc_info
 from traceback import format_exc
@@ -12,20 +14,24 @@ from traceback import format_exc
 from celery import current_task
 from celery.utils.log import get_task_logger
 from celery.signals import worker_process_init
-from celery.states import SUCCESS, FAILURE
+from celery.states import SUCCESS, FAILURE, READY_STATES
 
 from django.contrib.auth.models import User
-from django.db import transaction
+from django.db import connection, transaction
+from django.utils import timezone
 from dogapi import dog_stats_api
 
+from capa.problem_cache import memoized_grading
 from xmodule.modulestore.django import modulestore
 
 import mitxmako.middleware as middleware
-from track.views import task_track
+from track.views import task_event, task_track, write_events
 
-from courseware.models import StudentModule
-from courseware.model_data import ModelDataCache
+from courseware import grade_store
+from courseware.models import StudentModule, StudentModuleHistory, OfflineComputedGradeLog
+from courseware.model_data import ModelDataCache, MultiUserModelDataCache, chunks, get_child_descriptors
 from courseware.module_render import get_module_for_descriptor_internal
+from instructor.offline_gradecalc import chunk_student_ids, enrolled_student_ids, grade_student_chunk
 from instructor_task.models import InstructorTask, PROGRESS
 
 # define different loggers for use within tasks and on client side
@@ -34,6 +40,19 @@ TASK_LOG = get_task_logger(__name__)
 # define value to use when no task_id is provided:
 UNKNOWN_TASK_ID = 'unknown-task_id'
 
+# number of StudentModules updated by each subtask, when a task's work is split into subtasks
+MODULE_STATE_CHUNK_SIZE = 100
+
+# minimum number of seconds between progress updates of a task updating StudentModules itself
+PROGRESS_UPDATE_INTERVAL = 1.0
+
+# number of StudentModules read and written together by the bulk update functions
+BULK_CHUNK_SIZE = 2000
+
+# most parameters in one statement written by the bulk update functions:
+# sqlite allows no more than 999
+BULK_WRITE_PARAMS = 900
+
 
 def initialize_mako(sender=None, conf=None, **kwargs):
     """
@@ -71,7 +90,7 @@ def _get_current_task():
 
 
 def _perform_module_state_update(course_id, module_state_key, student_identifier, update_fcn, action_name, filter_fcn,
-                                 xmodule_instance_args):
+                                 xmodule_instance_args, bulk=False):
     """
     Performs generic update by visiting StudentModule instances with the update_fcn provided.
 
@@ -89,6 +108,9 @@ def _perform_module_state_update(course_id, module_state_key, student_identifier
     the update is successful; False indicates the update on the particular student module failed.
     A raised exception indicates a fatal condition -- that no other student modules should be considered.
 
+    If `bulk` is True, the `update_fcn` is instead passed a list of up to BULK_CHUNK_SIZE StudentModules
+    (with their students) in place of a single one, and returns the number of them that it updated.
+
     The return value is a dict containing the task's results, with the following keys:
 
           'attempted': number of attempts made
@@ -109,26 +131,7 @@ def _perform_module_state_update(course_id, module_state_key, student_identifier
     # find the problem descriptor:
     module_descriptor = modulestore().get_instance(course_id, module_state_key)
 
-    # find the module in question
-    modules_to_update = StudentModule.objects.filter(course_id=course_id,
-                                                     module_state_key=module_state_key)
-
-    # give the option of rescoring an individual student. If not specified,
-    # then rescores all students who have responded to a problem so far
-    student = None
-    if student_identifier is not None:
-        # if an identifier is supplied, then look for the student,
-        # and let it throw an exception if none is found.
-        if "@" in student_identifier:
-            student = User.objects.get(email=student_identifier)
-        elif student_identifier is not None:
-            student = User.objects.get(username=student_identifier)
-
-    if student is not None:
-        modules_to_update = modules_to_update.filter(student_id=student.id)
-
-    if filter_fcn is not None:
-        modules_to_update = filter_fcn(modules_to_update)
+    modules_to_update = _get_modules_to_update(course_id, module_state_key, student_identifier, filter_fcn)
 
     # perform the main loop
     num_updated = 0
@@ -148,28 +151,190 @@ def _perform_module_state_update(course_id, module_state_key, student_identifier
 
     task_progress = get_task_progress()
     _get_current_task().update_state(state=PROGRESS, meta=task_progress)
-    for module_to_update in modules_to_update:
-        num_attempted += 1
+    last_update_time = time()
+
+    if bulk:
+        updates = _chunk_modules(modules_to_update, BULK_CHUNK_SIZE)
+        timer_name = 'instructor_tasks.module.time.chunk'
+    else:
+        updates = modules_to_update
+        timer_name = 'instructor_tasks.module.time.step'
+
+    for update in updates:
+        num_attempted += len(update) if bulk else 1
         # There is no try here:  if there's an error, we let it throw, and the task will
         # be marked as FAILED, with a stack trace.
-        with dog_stats_api.timer('instructor_tasks.module.time.step', tags=['action:{name}'.format(name=action_name)]):
-            if update_fcn(module_descriptor, module_to_update, xmodule_instance_args):
+        with dog_stats_api.timer(timer_name, tags=['action:{name}'.format(name=action_name)]):
+            if bulk:
+                num_updated += update_fcn(module_descriptor, update, xmodule_instance_args)
+            elif update_fcn(module_descriptor, update, xmodule_instance_args):
                 # If the update_fcn returns true, then it performed some kind of work.
                 # Logging of failures is left to the update_fcn itself.
                 num_updated += 1
 
-        # update task status:
-        task_progress = get_task_progress()
-        _get_current_task().update_state(state=PROGRESS, meta=task_progress)
+        # update task status, at most every PROGRESS_UPDATE_INTERVAL seconds:
+        if time() - last_update_time >= PROGRESS_UPDATE_INTERVAL:
+            task_progress = get_task_progress()
+            _get_current_task().update_state(state=PROGRESS, meta=task_progress)
+            last_update_time = time()
+
+    return get_task_progress()
+
+
+def _chunk_modules(modules_to_update, chunk_size):
+    """
+    Yields the StudentModules of the query `modules_to_update`, with their students,
+    in lists of up to `chunk_size` in order of id.
+
+    Each chunk is queried for after the previous one has been handled, starting
+    from the last id in it, so chunks can be updated or deleted as they go.
+    """
+    modules_to_update = modules_to_update.select_related('student').order_by('id')
+    last_id = 0
+    while True:
+        module_chunk = list(modules_to_update.filter(id__gt=last_id)[:chunk_size])
+        if not module_chunk:
+            return
+        last_id = module_chunk[-1].id
+        yield module_chunk
+
+
+def _lock_modules(student_modules):
+    """
+    Reads `student_modules` again, in order of id, locking their rows until the
+    current transaction ends, so that their states can't be written by anyone
+    else between being read and being written back.  Modules that have been
+    deleted since are left out.
+    """
+    module_ids = [student_module.id for student_module in student_modules]
+    return list(StudentModule.objects.select_for_update().select_related('student')
+                .filter(id__in=module_ids).order_by('id'))
+
+
+def _get_modules_to_update(course_id, module_state_key, student_identifier, filter_fcn):
+    """
+    Returns the query for the StudentModules that match `course_id` and
+    `module_state_key`, limited to those of `student_identifier` if it is not None,
+    and filtered by `filter_fcn` if it is not None.
+    """
+    # find the module in question
+    modules_to_update = StudentModule.objects.filter(course_id=course_id,
+                                                     module_state_key=module_state_key)
+
+    # give the option of rescoring an individual student. If not specified,
+    # then rescores all students who have responded to a problem so far
+    student = None
+    if student_identifier is not None:
+        # if an identifier is supplied, then look for the student,
+        # and let it throw an exception if none is found.
+        if "@" in student_identifier:
+            student = User.objects.get(email=student_identifier)
+        elif student_identifier is not None:
+            student = User.objects.get(username=student_identifier)
+
+    if student is not None:
+        modules_to_update = modules_to_update.filter(student_id=student.id)
+
+    if filter_fcn is not None:
+        modules_to_update = filter_fcn(modules_to_update)
+
+    return modules_to_update
+
+
+def _start_module_state_subtasks(entry, module_state_key, chunk_task, action_name, filter_fcn,
+                                 xmodule_instance_args):
+    """
+    Splits the StudentModules to be updated by InstructorTask `entry` into chunks
+    of consecutive ids, and submits a `chunk_task` subtask to update each of them.
+
+    `chunk_task` is called with the entry's id, the first and last StudentModule id
+    of its chunk, and `xmodule_instance_args`.  The subtasks run in parallel on
+    whatever celery workers are available, and add their counts into the entry
+    through update_subtask_progress().  Returns the initial progress.
+    """
+    # find the problem descriptor, so that a missing problem fails here rather than in every subtask:
+    modulestore().get_instance(entry.course_id, module_state_key)
+
+    modules_to_update = _get_modules_to_update(entry.course_id, module_state_key, None, filter_fcn)
+    module_ids = list(modules_to_update.order_by('id').values_list('id', flat=True))
+    id_chunks = list(chunks(module_ids, MODULE_STATE_CHUNK_SIZE))
+
+    task_progress = initialize_subtask_progress(entry, action_name, len(module_ids), len(id_chunks))
+    _get_current_task().update_state(state=PROGRESS, meta=task_progress)
+
+    fmt = 'Starting task "{task_id}": course "{course_id}" problem "{state_key}": {num_modules} modules in {num_chunks} subtasks'
+    TASK_LOG.info(fmt.format(task_id=entry.task_id, course_id=entry.course_id, state_key=module_state_key,
+                             num_modules=len(module_ids), num_chunks=len(id_chunks)))
+
+    for id_chunk in id_chunks:
+        chunk_task.apply_async((entry.id, id_chunk[0], id_chunk[-1], xmodule_instance_args))
 
     return task_progress
 
 
+def perform_module_state_update_chunk(entry_id, first_id, last_id, update_fcn, action_name, filter_fcn,
+                                      xmodule_instance_args):
+    """
+    Performs the update of InstructorTask `entry_id` on the StudentModules with ids
+    from `first_id` to `last_id`, as one of the subtasks started for it, and adds
+    the counts of modules attempted and updated to the entry's progress.
+
+    The state of all the students in the chunk is loaded at once, and each
+    student's ModelDataCache is passed to `update_fcn` as a fourth argument.
+    Problems are graded within capa's memoized_grading(), so students who gave
+    the same answers share their grades, and the cache's hits and misses are
+    added to the entry's progress too.  Other arguments are as for
+    _perform_module_state_update.  If `update_fcn` raises an exception, no more
+    modules in the chunk are updated, and the exception is recorded in the entry.
+
+    Returns the number of modules updated.
+    """
+    entry = InstructorTask.objects.get(pk=entry_id)
+    course_id = entry.course_id
+    module_state_key = json.loads(entry.task_input).get('problem_url')
+
+    num_attempted = 0
+    num_updated = 0
+    grading = None
+    try:
+        with dog_stats_api.timer('instructor_tasks.module.time.chunk', tags=['action:{name}'.format(name=action_name)]), \
+                memoized_grading() as grading:
+            module_descriptor = modulestore().get_instance(course_id, module_state_key)
+            modules_to_update = _get_modules_to_update(course_id, module_state_key, None, filter_fcn)
+            modules_to_update = list(modules_to_update.filter(id__gte=first_id, id__lte=last_id)
+                                                      .select_related('student').order_by('id'))
+            model_data_cache = MultiUserModelDataCache(get_child_descriptors(module_descriptor), course_id,
+                                                       [module_to_update.student for module_to_update in modules_to_update])
+
+            for module_to_update in modules_to_update:
+                num_attempted += 1
+                if update_fcn(module_descriptor, module_to_update, xmodule_instance_args,
+                              model_data_cache.for_user(module_to_update.student)):
+                    num_updated += 1
+    except Exception:
+        TASK_LOG.exception("updating modules %s to %s for instructor task %s failed", first_id, last_id, entry_id)
+        update_subtask_progress(entry_id, num_attempted, num_updated, failed=True, exception=exc_info()[1],
+                                grading=grading)
+        raise
+
+    entry = update_subtask_progress(entry_id, num_attempted, num_updated, grading=grading)
+    if entry.task_state in READY_STATES:
+        fmt = 'Finishing task "{task_id}": course "{course_id}" problem "{state_key}": final: {progress}'
+        TASK_LOG.info(fmt.format(task_id=entry.task_id, course_id=course_id, state_key=module_state_key,
+                                 progress=entry.task_output))
+    return num_updated
+
+
 def update_problem_module_state(entry_id, update_fcn, action_name, filter_fcn,
-                                xmodule_instance_args):
+                                xmodule_instance_args, chunk_task=None, bulk=False):
     """
     Performs generic update by visiting StudentModule instances with the update_fcn provided.
 
+    If a `chunk_task` is provided and the update is for all students, the StudentModules
+    are instead split into chunks, each of which is updated by a `chunk_task` subtask
+    (see _start_module_state_subtasks).  The initial progress is returned, and the
+    subtasks keep the entry up to date until the last of them finishes.
+
     The `entry_id` is the primary key for the InstructorTask entry representing the task.  This function
     updates the entry on success and failure of the _perform_module_state_update function it
     wraps.  It is setting the entry's value for task_state based on what Celery would set it to once
@@ -223,17 +388,16 @@ def update_problem_module_state(entry_id, update_fcn, action_name, filter_fcn,
     try:
         # Check that the task_id submitted in the InstructorTask matches the current task
         # that is running.
-        request_task_id = _get_current_task().request.id
-        if task_id != request_task_id:
-            fmt = 'Requested task "{task_id}" did not match actual task "{actual_id}"'
-            message = fmt.format(task_id=task_id, course_id=course_id, state_key=module_state_key, actual_id=request_task_id)
-            TASK_LOG.error(message)
-            raise UpdateProblemModuleStateError(message)
+        _check_task_id(entry)
+
+        if chunk_task is not None and student_ident is None:
+            return _start_module_state_subtasks(entry, module_state_key, chunk_task, action_name, filter_fcn,
+                                                xmodule_instance_args)
 
         # Now do the work:
         with dog_stats_api.timer('instructor_tasks.module.time.overall', tags=['action:{name}'.format(name=action_name)]):
             task_progress = _perform_module_state_update(course_id, module_state_key, student_ident, update_fcn,
-                                                         action_name, filter_fcn, xmodule_instance_args)
+                                                         action_name, filter_fcn, xmodule_instance_args, bulk=bulk)
         # If we get here, we assume we've succeeded, so update the InstructorTask entry in anticipation.
         # But we do this within the try, in case creating the task_output causes an exception to be
         # raised.
@@ -243,12 +407,7 @@ def update_problem_module_state(entry_id, update_fcn, action_name, filter_fcn,
 
     except Exception:
         # try to write out the failure to the entry before failing
-        _, exception, traceback = exc_info()
-        traceback_string = format_exc(traceback) if traceback is not None else ''
-        TASK_LOG.warning("background task (%s) failed: %s %s", task_id, exception, traceback_string)
-        entry.task_output = InstructorTask.create_output_for_failure(exception, traceback_string)
-        entry.task_state = FAILURE
-        entry.save_now()
+        _record_task_failure(entry)
         raise
 
     # log and exit, returning task_progress info as task result:
@@ -257,22 +416,198 @@ def update_problem_module_state(entry_id, update_fcn, action_name, filter_fcn,
     return task_progress
 
 
+def _check_task_id(entry):
+    """
+    Raises UpdateProblemModuleStateError if the task_id submitted in the
+    InstructorTask `entry` doesn't match the current task that is running.
+    """
+    request_task_id = _get_current_task().request.id
+    if entry.task_id != request_task_id:
+        fmt = 'Requested task "{task_id}" did not match actual task "{actual_id}"'
+        message = fmt.format(task_id=entry.task_id, actual_id=request_task_id)
+        TASK_LOG.error(message)
+        raise UpdateProblemModuleStateError(message)
+
+
+def _record_task_failure(entry):
+    """
+    Writes the exception currently being handled out to the InstructorTask `entry`.
+    """
+    _, exception, traceback = exc_info()
+    traceback_string = format_exc(traceback) if traceback is not None else ''
+    TASK_LOG.warning("background task (%s) failed: %s %s", entry.task_id, exception, traceback_string)
+    entry.task_output = InstructorTask.create_output_for_failure(exception, traceback_string)
+    entry.task_state = FAILURE
+    entry.save_now()
+
+
+def initialize_subtask_progress(entry, action_name, num_total, num_subtasks):
+    """
+    Marks the InstructorTask `entry` as being worked on by `num_subtasks`
+    subtasks, which together will attempt `num_total` items.
+
+    The returned progress dict is stored in the entry's task_output, and has
+    the usual 'action_name', 'attempted', 'updated', 'total' and 'duration_ms'
+    keys, along with a 'subtasks' dict counting the 'total', 'pending' and
+    'failed' subtasks.  Each subtask adds its own counts into it through
+    update_subtask_progress(), and the last one to finish sets the final
+    state of the entry.
+    """
+    task_progress = {'action_name': action_name,
+                     'attempted': 0,
+                     'updated': 0,
+                     'total': num_total,
+                     'duration_ms': 0,
+                     'start_time': time(),
+                     'subtasks': {'total': num_subtasks, 'pending': num_subtasks, 'failed': 0},
+                     }
+    entry.task_output = InstructorTask.create_output_for_success(task_progress)
+    entry.task_state = PROGRESS if num_subtasks > 0 else SUCCESS
+    entry.save_now()
+    return task_progress
+
+
+# longest message from a failed subtask that is kept in the progress of its task
+SUBTASK_MESSAGE_LENGTH = 500
+
+
+def _truncate(message, length):
+    """Returns `message`, shortened to `length` characters with "..." if it is any longer."""
+    tag = '...'
+    return message if len(message) <= length else message[:length - len(tag)] + tag
+
+
+@transaction.commit_on_success
+def update_subtask_progress(entry_id, num_attempted, num_updated, failed=False, exception=None, grading=None):
+    """
+    Adds the counts from one finished subtask into the progress stored in
+    InstructorTask `entry_id`.
+
+    The entry is locked while it is updated, so that subtasks finishing at
+    the same time don't lose each other's counts.  When no subtasks remain
+    pending, the entry is marked SUCCESS, or FAILURE if any subtask failed.
+    The `exception` that made the first subtask fail, if given, is reported
+    as the entry's 'exception' and 'message'.  The hits and misses of the
+    subtask's `grading` stats, if given, are added into a 'grading_cache' dict.
+
+    Returns the updated InstructorTask entry.
+    """
+    entry = InstructorTask.objects.select_for_update().get(pk=entry_id)
+    task_progress = json.loads(entry.task_output)
+    task_progress['attempted'] += num_attempted
+    task_progress['updated'] += num_updated
+    task_progress['duration_ms'] = int((time() - task_progress['start_time']) * 1000)
+    if grading is not None:
+        grading_cache = task_progress.setdefault('grading_cache', {'hits': 0, 'misses': 0})
+        grading_cache['hits'] += grading.hits
+        grading_cache['misses'] += grading.misses
+        tags = ['action:{name}'.format(name=task_progress['action_name'])]
+        dog_stats_api.increment('instructor_tasks.grading_cache.hit', grading.hits, tags=tags)
+        dog_stats_api.increment('instructor_tasks.grading_cache.miss', grading.misses, tags=tags)
+
+    subtasks = task_progress['subtasks']
+    subtasks['pending'] -= 1
+    if failed:
+        subtasks['failed'] += 1
+        if exception is not None and 'exception' not in task_progress:
+            task_progress['exception'] = type(exception).__name__
+            task_progress['message'] = _truncate(unicode(exception), SUBTASK_MESSAGE_LENGTH)
+
+    if subtasks['pending'] <= 0:
+        if subtasks['failed'] > 0:
+            entry.task_state = FAILURE
+            task_progress.setdefault('message', '{failed} of {total} subtasks failed'.format(**subtasks))
+        else:
+            entry.task_state = SUCCESS
+
+    entry.task_output = InstructorTask.create_output_for_success(task_progress)
+    entry.save()
+    return entry
+
+
+def start_grade_calculation(entry_id, chunk_task):
+    """
+    Splits the students enrolled in the course of InstructorTask `entry_id`
+    into chunks, and submits a `chunk_task` subtask to grade each of them.
+
+    The subtasks run in parallel on whatever celery workers are available,
+    and aggregate their progress into the entry.  Returns the initial progress.
+    """
+    entry = InstructorTask.objects.get(pk=entry_id)
+    course_id = entry.course_id
+
+    try:
+        _check_task_id(entry)
+
+        student_ids = enrolled_student_ids(course_id)
+        student_chunks = chunk_student_ids(student_ids)
+        task_progress = initialize_subtask_progress(entry, 'graded', len(student_ids), len(student_chunks))
+
+        fmt = 'Starting task "{task_id}": course "{course_id}": grading {num_students} students in {num_chunks} subtasks'
+        TASK_LOG.info(fmt.format(task_id=entry.task_id, course_id=course_id,
+                                 num_students=len(student_ids), num_chunks=len(student_chunks)))
+
+        for student_chunk in student_chunks:
+            chunk_task.apply_async((entry_id, student_chunk))
+
+    except Exception:
+        _record_task_failure(entry)
+        raise
+
+    return task_progress
+
+
+def perform_grade_calculation_chunk(entry_id, student_ids):
+    """
+    Grades one chunk of students for InstructorTask `entry_id`, storing their
+    grades in OfflineComputedGrade, and adds the results to the entry's progress.
+
+    Once the last chunk is done, an OfflineComputedGradeLog entry is written
+    so that the instructor dashboard offers the newly computed grades.
+    """
+    course_id = InstructorTask.objects.get(pk=entry_id).course_id
+
+    try:
+        with dog_stats_api.timer('instructor_tasks.grades.time.chunk'):
+            num_graded = grade_student_chunk(course_id, student_ids)
+    except Exception:
+        TASK_LOG.exception("grading chunk for instructor task %s failed", entry_id)
+        update_subtask_progress(entry_id, len(student_ids), 0, failed=True)
+        raise
+
+    entry = update_subtask_progress(entry_id, len(student_ids), num_graded)
+    if entry.task_state == SUCCESS:
+        task_progress = json.loads(entry.task_output)
+        OfflineComputedGradeLog.objects.create(
+            course_id=course_id,
+            seconds=task_progress['duration_ms'] / 1000,
+            nstudents=task_progress['total'],
+        )
+        fmt = 'Finishing task "{task_id}": course "{course_id}": final: {progress}'
+        TASK_LOG.info(fmt.format(task_id=entry.task_id, course_id=course_id, progress=task_progress))
+
+    return num_graded
+
+
 def _get_task_id_from_xmodule_args(xmodule_instance_args):
     """Gets task_id from `xmodule_instance_args` dict, or returns default value if missing."""
     return xmodule_instance_args.get('task_id', UNKNOWN_TASK_ID) if xmodule_instance_args is not None else UNKNOWN_TASK_ID
 
 
 def _get_module_instance_for_task(course_id, student, module_descriptor, xmodule_instance_args=None,
-                                  grade_bucket_type=None):
+                                  grade_bucket_type=None, model_data_cache=None):
     """
     Fetches a StudentModule instance for a given `course_id`, `student` object, and `module_descriptor`.
 
     `xmodule_instance_args` is used to provide information for creating a track function and an XQueue callback.
     These are passed, along with `grade_bucket_type`, to get_module_for_descriptor_internal, which sidesteps
     the need for a Request object when instantiating an xmodule instance.
+
+    The student's state is loaded into a new ModelDataCache, unless `model_data_cache` is passed in.
     """
     # reconstitute the problem's corresponding XModule:
-    model_data_cache = ModelDataCache.cache_for_descriptor_descendents(course_id, student, module_descriptor)
+    if model_data_cache is None:
+        model_data_cache = ModelDataCache.cache_for_descriptor_descendents(course_id, student, module_descriptor)
 
     # get request-related tracking information from args passthrough, and supplement with task-specific
     # information:
@@ -298,11 +633,14 @@ def _get_module_instance_for_task(course_id, student, module_descriptor, xmodule
 
 
 @transaction.autocommit
-def rescore_problem_module_state(module_descriptor, student_module, xmodule_instance_args=None):
+def rescore_problem_module_state(module_descriptor, student_module, xmodule_instance_args=None, model_data_cache=None):
     '''
     Takes an XModule descriptor and a corresponding StudentModule object, and
     performs rescoring on the student's problem submission.
 
+    If a `model_data_cache` holding the student's state for the problem is
+    passed in, the module is created from it rather than from a new one.
+
     Throws exceptions if the rescoring is fatal and should be aborted if in a loop.
     In particular, raises UpdateProblemModuleStateError if module fails to instantiate,
     or if the module doesn't support rescoring.
@@ -314,7 +652,8 @@ def rescore_problem_module_state(module_descriptor, student_module, xmodule_inst
     course_id = student_module.course_id
     student = student_module.student
     module_state_key = student_module.module_state_key
-    instance = _get_module_instance_for_task(course_id, student, module_descriptor, xmodule_instance_args, grade_bucket_type='rescore')
+    instance = _get_module_instance_for_task(course_id, student, module_descriptor, xmodule_instance_args,
+                                             grade_bucket_type='rescore', model_data_cache=model_data_cache)
 
     if instance is None:
         # Either permissions just changed, or someone is trying to be clever
@@ -347,7 +686,8 @@ def rescore_problem_module_state(module_descriptor, student_module, xmodule_inst
 
 
 @transaction.autocommit
-def reset_attempts_module_state(_module_descriptor, student_module, xmodule_instance_args=None):
+def reset_attempts_module_state(_module_descriptor, student_module, xmodule_instance_args=None,
+                                _model_data_cache=None):
     """
     Resets problem attempts to zero for specified `student_module`.
 
@@ -373,7 +713,8 @@ def reset_attempts_module_state(_module_descriptor, student_module, xmodule_inst
 
 
 @transaction.autocommit
-def delete_problem_module_state(_module_descriptor, student_module, xmodule_instance_args=None):
+def delete_problem_module_state(_module_descriptor, student_module, xmodule_instance_args=None,
+                                _model_data_cache=None):
     """
     Delete the StudentModule entry.
 
@@ -386,3 +727,126 @@ def delete_problem_module_state(_module_descriptor, student_module, xmodule_inst
     task_info = {"student": student_module.student.username, "task_id": _get_task_id_from_xmodule_args(xmodule_instance_args)}
     task_track(request_info, task_info, 'problem_delete_state', {}, page='x_module_task')
     return True
+
+
+def _get_task_info(student_module, xmodule_instance_args):
+    """Returns the task information tracked with events about `student_module`."""
+    return {"student": student_module.student.username, "task_id": _get_task_id_from_xmodule_args(xmodule_instance_args)}
+
+
+def _update_module_states(student_modules, modified):
+    """
+    Writes the state of each of `student_modules`, and sets their modified time
+    to `modified`, with a single UPDATE for each batch of BULK_WRITE_PARAMS of them.
+
+    No signals are sent, so their history isn't saved.
+    """
+    quote_name = connection.ops.quote_name
+    sql = 'UPDATE {table} SET {state} = CASE {id} {cases} END, {modified} = %s WHERE {id} IN ({ids})'
+    cursor = connection.cursor()
+    for batch in chunks(student_modules, BULK_WRITE_PARAMS - 1):
+        # ids come from the database, so are safe to write into the statement
+        ids = [str(int(student_module.id)) for student_module in batch]
+        cursor.execute(
+            sql.format(table=quote_name(StudentModule._meta.db_table),
+                       state=quote_name('state'),
+                       modified=quote_name('modified'),
+                       id=quote_name('id'),
+                       cases=' '.join('WHEN {0} THEN %s'.format(module_id) for module_id in ids),
+                       ids=', '.join(ids)),
+            [student_module.state for student_module in batch] + [connection.ops.value_to_db_datetime(modified)]
+        )
+    transaction.set_dirty()
+
+
+def _delete_modules(module_ids):
+    """
+    Deletes the StudentModules with ids `module_ids`, along with the rows that refer
+    to them (such as their history), with a single DELETE from each table for each
+    batch of BULK_WRITE_PARAMS of them.
+
+    No signals are sent.
+    """
+    quote_name = connection.ops.quote_name
+    tables = [(related.model._meta.db_table, related.field.column)
+              for related in StudentModule._meta.get_all_related_objects()]
+    tables.append((StudentModule._meta.db_table, StudentModule._meta.pk.column))
+    cursor = connection.cursor()
+    for batch in chunks(module_ids, BULK_WRITE_PARAMS):
+        placeholders = ', '.join(['%s'] * len(batch))
+        for table, column in tables:
+            cursor.execute('DELETE FROM {0} WHERE {1} IN ({2})'.format(quote_name(table), quote_name(column), placeholders),
+                           batch)
+    transaction.set_dirty()
+
+
+@transaction.commit_on_success
+def reset_attempts_module_states(_module_descriptor, student_modules, xmodule_instance_args=None):
+    """
+    Resets problem attempts to zero for each of the list of `student_modules`, as
+    reset_attempts_module_state does for one.
+
+    The new states are written with one UPDATE for each BULK_WRITE_PARAMS modules,
+    and their history entries and tracking events are each written together.
+
+    Returns the number of `student_modules`: like reset_attempts_module_state, each
+    counts as successfully reset, even if it didn't need to be.
+
+    The states are read again under lock, as the chunk was read outside of this
+    transaction, and writing back those states would lose any submission made since.
+    """
+    request_info = xmodule_instance_args.get('request_info', {}) if xmodule_instance_args is not None else {}
+    modified = timezone.now()
+    reset_modules = []
+    events = []
+    for student_module in _lock_modules(student_modules):
+        problem_state = json.loads(student_module.state) if student_module.state else {}
+        if 'attempts' in problem_state:
+            old_number_of_attempts = problem_state["attempts"]
+            if old_number_of_attempts > 0:
+                problem_state["attempts"] = 0
+                student_module.state = json.dumps(problem_state)
+                student_module.modified = modified
+                reset_modules.append(student_module)
+                event_info = {"old_attempts": old_number_of_attempts, "new_attempts": 0}
+                events.append(task_event(request_info, _get_task_info(student_module, xmodule_instance_args),
+                                         'problem_reset_attempts', event_info, page='x_module_task'))
+
+    _update_module_states(reset_modules, modified)
+    history_entries = filter(None, [StudentModuleHistory.entry_for(student_module) for student_module in reset_modules])
+    history_fields = len(StudentModuleHistory._meta.local_fields)
+    for batch in chunks(history_entries, BULK_WRITE_PARAMS // history_fields):
+        StudentModuleHistory.objects.bulk_create(batch)
+
+    if events:
+        write_events(events)
+    return len(student_modules)
+
+
+@transaction.commit_on_success
+def delete_problem_module_states(_module_descriptor, student_modules, xmodule_instance_args=None):
+    """
+    Deletes each of the list of `student_modules`, as delete_problem_module_state
+    does for one.
+
+    The modules (and their history) are deleted with one DELETE from each table for
+    each BULK_WRITE_PARAMS modules, the stored scores of their students are marked
+    stale together, and their tracking events are written together.
+
+    Returns the number of `student_modules`.
+    """
+    _delete_modules([student_module.id for student_module in student_modules])
+
+    # deleting them one by one would have marked the scores stale from a signal:
+    for batch in chunks(student_modules, BULK_WRITE_PARAMS):
+        for (course_id, module_state_key), modules in groupby(batch, key=attrgetter('course_id', 'module_state_key')):
+            grade_store.invalidate_modules([student_module.student_id for student_module in modules],
+                                           course_id, module_state_key)
+
+    request_info = xmodule_instance_args.get('request_info', {}) if xmodule_instance_args is not None else {}
+    events = [task_event(request_info, _get_task_info(student_module, xmodule_instance_args),
+                         'problem_delete_state', {}, page='x_module_task')
+              for student_module in student_modules]
+    if events:
+        write_events(events)
+    return len(student_modules)
@@ -13,17 +13,22 @@ from mock import Mock, patch
 
 from celery.states import SUCCESS, FAILURE
 
+from capa.problem_cache import grading_stats
+
 from xmodule.modulestore.exceptions import ItemNotFoundError
 
 from courseware.model_data import StudentModule
+from courseware.models import StudentModuleHistory
+from courseware.models import OfflineComputedGrade, OfflineComputedGradeLog
 from courseware.tests.factories import StudentModuleFactory
 from student.tests.factories import UserFactory
 
 from instructor_task.models import InstructorTask
 from instructor_task.tests.test_base import InstructorTaskModuleTestCase
 from instructor_task.tests.factories import InstructorTaskFactory
-from instructor_task.tasks import rescore_problem, reset_problem_attempts, delete_problem_state
-from instructor_task.tasks_helper import UpdateProblemModuleStateError, update_problem_module_state
+from instructor_task.tasks import rescore_problem, reset_problem_attempts, delete_problem_state, calculate_grades
+from instructor_task.tasks_helper import (UpdateProblemModuleStateError, update_problem_module_state,
+                                          reset_attempts_module_states)
 
 
 PROBLEM_URL_NAME = "test_urlname"
@@ -133,12 +138,12 @@ class TestInstructorTasks(InstructorTaskModuleTestCase):
     def test_delete_with_no_state(self):
         self._test_run_with_no_state(delete_problem_state, 'deleted')
 
-    def _create_students_with_state(self, num_students, state=None):
+    def _create_students_with_state(self, num_students, state=None, first_index=0):
         """Create students, a problem, and StudentModule objects for testing"""
         self.define_option_problem(PROBLEM_URL_NAME)
         students = [
             UserFactory.create(username='robot%d' % i, email='robot+test+%d@edx.org' % i)
-            for i in xrange(num_students)
+            for i in xrange(first_index, first_index + num_students)
         ]
         for student in students:
             StudentModuleFactory.create(course_id=self.course.id,
@@ -186,6 +191,71 @@ class TestInstructorTasks(InstructorTaskModuleTestCase):
                                           student=student,
                                           module_state_key=self.problem_url)
 
+    @patch('instructor_task.tasks_helper.BULK_WRITE_PARAMS', 4)
+    @patch('instructor_task.tasks_helper.BULK_CHUNK_SIZE', 3)
+    def test_reset_in_bulk(self):
+        students = self._create_students_with_state(7, json.dumps({'attempts': 3, 'done': True}))
+        unattempted = self._create_students_with_state(2, json.dumps({'attempts': 0}), first_index=7)
+        unattempted += self._create_students_with_state(1, json.dumps({}), first_index=9)
+        with patch('instructor_task.tasks_helper.write_events') as mock_write_events:
+            self._test_run_with_task(reset_problem_attempts, 'reset', 10)
+        self._assert_num_attempts(students, 0)
+
+        # the other state of reset modules is kept, and their history has the new state
+        for student in students:
+            module = StudentModule.objects.get(course_id=self.course.id, student=student,
+                                               module_state_key=self.problem_url)
+            self.assertEquals(json.loads(module.state), {'attempts': 0, 'done': True})
+            history = StudentModuleHistory.objects.filter(student_module=module).order_by('id')
+            self.assertEquals([entry.state for entry in history], [json.dumps({'attempts': 3, 'done': True}), module.state])
+        for student in unattempted:
+            module = StudentModule.objects.get(course_id=self.course.id, student=student,
+                                               module_state_key=self.problem_url)
+            self.assertEquals(StudentModuleHistory.objects.filter(student_module=module).count(), 1)
+
+        # events are written a chunk at a time, and only for reset modules
+        events = [event for call_args in mock_write_events.call_args_list for event in call_args[0][0]]
+        self.assertEquals(len(mock_write_events.call_args_list), 3)
+        self.assertEquals(sorted(event['event']['student'] for event in events),
+                          sorted(student.username for student in students))
+        for event in events:
+            self.assertEquals(event['event_type'], 'problem_reset_attempts')
+            self.assertEquals(event['page'], 'x_module_task')
+            self.assertEquals(event['event']['old_attempts'], 3)
+            self.assertEquals(event['event']['new_attempts'], 0)
+
+    def test_reset_in_bulk_keeps_submissions_made_after_the_chunk_was_read(self):
+        students = self._create_students_with_state(3, json.dumps({'attempts': 1}))
+        modules = list(StudentModule.objects.filter(course_id=self.course.id).order_by('id'))
+        # a submission is made by the first student after the chunk was read
+        StudentModule.objects.filter(id=modules[0].id).update(state=json.dumps({'attempts': 2, 'done': True}))
+        # and the last module is deleted
+        StudentModule.objects.filter(id=modules[2].id).delete()
+        with patch('instructor_task.tasks_helper.write_events') as mock_write_events:
+            self.assertEquals(reset_attempts_module_states(None, modules), 3)
+        module = StudentModule.objects.get(id=modules[0].id)
+        self.assertEquals(json.loads(module.state), {'attempts': 0, 'done': True})
+        self._assert_num_attempts(students[1:2], 0)
+        self.assertFalse(StudentModule.objects.filter(id=modules[2].id).exists())
+        events = mock_write_events.call_args[0][0]
+        self.assertEquals([event['event']['old_attempts'] for event in events], [2, 1])
+
+    @patch('instructor_task.tasks_helper.BULK_WRITE_PARAMS', 4)
+    @patch('instructor_task.tasks_helper.BULK_CHUNK_SIZE', 3)
+    def test_delete_in_bulk(self):
+        students = self._create_students_with_state(10, json.dumps({'attempts': 3}))
+        with patch('instructor_task.tasks_helper.write_events') as mock_write_events:
+            self._test_run_with_task(delete_problem_state, 'deleted', 10)
+        self.assertFalse(StudentModule.objects.filter(course_id=self.course.id).exists())
+        self.assertFalse(StudentModuleHistory.objects.exists())
+
+        events = [event for call_args in mock_write_events.call_args_list for event in call_args[0][0]]
+        self.assertEquals(len(mock_write_events.call_args_list), 4)
+        self.assertEquals(sorted(event['event']['student'] for event in events),
+                          sorted(student.username for student in students))
+        for event in events:
+            self.assertEquals(event['event_type'], 'problem_delete_state')
+
     def _test_reset_with_student(self, use_email):
         """Run a reset task for one student, with several StudentModules for the problem defined."""
         num_students = 10
@@ -375,3 +445,142 @@ class TestInstructorTasks(InstructorTaskModuleTestCase):
         self.assertEquals(output.get('total'), num_students)
         self.assertEquals(output.get('action_name'), 'rescored')
         self.assertGreater('duration_ms', 0)
+
+
+    def _run_rescore_in_subtasks(self, num_students, state, mock_rescore):
+        """Rescore all students with a mocked rescore function, two StudentModules to a subtask."""
+        self._create_students_with_state(num_students, state)
+        task_entry = self._create_input_entry()
+        with patch('instructor_task.tasks.rescore_problem_module_state', mock_rescore):
+            with patch('instructor_task.tasks_helper.MODULE_STATE_CHUNK_SIZE', 2):
+                self._run_task_with_mock_celery(rescore_problem, task_entry.id, task_entry.task_id)
+        return InstructorTask.objects.get(id=task_entry.id)
+
+    def test_rescoring_in_subtasks(self):
+        mock_rescore = Mock(return_value=True)
+        entry = self._run_rescore_in_subtasks(5, json.dumps({'done': True}), mock_rescore)
+
+        self.assertEquals(entry.task_state, SUCCESS)
+        output = json.loads(entry.task_output)
+        self.assertEquals(output['attempted'], 5)
+        self.assertEquals(output['updated'], 5)
+        self.assertEquals(output['total'], 5)
+        self.assertEquals(output['action_name'], 'rescored')
+        self.assertEquals(output['subtasks'], {'total': 3, 'pending': 0, 'failed': 0})
+        # progress is only reported once to celery, before the subtasks start
+        self.assertEquals(self.current_task.update_state.call_count, 1)
+
+        # each student is rescored once, from the state loaded for their chunk
+        rescored_modules = [call_args[0][1] for call_args in mock_rescore.call_args_list]
+        self.assertEquals(len(set(module.id for module in rescored_modules)), 5)
+        for call_args in mock_rescore.call_args_list:
+            student_module, model_data_cache = call_args[0][1], call_args[0][3]
+            self.assertEquals(model_data_cache.user, student_module.student)
+
+    def test_rescoring_in_subtasks_skips_unsubmitted(self):
+        mock_rescore = Mock(return_value=True)
+        entry = self._run_rescore_in_subtasks(3, json.dumps({'done': False}), mock_rescore)
+        self.assertEquals(entry.task_state, SUCCESS)
+        self.assertEquals(json.loads(entry.task_output)['total'], 0)
+        self.assertFalse(mock_rescore.called)
+
+    def test_rescoring_subtask_failure(self):
+        def rescore(*args):
+            """Fails on the second module, in the first subtask."""
+            if mock_rescore.call_count == 2:
+                raise TestTaskFailure("rescoring failed")
+            return True
+
+        mock_rescore = Mock(side_effect=rescore)
+        # eager subtasks don't propagate their exceptions to the parent task
+        entry = self._run_rescore_in_subtasks(5, json.dumps({'done': True}), mock_rescore)
+
+        self.assertEquals(entry.task_state, FAILURE)
+        output = json.loads(entry.task_output)
+        self.assertEquals(output['subtasks'], {'total': 3, 'pending': 0, 'failed': 1})
+        self.assertEquals(output['exception'], 'TestTaskFailure')
+        self.assertEquals(output['message'], 'rescoring failed')
+        # the failed subtask stops at its failure, the others carry on
+        self.assertEquals(output['attempted'], 5)
+        self.assertEquals(output['updated'], 4)
+
+    def test_rescoring_subtasks_report_grading_cache(self):
+        def rescore(*args):
+            """Counts a hit for each module, and a miss for the first one in each subtask."""
+            stats = grading_stats()
+            if stats.hits == 0:
+                stats.misses += 1
+            stats.hits += 1
+            return True
+
+        entry = self._run_rescore_in_subtasks(5, json.dumps({'done': True}), Mock(side_effect=rescore))
+        self.assertEquals(entry.task_state, SUCCESS)
+        self.assertEquals(json.loads(entry.task_output)['grading_cache'], {'hits': 5, 'misses': 3})
+        # grades aren't memoized outside of the subtasks
+        self.assertIsNone(grading_stats())
+
+class TestCalculateGradesTask(InstructorTaskModuleTestCase):
+    """Tests for the calculate_grades task and its calculate_grades_chunk subtasks."""
+
+    def setUp(self):
+        super(InstructorTaskModuleTestCase, self).setUp()
+        self.initialize_course()
+        self.instructor = self.create_instructor('instructor')
+        for index in range(4):
+            self.create_student('student{0}'.format(index))
+
+    def _create_grades_entry(self):
+        """Creates a calculate_grades InstructorTask entry for testing."""
+        return InstructorTaskFactory.create(course_id=self.course.id,
+                                            requester=self.instructor,
+                                            task_type='calculate_grades',
+                                            task_input=json.dumps({}),
+                                            task_key='dummy value',
+                                            task_id=str(uuid4()))
+
+    def _run_task_with_mock_celery(self, task_entry):
+        """Run calculate_grades, splitting students into chunks of two."""
+        current_task = Mock()
+        current_task.request = Mock()
+        current_task.request.id = task_entry.task_id
+        two_at_a_time = lambda student_ids: [student_ids[i:i + 2] for i in range(0, len(student_ids), 2)]
+        with patch('instructor_task.tasks_helper._get_current_task') as mock_get_task:
+            mock_get_task.return_value = current_task
+            with patch('instructor_task.tasks_helper.chunk_student_ids', two_at_a_time):
+                return calculate_grades(task_entry.id, None)
+
+    def test_calculate_grades(self):
+        task_entry = self._create_grades_entry()
+        self._run_task_with_mock_celery(task_entry)
+
+        # 4 students and the instructor, in 3 subtasks:
+        entry = InstructorTask.objects.get(id=task_entry.id)
+        self.assertEquals(entry.task_state, SUCCESS)
+        output = json.loads(entry.task_output)
+        self.assertEquals(output['attempted'], 5)
+        self.assertEquals(output['updated'], 5)
+        self.assertEquals(output['total'], 5)
+        self.assertEquals(output['action_name'], 'graded')
+        self.assertEquals(output['subtasks'], {'total': 3, 'pending': 0, 'failed': 0})
+
+        self.assertEquals(OfflineComputedGrade.objects.filter(course_id=self.course.id).count(), 5)
+        self.assertEquals(OfflineComputedGradeLog.objects.get(course_id=self.course.id).nstudents, 5)
+
+    def test_recalculate_grades(self):
+        self._run_task_with_mock_celery(self._create_grades_entry())
+        self._run_task_with_mock_celery(self._create_grades_entry())
+        self.assertEquals(OfflineComputedGrade.objects.filter(course_id=self.course.id).count(), 5)
+
+    def test_chunk_failure(self):
+        task_entry = self._create_grades_entry()
+        with patch('instructor_task.tasks_helper.grade_student_chunk') as mock_grade:
+            mock_grade.side_effect = TestTaskFailure("grading failed")
+            # eager subtasks don't propagate their exceptions to the parent task
+            self._run_task_with_mock_celery(task_entry)
+
+        entry = InstructorTask.objects.get(id=task_entry.id)
+        self.assertEquals(entry.task_state, FAILURE)
+        output = json.loads(entry.task_output)
+        self.assertEquals(output['subtasks'], {'total': 3, 'pending': 0, 'failed': 3})
+        self.assertEquals(output['message'], '3 of 3 subtasks failed')
+        self.assertEquals(OfflineComputedGradeLog.objects.filter(course_id=self.course.id).count(), 0)
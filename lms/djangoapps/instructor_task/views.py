@@ -141,6 +141,9 @@ def get_task_completion_info(instructor_task):
     else:
         student = task_input.get('student')
 
+    # tasks that apply to the whole course report on grades rather than on a problem:
+    subject = "Grades" if instructor_task.task_type == 'calculate_grades' else "Problem"
+
     if instructor_task.task_state == PROGRESS:
         # special message for providing progress updates:
         msg_format = "Progress: {action} {updated} of {attempted} so far"
@@ -148,25 +151,25 @@ def get_task_completion_info(instructor_task):
         if num_attempted == 0:
             msg_format = "Unable to find submission to be {action} for student '{student}'"
         elif num_updated == 0:
-            msg_format = "Problem failed to be {action} for student '{student}'"
+            msg_format = "{subject} failed to be {action} for student '{student}'"
         else:
             succeeded = True
-            msg_format = "Problem successfully {action} for student '{student}'"
+            msg_format = "{subject} successfully {action} for student '{student}'"
     elif num_attempted == 0:
         msg_format = "Unable to find any students with submissions to be {action}"
     elif num_updated == 0:
-        msg_format = "Problem failed to be {action} for any of {attempted} students"
+        msg_format = "{subject} failed to be {action} for any of {attempted} students"
     elif num_updated == num_attempted:
         succeeded = True
-        msg_format = "Problem successfully {action} for {attempted} students"
+        msg_format = "{subject} successfully {action} for {attempted} students"
     else:  # num_updated < num_attempted
-        msg_format = "Problem {action} for {updated} of {attempted} students"
+        msg_format = "{subject} {action} for {updated} of {attempted} students"
 
     if student is None and num_attempted != num_total:
         msg_format += " (out of {total})"
 
     # Update status in task result object itself:
-    message = msg_format.format(action=action_name, updated=num_updated,
+    message = msg_format.format(subject=subject, action=action_name, updated=num_updated,
                                 attempted=num_attempted, total=num_total,
                                 student=student)
     return (succeeded, message)
@@ -27,7 +27,9 @@ modulestore_options = {
 MODULESTORE = {
     'default': {
         'ENGINE': 'xmodule.modulestore.mongo.MongoModuleStore',
-        'OPTIONS': modulestore_options
+        # Keep up to 500 loaded descriptors per process.  The preview LMS uses
+        # the draft store, which must not share descriptors between requests.
+        'OPTIONS': dict(modulestore_options, descriptor_cache_size=500)
     },
 }
 
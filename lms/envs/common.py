@@ -77,6 +77,11 @@ MITX_FEATURES = {
 
     'ENABLE_DJANGO_ADMIN_SITE': False,  # set true to enable django's admin site, even on prod (e.g. for course ops)
     'ENABLE_SQL_TRACKING_LOGS': False,
+
+    # Persist per-section scores and only recompute sections whose scores have
+    # changed when grading a student (see courseware.grade_store)
+    'ENABLE_PERSISTENT_GRADES': False,
+
     'ENABLE_LMS_MIGRATION': False,
     'ENABLE_MANUAL_GIT_RELOAD': False,
 
@@ -247,6 +252,25 @@ DEV_CONTENT = True
 TRACK_MAX_EVENT = 10000
 DEBUG_TRACK_LOG = False
 
+# Tracking events can be written in batches by a background thread, so that
+# requests don't wait on the tracking log (see track.pipeline).  When the
+# queue is full, 'drop' drops new events, and 'block' waits up to
+# block_timeout seconds for room first.  Off by default: turn it on per
+# environment, with a queue big enough that events aren't dropped.
+TRACKING_PIPELINE = {
+    'enabled': False,
+    'max_queue_size': 10000,
+    'batch_size': 100,
+    'flush_interval': 1.0,
+    'overflow': 'block',
+    'block_timeout': 0.1,
+}
+
+# Worker processes that count the answers for the answer distribution
+# download (see courseware.grades.answer_distributions).  With 1, they're
+# counted in the web process itself.
+ANSWER_DISTRIBUTION_PROCESSES = 1
+
 MITX_ROOT_URL = ''
 
 LOGIN_REDIRECT_URL = MITX_ROOT_URL + '/accounts/login'
@@ -306,6 +330,17 @@ CODE_JAIL = {
         # How many CPU seconds can jailed code use?
         'CPU': 1,
     },
+
+    # A pool of warm sandbox workers, so that each execution doesn't have to
+    # start a new sandboxed Python.  A size of 0 turns the pool off.
+    'pool': {
+        # How many workers each process may run
+        'size': 0,
+        # Replace a worker after it has run this many executions...
+        'max_executions': 100,
+        # ...or once code run in it has used more than this many kilobytes
+        'max_rss_kb': 256 * 1024,
+    },
 }
 
 # Some courses are allowed to run unsafe code. This is a list of regexes, one
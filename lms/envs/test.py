@@ -25,8 +25,15 @@ MITX_FEATURES['DISABLE_START_DATES'] = True
 # to reload
 MITX_FEATURES['ENABLE_DISCUSSION_SERVICE'] = False
 
+# Tests that check the requests made to the comments service need every one of
+# them made, so its responses aren't cached
+COMMENTS_SERVICE_CACHE_TTLS = {}
+
 MITX_FEATURES['ENABLE_SERVICE_STATUS'] = True
 
+# Write tracking events right away, so tests can look for them
+TRACKING_PIPELINE = dict(TRACKING_PIPELINE, enabled=False)
+
 # Need wiki for courseware views to work. TODO (vshnayder): shouldn't need it.
 WIKI_ENABLED = True
 
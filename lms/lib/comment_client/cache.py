@@ -0,0 +1,98 @@
+"""
+A short-lived cache of GET responses from the comments service.
+
+Responses are cached under the url and params of the request, along with the
+current version of the resource they came from: a thread, comment or user,
+or for thread listings, the course.  Writing to a resource through the
+client gives it a new version, so the responses cached for the old one are
+never read again.  Versions are kept in the cache too, so every process
+sees them.
+
+How long responses are cached is set per resource type by
+settings.CACHE_TTLS.  Resource types without a TTL aren't cached.
+"""
+import hashlib
+import json
+from uuid import uuid4
+
+from django.core.cache import cache
+from dogapi import dog_stats_api
+
+import settings
+from .utils import perform_request
+
+# versions have to outlive the responses cached under them
+VERSION_TIMEOUT = 24 * 60 * 60
+
+
+def _version_key(resource_type, resource_id):
+    return 'comment_client.version.{0}.{1}'.format(resource_type, resource_id)
+
+
+def _get_version(resource_type, resource_id):
+    key = _version_key(resource_type, resource_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid4().hex
+        if not cache.add(key, version, VERSION_TIMEOUT):
+            # another process got there first
+            version = cache.get(key, version)
+    return version
+
+
+def invalidate(*resources):
+    """
+    Drop the responses cached for each (resource_type, resource_id) in
+    resources, by giving it a new version
+    """
+    for resource_type, resource_id in resources:
+        if resource_id is not None:
+            cache.set(_version_key(resource_type, resource_id), uuid4().hex, VERSION_TIMEOUT)
+
+
+def invalidate_content(content, response=None, course=False):
+    """
+    Drop the responses cached for content (a Thread, Comment or User), and if
+    it's a comment, for its thread.  If course is true, thread listings in
+    the course of content are dropped too.
+
+    content may not have been retrieved, so the response to the write is
+    looked in for any fields it's missing.
+    """
+    attributes = dict(response or {})
+    attributes.update(content.attributes)
+    resources = [(content.type, attributes.get('id'))]
+    if content.type == 'comment':
+        resources.append(('thread', attributes.get('thread_id')))
+    if course:
+        resources.append(('course', attributes.get('course_id')))
+    invalidate(*resources)
+
+
+def cached_request(resource_type, resource_id, url, params=None, *args, **kwargs):
+    """
+    perform_request('get', url, params, ...), answered from the cache if it
+    was made against the current version of the resource within the TTL of
+    resource_type
+    """
+    ttl = settings.CACHE_TTLS.get(resource_type)
+    if not ttl or resource_id is None:
+        return perform_request('get', url, params, *args, **kwargs)
+
+    # perform_request adds the API key to params, so the key is made first
+    request = json.dumps([url, sorted((params or {}).items()), kwargs.get('raw', False)])
+    key = 'comment_client.response.{0}.{1}'.format(
+        _get_version(resource_type, resource_id),
+        hashlib.md5(request).hexdigest()
+    )
+    tags = [u'resource:{0}'.format(resource_type)]
+
+    response = cache.get(key)
+    if response is not None:
+        dog_stats_api.increment('comment_client.cache.hit', tags=tags)
+        return response
+
+    dog_stats_api.increment('comment_client.cache.miss', tags=tags)
+    response = perform_request('get', url, params, *args, **kwargs)
+    cache.set(key, response, ttl)
+    return response
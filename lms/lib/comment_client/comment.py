@@ -1,4 +1,5 @@
 from .utils import CommentClientError, perform_request
+from .cache import invalidate_content
 
 from .thread import Thread, _url_for_flag_abuse_thread, _url_for_unflag_abuse_thread
 import models
@@ -52,6 +53,7 @@ class Comment(models.Model):
         params = {'user_id': user.id}
         request = perform_request('put', url, params)
         voteable.update_attributes(request)
+        invalidate_content(voteable, request)
 
     def unFlagAbuse(self, user, voteable, removeAll):
         if voteable.type == 'thread':
@@ -67,6 +69,7 @@ class Comment(models.Model):
 
         request = perform_request('put', url, params)
         voteable.update_attributes(request)
+        invalidate_content(voteable, request)
 
 
 def _url_for_thread_comments(thread_id):
@@ -1,4 +1,5 @@
 from .utils import *
+from .cache import cached_request, invalidate_content
 
 
 class Model(object):
@@ -62,7 +63,7 @@ class Model(object):
 
     def _retrieve(self, *args, **kwargs):
         url = self.url(action='get', params=self.attributes)
-        response = perform_request('get', url, self.default_retrieve_params)
+        response = cached_request(self.type, self.id, url, self.default_retrieve_params)
         self.update_attributes(**response)
 
     @classmethod
@@ -100,6 +101,7 @@ class Model(object):
             response = perform_request('post', url, self.initializable_attributes())
         self.retrieved = True
         self.update_attributes(**response)
+        invalidate_content(self, course=True)
         self.__class__.after_save(self)
 
     def delete(self):
@@ -107,6 +109,7 @@ class Model(object):
         response = perform_request('delete', url)
         self.retrieved = True
         self.update_attributes(**response)
+        invalidate_content(self, course=True)
 
     @classmethod
     def url_with_id(cls, params={}):
@@ -11,3 +11,33 @@ if hasattr(settings, "COMMENTS_SERVICE_KEY"):
     API_KEY = settings.COMMENTS_SERVICE_KEY
 else:
     API_KEY = "PUT_YOUR_API_KEY_HERE"
+
+# Requests to the comments service share a pool of keep-alive connections
+if hasattr(settings, "COMMENTS_SERVICE_POOL_SIZE"):
+    POOL_SIZE = settings.COMMENTS_SERVICE_POOL_SIZE
+else:
+    POOL_SIZE = 10
+
+# How many times to retry a request that couldn't connect
+if hasattr(settings, "COMMENTS_SERVICE_MAX_RETRIES"):
+    MAX_RETRIES = settings.COMMENTS_SERVICE_MAX_RETRIES
+else:
+    MAX_RETRIES = 1
+
+# How many requests a process can have in flight from call_in_background
+if hasattr(settings, "COMMENTS_SERVICE_CONCURRENCY"):
+    CONCURRENCY = settings.COMMENTS_SERVICE_CONCURRENCY
+else:
+    CONCURRENCY = 4
+
+# How many seconds GET responses are cached for, by the type of resource they
+# came from ('course' is for thread listings).  See comment_client.cache.
+if hasattr(settings, "COMMENTS_SERVICE_CACHE_TTLS"):
+    CACHE_TTLS = settings.COMMENTS_SERVICE_CACHE_TTLS
+else:
+    CACHE_TTLS = {
+        'thread': 30,
+        'comment': 30,
+        'user': 30,
+        'course': 10,
+    }
@@ -1,5 +1,6 @@
 from .utils import merge_dict, strip_blank, strip_none, extract, perform_request
 from .utils import CommentClientError
+from .cache import cached_request, invalidate_content
 import models
 import settings
 
@@ -40,7 +41,7 @@ class Thread(models.Model):
             url = cls.url(action='get_all', params=extract(params, 'commentable_id'))
             if params.get('commentable_id'):
                 del params['commentable_id']
-        response = perform_request('get', url, params, *args, **kwargs)
+        response = cached_request('course', params['course_id'], url, params, *args, **kwargs)
         return response.get('collection', []), response.get('page', 1), response.get('num_pages', 1)
 
     @classmethod
@@ -79,7 +80,12 @@ class Thread(models.Model):
         # request.
         request_params = strip_none(request_params)
 
-        response = perform_request('get', url, request_params)
+        if request_params['mark_as_read']:
+            # marking the thread read is a side effect that a cached response
+            # would skip
+            response = perform_request('get', url, request_params)
+        else:
+            response = cached_request('thread', self.id, url, request_params)
         self.update_attributes(**response)
 
     def flagAbuse(self, user, voteable):
@@ -92,6 +98,7 @@ class Thread(models.Model):
         params = {'user_id': user.id}
         request = perform_request('put', url, params)
         voteable.update_attributes(request)
+        invalidate_content(voteable, request)
 
     def unFlagAbuse(self, user, voteable, removeAll):
         if voteable.type == 'thread':
@@ -107,18 +114,21 @@ class Thread(models.Model):
 
         request = perform_request('put', url, params)
         voteable.update_attributes(request)
+        invalidate_content(voteable, request)
 
     def pin(self, user, thread_id):
         url = _url_for_pin_thread(thread_id)
         params = {'user_id': user.id}
         request = perform_request('put', url, params)
         self.update_attributes(request)
+        invalidate_content(self, request, course=True)
 
     def un_pin(self, user, thread_id):
         url = _url_for_un_pin_thread(thread_id)
         params = {'user_id': user.id}
         request = perform_request('put', url, params)
         self.update_attributes(request)
+        invalidate_content(self, request, course=True)
 
 
 def _url_for_flag_abuse_thread(thread_id):
@@ -1,4 +1,5 @@
 from .utils import merge_dict, perform_request, CommentClientError
+from .cache import cached_request, invalidate_content
 
 import models
 import settings
@@ -30,10 +31,12 @@ class User(models.Model):
     def follow(self, source):
         params = {'source_type': source.type, 'source_id': source.id}
         response = perform_request('post', _url_for_subscription(self.id), params)
+        invalidate_content(self)
 
     def unfollow(self, source):
         params = {'source_type': source.type, 'source_id': source.id}
         response = perform_request('delete', _url_for_subscription(self.id), params)
+        invalidate_content(self)
 
     def vote(self, voteable, value):
         if voteable.type == 'thread':
@@ -45,6 +48,8 @@ class User(models.Model):
         params = {'user_id': self.id, 'value': value}
         request = perform_request('put', url, params)
         voteable.update_attributes(request)
+        invalidate_content(voteable, request)
+        invalidate_content(self)
 
     def unvote(self, voteable):
         if voteable.type == 'thread':
@@ -56,6 +61,8 @@ class User(models.Model):
         params = {'user_id': self.id}
         request = perform_request('delete', url, params)
         voteable.update_attributes(request)
+        invalidate_content(voteable, request)
+        invalidate_content(self)
 
     def active_threads(self, query_params={}):
         if not self.course_id:
@@ -80,7 +87,7 @@ class User(models.Model):
         retrieve_params = self.default_retrieve_params
         if self.attributes.get('course_id'):
             retrieve_params['course_id'] = self.course_id
-        response = perform_request('get', url, retrieve_params)
+        response = cached_request('user', self.id, url, retrieve_params)
         self.update_attributes(**response)
 
 
@@ -1,11 +1,23 @@
 from dogapi import dog_stats_api
 import json
 import logging
+import os
 import requests
 import settings
+import threading
+from multiprocessing.pool import ThreadPool
 
 log = logging.getLogger(__name__)
 
+# Requests to the comments service go through a session per thread, so they
+# reuse its pooled keep-alive connections instead of opening new ones every
+# time.  Sessions aren't thread-safe, so threads don't share them.
+_sessions = threading.local()
+
+_background_pool = None
+_background_pool_pid = None
+_background_pool_lock = threading.Lock()
+
 
 def strip_none(dic):
     return dict([(k, v) for k, v in dic.iteritems() if v is not None])
@@ -28,6 +40,21 @@ def merge_dict(dic1, dic2):
     return dict(dic1.items() + dic2.items())
 
 
+def get_session():
+    """
+    Returns the session of the current thread, making it on first use
+    """
+    session = getattr(_sessions, 'session', None)
+    if session is None:
+        session = _sessions.session = requests.session(config={
+            'keep_alive': True,
+            'pool_connections': settings.POOL_SIZE,
+            'pool_maxsize': settings.POOL_SIZE,
+            'max_retries': settings.MAX_RETRIES,
+        })
+    return session
+
+
 def perform_request(method, url, data_or_params=None, *args, **kwargs):
     if data_or_params is None:
         data_or_params = {}
@@ -35,9 +62,9 @@ def perform_request(method, url, data_or_params=None, *args, **kwargs):
     try:
         with dog_stats_api.timer('comment_client.request.time'):
             if method in ['post', 'put', 'patch']:
-                response = requests.request(method, url, data=data_or_params, timeout=5)
+                response = get_session().request(method, url, data=data_or_params, timeout=5)
             else:
-                response = requests.request(method, url, params=data_or_params, timeout=5)
+                response = get_session().request(method, url, params=data_or_params, timeout=5)
     except Exception as err:
         # remove API key if it is in the params
         if 'api_key' in data_or_params:
@@ -62,6 +89,29 @@ def perform_request(method, url, data_or_params=None, *args, **kwargs):
             return json.loads(response.text)
 
 
+def _get_background_pool():
+    global _background_pool, _background_pool_pid
+    with _background_pool_lock:
+        # a pool made before a fork has no threads in the child
+        if _background_pool is None or _background_pool_pid != os.getpid():
+            _background_pool = ThreadPool(settings.CONCURRENCY)
+            _background_pool_pid = os.getpid()
+        return _background_pool
+
+
+def call_in_background(func, *args, **kwargs):
+    """
+    Start func(*args, **kwargs) on a background thread, so that a view can
+    make comments service requests that don't depend on each other at the
+    same time.  Returns an AsyncResult, whose get() returns what func
+    returned, or raises what it raised.
+
+    func runs outside the request, so it shouldn't use the database or
+    anything else that's kept per thread.
+    """
+    return _get_background_pool().apply_async(func, args, kwargs)
+
+
 class CommentClientError(Exception):
     def __init__(self, msg):
         self.message = msg
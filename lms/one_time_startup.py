@@ -2,6 +2,7 @@ from dogapi import dog_http_api, dog_stats_api
 from django.conf import settings
 from xmodule.modulestore.django import modulestore
 from request_cache.middleware import RequestCache
+from capa.safe_exec.pool import configure_pool
 
 from django.core.cache import get_cache
 
@@ -11,6 +12,8 @@ for store_name in settings.MODULESTORE:
     store.metadata_inheritance_cache_subsystem = cache
     store.request_cache = RequestCache.get_request_cache()
 
+configure_pool(**settings.CODE_JAIL.get('pool', {}))
+
 if hasattr(settings, 'DATADOG_API'):
     dog_http_api.api_key = settings.DATADOG_API
     dog_stats_api.start(api_key=settings.DATADOG_API, statsd=True)
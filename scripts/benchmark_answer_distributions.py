@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Time the answer distributions of a course computed from stored state by
+courseware.grades.answer_distributions, against computing them the way it
+used to, by loading every enrolled student's problems as CapaModules.
+
+    DJANGO_SETTINGS_MODULE=lms.envs.dev python scripts/benchmark_answer_distributions.py edX/toy/2012_Fall [--processes 4]
+
+Run from the repository root, with the lms on the python path, against a
+database holding the course's enrollments and student state.  Both
+computations only read from the database.
+"""
+
+import argparse
+import time
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+
+from courseware import grades
+from courseware.courses import get_course_by_id
+from courseware.model_data import MultiUserModelDataCache, chunks
+from instructor.offline_gradecalc import DummyRequest
+
+
+def module_answer_distributions(request, course, chunk_size=250):
+    """
+    answer_distributions as it was: every enrolled student's problems are
+    loaded as CapaModules, to read their lcp.student_answers
+    """
+    counts = defaultdict(lambda: defaultdict(int))
+
+    enrolled_students = User.objects.filter(courseenrollment__course_id=course.id).order_by('id')
+    all_descriptors = course.grading_context['all_descriptors']
+
+    for student_chunk in chunks(enrolled_students, chunk_size):
+        model_data_cache = MultiUserModelDataCache(all_descriptors, course.id, student_chunk)
+        for student in student_chunk:
+            for capa_module in grades.yield_problems(request, course, student, model_data_cache.for_user(student)):
+                for problem_id in capa_module.lcp.student_answers:
+                    answer = grades._answer_text(capa_module.lcp.student_answers[problem_id])
+                    key = (capa_module.url_name, capa_module.display_name_with_default, problem_id)
+                    counts[key][answer] += 1
+
+    return counts
+
+
+def timed(func, *args, **kwargs):
+    """
+    Returns the result of func(*args, **kwargs), and the seconds it took
+    """
+    start = time.time()
+    result = func(*args, **kwargs)
+    return result, time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('course_id')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--chunk-size', type=int, default=grades.ANSWER_DISTRIBUTION_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    course = get_course_by_id(args.course_id)
+    # load the course tree before timing either computation
+    course.grading_context
+
+    by_module, module_time = timed(module_answer_distributions, DummyRequest(), course)
+    by_state, state_time = timed(grades.answer_distributions, course, chunk_size=args.chunk_size)
+    by_state_parallel, parallel_time = timed(grades.answer_distributions, course,
+                                             num_processes=args.processes, chunk_size=args.chunk_size)
+
+    print "{0} problem inputs, {1} answers".format(
+        len(by_state), sum(sum(answers.values()) for answers in by_state.values()))
+    print "  loading modules:                 {0:8.2f}s".format(module_time)
+    print "  stored state:                    {0:8.2f}s".format(state_time)
+    print "  stored state, {0:2d} processes:     {1:8.2f}s".format(args.processes, parallel_time)
+    if not by_module == by_state == by_state_parallel:
+        # the module-based count skips problems a student no longer has
+        # access to, and can't see answers to problems that fail to load
+        print "  (the distributions differ)"
+
+
+if __name__ == '__main__':
+    main()
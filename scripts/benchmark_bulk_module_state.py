@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Time resetting attempts on and deleting StudentModules one at a time, the
+way the reset_problem_attempts and delete_problem_state instructor tasks
+used to, against the bulk update functions they use now.
+
+    DJANGO_SETTINGS_MODULE=lms.envs.dev python scripts/benchmark_bulk_module_state.py [--rows 100000] [--problems 100]
+
+Run from the repository root, with the lms on the python path, against a
+scratch database: the benchmark creates `rows` StudentModules, spread over
+`problems` problems in a made-up course and rows / problems new users, and
+deletes them all again when it's done.
+"""
+
+import argparse
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from courseware.model_data import chunks
+from courseware.models import StudentModule
+from instructor_task import tasks_helper
+
+COURSE_ID = 'edX/bulk_benchmark/2013_Fall'
+STATE = json.dumps({'attempts': 3, 'done': True, 'student_answers': {'input_2_1': 'choice_1'}})
+XMODULE_INSTANCE_ARGS = {'request_info': {}, 'task_id': 'benchmark'}
+
+
+def bulk_create(model, objects):
+    """bulk_create objects in batches small enough for any database"""
+    for batch in chunks(objects, tasks_helper.BULK_WRITE_PARAMS // len(model._meta.local_fields)):
+        model.objects.bulk_create(batch)
+
+
+@transaction.commit_on_success
+def create_rows(num_rows, num_problems):
+    num_users = (num_rows + num_problems - 1) // num_problems
+    bulk_create(User, [User(username='bulk_benchmark_{0}'.format(i), email='bulk_benchmark_{0}@example.com'.format(i))
+                       for i in range(num_users)])
+    user_ids = list(User.objects.filter(username__startswith='bulk_benchmark_').values_list('id', flat=True))
+    problems = ['i4x://edX/bulk_benchmark/problem/p{0}'.format(i) for i in range(num_problems)]
+    bulk_create(StudentModule, [
+        StudentModule(student_id=user_ids[i // num_problems], course_id=COURSE_ID, module_type='problem',
+                      module_state_key=problems[i % num_problems], state=STATE)
+        for i in range(num_rows)
+    ])
+
+
+@transaction.commit_on_success
+def delete_rows():
+    module_ids = list(StudentModule.objects.filter(course_id=COURSE_ID).values_list('id', flat=True))
+    tasks_helper._delete_modules(module_ids)
+    User.objects.filter(username__startswith='bulk_benchmark_').delete()
+
+
+def modules():
+    return StudentModule.objects.filter(course_id=COURSE_ID)
+
+
+def one_at_a_time(update_fcn):
+    for student_module in modules().order_by('id').iterator():
+        update_fcn(None, student_module, XMODULE_INSTANCE_ARGS)
+
+
+def in_bulk(bulk_update_fcn):
+    for module_chunk in tasks_helper._chunk_modules(modules(), tasks_helper.BULK_CHUNK_SIZE):
+        bulk_update_fcn(None, module_chunk, XMODULE_INSTANCE_ARGS)
+
+
+def timed(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--problems', type=int, default=100)
+    args = parser.parse_args()
+
+    print "{0:<32} {1:>10} {2:>12}".format('', 'seconds', 'rows/second')
+
+    def report(name, seconds):
+        print "{0:<32} {1:>10.2f} {2:>12.0f}".format(name, seconds, args.rows / seconds)
+
+    try:
+        for name, update_fcn, bulk_update_fcn in (
+                ('reset attempts', tasks_helper.reset_attempts_module_state,
+                 tasks_helper.reset_attempts_module_states),
+                ('delete state', tasks_helper.delete_problem_module_state,
+                 tasks_helper.delete_problem_module_states)):
+            create_rows(args.rows, args.problems)
+            report(name + ', one at a time', timed(one_at_a_time, update_fcn))
+            delete_rows()
+
+            create_rows(args.rows, args.problems)
+            report(name + ', in bulk', timed(in_bulk, bulk_update_fcn))
+            delete_rows()
+    finally:
+        delete_rows()
+
+
+if __name__ == '__main__':
+    main()
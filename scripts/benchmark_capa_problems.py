@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+"""
+Time LoncapaProblem construction with and without the problem template
+cache, over a directory of problem xml files.
+
+    python scripts/benchmark_capa_problems.py [--dir common/test/data/full/problem] [--repeat 20]
+
+Run with common/lib/capa on the python path (or capa installed).  Problems
+that can't be built outside of a course (e.g. because of missing includes)
+are skipped.
+"""
+
+import argparse
+import os
+import timeit
+
+from capa.capa_problem import LoncapaProblem
+from capa.problem_cache import problem_templates
+from capa.tests import test_system
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LoncapaProblem construction")
+    parser.add_argument('--dir', default='common/test/data/full/problem',
+                        help="Directory of problem xml files")
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    system = test_system()
+    print "{0:<40} {1:>12} {2:>12}".format('problem', 'cold (ms)', 'cached (ms)')
+    for filename in sorted(os.listdir(args.dir)):
+        if not filename.endswith('.xml'):
+            continue
+        with open(os.path.join(args.dir, filename)) as xml_file:
+            problem_text = xml_file.read()
+
+        build = lambda: LoncapaProblem(problem_text, id='bench', seed=1, system=system)
+        try:
+            build()
+        except Exception as err:
+            print "{0:<40} skipped: {1}".format(filename, err)
+            continue
+
+        def build_cold():
+            problem_templates.clear()
+            build()
+
+        cold = timeit.timeit(build_cold, number=args.repeat) / args.repeat
+        cached = timeit.timeit(build, number=args.repeat) / args.repeat
+        print "{0:<40} {1:>12.3f} {2:>12.3f}".format(filename, cold * 1000, cached * 1000)
+
+
+if __name__ == '__main__':
+    main()
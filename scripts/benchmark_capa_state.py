@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""
+Count and time the JSON work of loading and checking a CapaModule whose
+state is kept in a StudentModule, through LmsKeyValueStore, against the
+same module when the state is decoded for every read and encoded for every
+write.
+
+    DJANGO_SETTINGS_MODULE=lms.envs.test python scripts/benchmark_capa_state.py [--repeat 200]
+
+Run from the repository root, with the lms on the python path.  Nothing is
+written to the database: the StudentModule is never saved.
+"""
+
+import argparse
+import json
+import timeit
+from copy import deepcopy
+
+from django.contrib.auth.models import User
+from mock import Mock, patch
+
+from xblock.core import Scope
+from xblock.runtime import DbModel
+from xmodule.capa_module import CapaModule
+from xmodule.modulestore import Location
+from xmodule.tests import get_test_system
+
+from courseware.model_data import LmsKeyValueStore, LmsUsage, ModelDataCache
+from courseware.models import StudentModule
+
+COURSE_ID = 'edX/capa_test/2013_Spring'
+LOCATION = Location(['i4x', 'edX', 'capa_test', 'problem', 'SampleProblem'])
+PROBLEM_XML = """<?xml version="1.0"?>
+<problem>
+  <text><p>What is pi, to two decimal places?</p></text>
+  <numericalresponse answer="3.14">
+    <textline math="1" size="30"/>
+  </numericalresponse>
+  <numericalresponse answer="2.72">
+    <textline math="1" size="30"/>
+  </numericalresponse>
+</problem>
+"""
+
+
+class DecodeEveryTimeKeyValueStore(LmsKeyValueStore):
+    """
+    Reads and writes user state the way LmsKeyValueStore used to, decoding
+    (and for writes, encoding) the whole state every time
+    """
+    def get(self, key):
+        if key.scope != Scope.user_state or key.field_name in self._descriptor_model_data:
+            return super(DecodeEveryTimeKeyValueStore, self).get(key)
+        field_object = self._model_data_cache.find(key)
+        if field_object is None:
+            raise KeyError(key.field_name)
+        return json.loads(field_object.state)[key.field_name]
+
+    def set(self, key, value):
+        if key.scope != Scope.user_state or key.field_name in self._descriptor_model_data:
+            return super(DecodeEveryTimeKeyValueStore, self).set(key, value)
+        field_object = self._model_data_cache.find_or_create(key)
+        state = json.loads(field_object.state)
+        state[key.field_name] = value
+        field_object.state = json.dumps(state)
+        self._model_data_cache.save(field_object)
+
+    def has(self, key):
+        if key.scope != Scope.user_state or key.field_name in self._descriptor_model_data:
+            return super(DecodeEveryTimeKeyValueStore, self).has(key)
+        field_object = self._model_data_cache.find(key)
+        return field_object is not None and key.field_name in json.loads(field_object.state)
+
+
+class DeepCopyingKeyValueStore(LmsKeyValueStore):
+    """
+    Decodes user state once, like LmsKeyValueStore, but copies dict and list
+    values on every read and write with deepcopy, as it used to
+    """
+    def get(self, key):
+        if key.scope != Scope.user_state or key.field_name in self._descriptor_model_data:
+            return super(DeepCopyingKeyValueStore, self).get(key)
+        field_object = self._model_data_cache.find(key)
+        if field_object is None:
+            raise KeyError(key.field_name)
+        return deepcopy(self._model_data_cache.state_of(field_object)[key.field_name])
+
+    def set(self, key, value):
+        if key.scope != Scope.user_state or key.field_name in self._descriptor_model_data:
+            return super(DeepCopyingKeyValueStore, self).set(key, value)
+        field_object = self._model_data_cache.find_or_create(key)
+        self._model_data_cache.state_of(field_object)[key.field_name] = deepcopy(value)
+        self._model_data_cache.save_state(field_object)
+
+
+def make_module(kvs_class, state):
+    """
+    Returns a CapaModule over a fresh, unsaved StudentModule holding state,
+    along with its ModelDataCache and the StudentModule
+    """
+    user = User(id=1, username='bench')
+    student_module = StudentModule(student=user, course_id=COURSE_ID, module_type='problem',
+                                   module_state_key=LOCATION.url(), state=json.dumps(state))
+    cache = {(Scope.user_state, LOCATION.url()): student_module}
+    model_data_cache = ModelDataCache([], COURSE_ID, user, cache=cache, defer_writes=True)
+    kvs = kvs_class({'data': PROBLEM_XML, 'location': LOCATION}, model_data_cache)
+
+    system = get_test_system()
+    system.render_template = Mock(return_value="<div>problem</div>")
+    model_data = DbModel(kvs, CapaModule, user.id, LmsUsage(LOCATION, LOCATION))
+    return CapaModule(system, Mock(weight="1"), model_data), model_data_cache, student_module
+
+
+def load_and_check(kvs_class, state):
+    module, model_data_cache, student_module = make_module(kvs_class, state)
+    module.get_problem_html()
+    answers = module.lcp.get_question_answers()
+    module.check_problem(dict(('input_' + answer_id, answer) for answer_id, answer in answers.items()))
+    if kvs_class is not DecodeEveryTimeKeyValueStore:
+        # what flush() would encode, without writing to the database
+        student_module.state = json.dumps(model_data_cache.state_of(student_module))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    # the state of a problem that's been answered a few times
+    answer_ids = ['i4x-edX-capa_test-problem-SampleProblem_2_1', 'i4x-edX-capa_test-problem-SampleProblem_3_1']
+    state = {
+        'attempts': 3,
+        'done': True,
+        'seed': 1,
+        'student_answers': dict((answer_id, '3.1') for answer_id in answer_ids),
+        'correct_map': dict((answer_id, {'correctness': 'incorrect', 'npoints': None, 'msg': '', 'hint': '',
+                                         'hintmode': None, 'queuestate': None}) for answer_id in answer_ids),
+        'input_state': dict((answer_id, {}) for answer_id in answer_ids),
+    }
+
+    print "{0:<28} {1:>10} {2:>10} {3:>16}".format('store', 'decodes', 'encodes', 'load+check (ms)')
+    for name, kvs_class in (('decode every time', DecodeEveryTimeKeyValueStore),
+                            ('decoded once, deepcopied', DeepCopyingKeyValueStore),
+                            ('decoded once, JSON copies', LmsKeyValueStore)):
+        with patch('courseware.model_data.json.loads', wraps=json.loads) as loads:
+            with patch('courseware.model_data.json.dumps', wraps=json.dumps) as dumps:
+                load_and_check(kvs_class, state)
+                decodes, encodes = loads.call_count, dumps.call_count
+        elapsed = timeit.timeit(lambda: load_and_check(kvs_class, state), number=args.repeat) / args.repeat
+        print "{0:<28} {1:>10} {2:>10} {3:>16.3f}".format(name, decodes, encodes, elapsed * 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+Time comments service requests made the way comment_client used to (a new
+connection for every request) against its pooled keep-alive session, and
+the two requests single_thread makes one after the other against making
+them with call_in_background.
+
+    python scripts/benchmark_comment_client.py [--requests 200] [--latency 0.005]
+
+The requests go to a stub server on localhost, which waits `latency`
+seconds before answering each of them.  Run from the repository root with
+the lms requirements installed.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lms', 'lib'))
+
+from django.conf import settings
+
+RESPONSE = '{"id": "1", "title": "Hello", "body": "this is a post"}'
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """
+    Answers every GET with RESPONSE, after waiting server.latency seconds
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def timed(func, count):
+    """
+    Returns the milliseconds per call of calling func count times
+    """
+    start = time.time()
+    for _ in range(count):
+        func()
+    return (time.time() - start) * 1000 / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.005,
+                        help='seconds the stub server waits before each response')
+    args = parser.parse_args()
+
+    server = StubServer(('127.0.0.1', 0), StubHandler)
+    server.latency = args.latency
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+
+    settings.configure(COMMENTS_SERVICE_URL='http://127.0.0.1:{0}'.format(server.server_port),
+                       COMMENTS_SERVICE_KEY='benchmark')
+    import requests
+    import comment_client as cc
+
+    url = cc.settings.PREFIX + '/threads/1'
+
+    def unpooled():
+        requests.request('get', url, params={'api_key': 'benchmark'}, timeout=5, config={'keep_alive': False})
+
+    def pooled():
+        cc.utils.perform_request('get', url)
+
+    def sequential_pair():
+        cc.utils.perform_request('get', url)
+        cc.utils.perform_request('get', url)
+
+    def concurrent_pair():
+        result = cc.utils.call_in_background(cc.utils.perform_request, 'get', url)
+        cc.utils.perform_request('get', url)
+        result.get()
+
+    # open the pooled connections before timing
+    pooled()
+    concurrent_pair()
+
+    print "{0} requests, {1:.1f}ms server latency".format(args.requests, args.latency * 1000)
+    print "  new connection per request: {0:7.2f}ms per request".format(timed(unpooled, args.requests))
+    print "  pooled session:             {0:7.2f}ms per request".format(timed(pooled, args.requests))
+    print "  two requests, in sequence:  {0:7.2f}ms per pair".format(timed(sequential_pair, args.requests // 2))
+    print "  two requests, concurrently: {0:7.2f}ms per pair".format(timed(concurrent_pair, args.requests // 2))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+Count the Mongo round trips (and time) taken to import the courses in
+common/test/data into a MongoModuleStore, one module at a time and in
+batches.
+
+    python scripts/benchmark_course_import.py [--courses toy simple full] [--batch-sizes 0 100]
+
+Needs a mongod on localhost, and is run from the repository root with
+xmodule installed.  Round trips are read from the server's opcounters, so
+don't run it against a server that is doing anything else.  Each import
+goes into a fresh, temporary database.
+"""
+
+import argparse
+import time
+from uuid import uuid4
+
+import pymongo
+
+from xmodule.modulestore.mongo import MongoModuleStore
+from xmodule.modulestore.xml_importer import import_from_xml
+
+DATA_DIR = 'common/test/data/'
+HOST = 'localhost'
+PORT = 27017
+
+
+def count_operations(connection):
+    """Returns the total number of operations the server has run"""
+    counters = connection.admin.command('serverStatus')['opcounters']
+    return sum(counters.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark course import")
+    parser.add_argument('--courses', nargs='+', default=['toy', 'simple', 'full'])
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=[0, 100],
+                        help="0 means one module at a time")
+    args = parser.parse_args()
+
+    connection = pymongo.connection.Connection(HOST, PORT)
+
+    print "{0:<10} {1:>10} {2:>10} {3:>12} {4:>10}".format('course', 'batch', 'modules', 'round trips', 'seconds')
+    for course in args.courses:
+        for batch_size in args.batch_sizes:
+            db = 'benchmark_import_{0}'.format(uuid4().hex)
+            store = MongoModuleStore(HOST, db, 'modulestore', DATA_DIR, lambda *args, **kwargs: '',
+                                     default_class='xmodule.raw_module.RawDescriptor')
+            try:
+                before = count_operations(connection)
+                start = time.time()
+                import_from_xml(store, DATA_DIR, [course], batch_size=batch_size)
+                elapsed = time.time() - start
+                # don't count the serverStatus command itself
+                round_trips = count_operations(connection) - before - 1
+                num_modules = store.collection.count()
+            finally:
+                connection.drop_database(db)
+
+            print "{0:<10} {1:>10} {2:>10} {3:>12} {4:>10.2f}".format(
+                course, batch_size, num_modules, round_trips, elapsed)
+
+
+if __name__ == '__main__':
+    main()
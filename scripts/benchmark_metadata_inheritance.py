@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+"""
+Compare the cost of recomputing the whole metadata inheritance tree of a
+course with patching it after a single module has been written, for
+synthetic courses of increasing size.
+
+    python scripts/benchmark_metadata_inheritance.py --sizes 10 50 250
+
+Each size is the number of chapters, with 10 sequentials per chapter and
+5 verticals of 4 problems per sequential.  Run from common/lib/xmodule or
+with xmodule installed.
+"""
+
+import argparse
+import timeit
+
+from xmodule.modulestore.course_structure import CourseStructure
+
+
+def synthetic_course(num_chapters, sequentials=10, verticals=5, problems=4):
+    """Return the blocks of a course with the given shape"""
+    blocks = []
+
+    def add(category, name, children, **metadata):
+        url = 'i4x://org/course/{0}/{1}'.format(category, name)
+        blocks.append({'location': url, 'revision': None, 'category': category,
+                       'children': children, 'metadata': metadata})
+        return url
+
+    chapters = []
+    for c in range(num_chapters):
+        seqs = []
+        for s in range(sequentials):
+            verts = []
+            for v in range(verticals):
+                name = '{0}_{1}_{2}'.format(c, s, v)
+                probs = [add('problem', '{0}_{1}'.format(name, p), []) for p in range(problems)]
+                verts.append(add('vertical', name, probs))
+            seqs.append(add('sequential', '{0}_{1}'.format(c, s), verts, graded=True, format='Homework'))
+        chapters.append(add('chapter', str(c), seqs))
+    add('course', 'run', chapters, start='2013-01-01')
+    return blocks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark metadata inheritance tree updates")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50, 250],
+                        help="Course sizes to try, in chapters")
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    print "{0:>10} {1:>10} {2:>14} {3:>14}".format('chapters', 'modules', 'full (ms)', 'patch (ms)')
+    for size in args.sizes:
+        structure = CourseStructure(synthetic_course(size))
+        tree = structure.inherited_metadata()
+        # a Studio save of a single sequential in the middle of the course
+        url = 'i4x://org/course/sequential/{0}_5'.format(size // 2)
+
+        full = timeit.timeit(structure.inherited_metadata, number=args.repeat) / args.repeat
+        patch = timeit.timeit(lambda: structure.update_inherited_metadata(tree, url),
+                              number=args.repeat) / args.repeat
+        print "{0:>10} {1:>10} {2:>14.3f} {3:>14.3f}".format(
+            size, len(structure.blocks), full * 1000, patch * 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+"""
+Time path_to_location through the path index against searching up through
+the parents of each location, on a generated deep course.
+
+    python scripts/benchmark_path_to_location.py [--depth 8] [--breadth 2] [--repeat 5] [--mongo]
+
+The course has `breadth` chapters, each with `breadth` sequentials, under
+which verticals are nested `depth` levels deep, `breadth` to a level, with
+an html module in every vertical.  It is written to a temporary directory and
+loaded into an XMLModuleStore, and with --mongo also imported into a
+temporary database on a mongod on localhost.  Run from the repository root
+with xmodule installed.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import timeit
+from uuid import uuid4
+
+from xmodule.modulestore.search import path_to_location, search_path_to_location
+from xmodule.modulestore.xml import XMLModuleStore
+
+ORG, COURSE, RUN = 'edX', 'deep', '2013_Spring'
+COURSE_ID = '/'.join([ORG, COURSE, RUN])
+
+
+def write_course(data_dir, depth, breadth):
+    """
+    Write the course to data_dir/deep, returning the urls of its leaves
+    """
+    leaves = []
+
+    def verticals(prefix, level):
+        if level == depth:
+            return ''
+        xml = []
+        for index in range(breadth):
+            name = '{0}_{1}'.format(prefix, index)
+            leaves.append('i4x://{0}/{1}/html/{2}'.format(ORG, COURSE, name))
+            xml.append('<vertical url_name="v{0}"><html url_name="{0}">{0}</html>{1}</vertical>'.format(
+                name, verticals(name, level + 1)))
+        return ''.join(xml)
+
+    chapters = []
+    for chapter in range(breadth):
+        sequentials = ''.join(
+            '<sequential url_name="s{0}_{1}">{2}</sequential>'.format(
+                chapter, sequential, verticals('{0}_{1}'.format(chapter, sequential), 0))
+            for sequential in range(breadth))
+        chapters.append('<chapter url_name="c{0}">{1}</chapter>'.format(chapter, sequentials))
+
+    course_dir = os.path.join(data_dir, COURSE)
+    os.makedirs(os.path.join(course_dir, 'course'))
+    with open(os.path.join(course_dir, 'course.xml'), 'w') as course_file:
+        course_file.write('<course org="{0}" course="{1}" url_name="{2}"/>'.format(ORG, COURSE, RUN))
+    with open(os.path.join(course_dir, 'course', RUN + '.xml'), 'w') as course_file:
+        course_file.write('<course>{0}</course>'.format(''.join(chapters)))
+    return leaves
+
+
+def time_lookups(store, leaves, repeat):
+    """
+    Returns the average times, in ms, of a search and an index lookup for a leaf
+    """
+    def search():
+        for leaf in leaves:
+            search_path_to_location(store, COURSE_ID, leaf)
+
+    def lookup():
+        for leaf in leaves:
+            path_to_location(store, COURSE_ID, leaf)
+
+    # build the index before timing lookups
+    store.get_path_index(COURSE_ID)
+    return [timeit.timeit(fn, number=repeat) / repeat / len(leaves) * 1000 for fn in (search, lookup)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark path_to_location")
+    parser.add_argument('--depth', type=int, default=8)
+    parser.add_argument('--breadth', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--mongo', action='store_true', help="Also time a MongoModuleStore")
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp()
+    try:
+        leaves = write_course(data_dir, args.depth, args.breadth)
+        # the deepest leaves are the expensive ones to search for
+        leaves = leaves[-args.breadth:]
+        stores = [('xml', XMLModuleStore(data_dir, course_dirs=[COURSE]))]
+
+        if args.mongo:
+            import pymongo
+            from xmodule.modulestore.mongo import MongoModuleStore
+            from xmodule.modulestore.xml_importer import import_from_xml
+
+            db = 'benchmark_path_{0}'.format(uuid4().hex)
+            mongo_store = MongoModuleStore('localhost', db, 'modulestore', data_dir, lambda *args, **kwargs: '',
+                                           default_class='xmodule.raw_module.RawDescriptor')
+            import_from_xml(mongo_store, data_dir, [COURSE])
+            stores.append(('mongo', mongo_store))
+
+        print "{0:<8} {1:>8} {2:>16} {3:>16}".format('store', 'depth', 'search (ms)', 'index (ms)')
+        for name, store in stores:
+            search, lookup = time_lookups(store, leaves, args.repeat)
+            print "{0:<8} {1:>8} {2:>16.3f} {3:>16.3f}".format(name, args.depth + 3, search, lookup)
+
+        if args.mongo:
+            pymongo.connection.Connection('localhost').drop_database(db)
+    finally:
+        shutil.rmtree(data_dir)
+
+
+if __name__ == '__main__':
+    main()
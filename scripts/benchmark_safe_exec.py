@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""
+Time capa's safe_exec through codejail directly and through the pool of
+warm sandbox workers.
+
+    python scripts/benchmark_safe_exec.py --python-bin ~/sandbox/bin/python [--user sandbox] [--repeat 20]
+
+Run with common/lib/capa on the python path (or capa installed), on a machine
+where the sandbox (the sandboxed python and its sudoers/AppArmor setup) is
+installed.
+"""
+
+import argparse
+import timeit
+
+from codejail import jail_code
+
+from capa.safe_exec import safe_exec
+from capa.safe_exec.pool import configure_pool, get_pool
+
+SNIPPETS = [
+    ('set a value', "a = 17"),
+    ('division', "a = 1/2"),
+    ('math', "a = int(math.pi)"),
+    ('numpy', "a = float(numpy.sum(numpy.arange(100)))"),
+    ('random', "rnums = [random.randint(0, 999) for _ in xrange(100)]"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark capa safe_exec")
+    parser.add_argument('--python-bin', required=True, help="The sandboxed python")
+    parser.add_argument('--user', default='sandbox', help="The user to run sandboxed code as")
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    jail_code.configure('python', args.python_bin, user=args.user)
+
+    print "{0:<20} {1:>12} {2:>12}".format('snippet', 'cold (ms)', 'pooled (ms)')
+    for name, code in SNIPPETS:
+        run = lambda: safe_exec(code, {}, random_seed=1)
+
+        configure_pool(size=0)
+        cold = timeit.timeit(run, number=args.repeat) / args.repeat
+
+        configure_pool(size=1, max_executions=args.repeat + 1)
+        # start the worker before timing
+        run()
+        pooled = timeit.timeit(run, number=args.repeat) / args.repeat
+        get_pool().stop()
+
+        print "{0:<20} {1:>12.3f} {2:>12.3f}".format(name, cold * 1000, pooled * 1000)
+
+    configure_pool(size=0)
+
+
+if __name__ == '__main__':
+    main()
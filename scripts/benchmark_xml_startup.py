@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+Time loading the courses in common/test/data into an XMLModuleStore, as the
+LMS does at startup, eagerly and lazily.
+
+    python scripts/benchmark_xml_startup.py [--repeat 3] [--courses toy full ...]
+
+For lazy stores, "modules" is the number loaded at startup; "resident" is
+the peak resident size of this process so far, in MB, so look at it for the
+first configuration run (e.g. --lazy-only).
+
+Run from the repository root with xmodule installed.  Without --courses, all
+the course dirs in the data directory are loaded.
+"""
+
+import argparse
+import resource
+import time
+
+from xmodule.modulestore.xml import XMLModuleStore
+
+DATA_DIR = 'common/test/data/'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark XMLModuleStore startup")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--courses', nargs='+', default=None)
+    parser.add_argument('--lazy-only', action='store_true', help="Only time lazy stores")
+    args = parser.parse_args()
+
+    modes = [True] if args.lazy_only else [False, True]
+
+    print "{0:>6} {1:>10} {2:>10} {3:>10} {4:>10}".format(
+        'lazy', 'courses', 'modules', 'seconds', 'resident')
+    for lazy in modes:
+        best = None
+        for _ in range(args.repeat):
+            start = time.time()
+            store = XMLModuleStore(DATA_DIR, course_dirs=args.courses, lazy=lazy)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        num_modules = sum(len(modules) for modules in store.modules.values())
+        resident = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+        print "{0:>6} {1:>10} {2:>10} {3:>10.2f} {4:>10.1f}".format(
+            lazy, len(store.courses), num_modules, best, resident)
+
+
+if __name__ == '__main__':
+    main()